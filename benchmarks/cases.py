@@ -0,0 +1,191 @@
+"""
+基准测试用例
+
+每个用例由 @benchmark(名称, 分组, 单位) 注册，被装饰的函数负责准备数据（不计时），
+返回一个无参数的run函数；run函数执行一次被测操作（计时），返回本次处理的数量（记录数、图片数、帧数等），
+用于计算吞吐量。
+"""
+import os
+from typing import Callable, List
+
+from benchmarks.fixtures import (FIXTURE_GAME_TYPE, FIXTURE_USERNAME, BenchmarkSkipped, build_image_record,
+                                 build_records, get_style_config, make_clip_config, make_jacket,
+                                 make_test_video, song_title, write_fake_metadata)
+
+
+class Benchmark:
+    def __init__(self, name: str, group: str, unit: str, setup: Callable):
+        self.name = name
+        self.group = group
+        self.unit = unit
+        self.setup = setup
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, group: str, unit: str):
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, group, unit, setup))
+        return setup
+    return decorator
+
+
+class BenchContext:
+    """基准测试参数，以及多个用例共用的数据（首次使用时生成）"""
+    def __init__(self, num_records: int = 50, num_images: int = 10, resolution=(1920, 1080),
+                 clip_duration: float = 3.0):
+        self.num_records = num_records
+        self.num_images = num_images
+        self.resolution = tuple(resolution)
+        self.clip_duration = clip_duration
+        self._db_handler = None
+        self._source_archive = None
+        self._clip_assets = None
+
+    def db_handler(self):
+        if self._db_handler is None:
+            from db_utils.DatabaseDataHandler import DatabaseDataHandler
+            self._db_handler = DatabaseDataHandler("bench.db")
+        return self._db_handler
+
+    def new_archive(self, records=None) -> str:
+        _, archive_name = self.db_handler().create_new_archive(
+            FIXTURE_USERNAME, game_type=FIXTURE_GAME_TYPE, initial_records=records)
+        return archive_name
+
+    def source_archive(self) -> str:
+        """包含num_records条记录的存档"""
+        if self._source_archive is None:
+            self._source_archive = self.new_archive(build_records(self.num_records))
+        return self._source_archive
+
+    def clip_assets(self):
+        """视频片段所需的测试视频、成绩图片和背景图片"""
+        if self._clip_assets is None:
+            try:
+                from utils.ImageUtils import generate_single_image
+                from utils.VideoUtils import save_jacket_background_image
+            except ImportError as e:
+                raise BenchmarkSkipped(f"缺少依赖: {e.name}")
+            os.makedirs("./clip_assets", exist_ok=True)
+            video_path = make_test_video("./clip_assets/testsrc.mp4", self.clip_duration + 1)
+            main_image = "./clip_assets/maimai_0_Best 1.png"
+            generate_single_image(FIXTURE_GAME_TYPE, get_style_config(), build_image_record(0), main_image, "Best 1")
+            bg_image = "./clip_assets/maimai_1_bg.png"
+            save_jacket_background_image(make_jacket(0), bg_image)
+            self._clip_assets = (video_path, main_image, bg_image)
+        return self._clip_assets
+
+
+@benchmark("metadata.query_songs_metadata", "metadata", "query")
+def bench_query_songs_metadata(ctx: BenchContext):
+    from utils.DataUtils import query_songs_metadata
+    write_fake_metadata(ctx.num_records)
+    queries = [(song_title(i), f"Bench Artist {i % 97}") for i in range(ctx.num_records)]
+
+    def run():
+        for title, artist in queries:
+            if query_songs_metadata(FIXTURE_GAME_TYPE, title, artist) is None:
+                raise ValueError(f"未找到乐曲: {title}")
+        return len(queries)
+    return run
+
+
+@benchmark("db.update_archive_records.insert", "db", "record")
+def bench_update_archive_records_insert(ctx: BenchContext):
+    records = build_records(ctx.num_records)
+
+    def run():
+        # 创建空存档只写入一行，耗时可忽略
+        archive_name = ctx.new_archive()
+        ctx.db_handler().update_archive_records(FIXTURE_USERNAME, records, archive_name)
+        return len(records)
+    return run
+
+
+@benchmark("db.update_archive_records.update", "db", "record")
+def bench_update_archive_records_update(ctx: BenchContext):
+    archive_name = ctx.new_archive(build_records(ctx.num_records))
+    seeds = iter(range(1, 1000))
+
+    def run():
+        records = build_records(ctx.num_records, seed=next(seeds))
+        ctx.db_handler().update_archive_records(FIXTURE_USERNAME, records, archive_name)
+        return len(records)
+    return run
+
+
+@benchmark("db.copy_archive", "db", "record")
+def bench_copy_archive(ctx: BenchContext):
+    source_archive = ctx.source_archive()
+
+    def run():
+        ctx.db_handler().copy_archive(FIXTURE_USERNAME, source_archive)
+        return ctx.num_records
+    return run
+
+
+@benchmark("db.get_records_with_extented_data", "db", "record")
+def bench_get_records_with_extented_data(ctx: BenchContext):
+    handler = ctx.db_handler()
+    archive_id = handler.load_save_archive(FIXTURE_USERNAME, ctx.source_archive())
+
+    def run():
+        return len(handler.db.get_records_with_extented_data(archive_id, retrieve_raw_data=True))
+    return run
+
+
+@benchmark("image.generate_single_image", "image", "image")
+def bench_generate_single_image(ctx: BenchContext):
+    try:
+        from utils.ImageUtils import generate_single_image
+    except ImportError as e:
+        raise BenchmarkSkipped(f"缺少依赖: {e.name}")
+    style_config = get_style_config()
+    records = [build_image_record(i) for i in range(ctx.num_images)]
+    os.makedirs("./images", exist_ok=True)
+
+    def run():
+        for index, record in enumerate(records):
+            title_text = f"Best {index + 1}"
+            generate_single_image(FIXTURE_GAME_TYPE, style_config, record,
+                                  f"./images/{FIXTURE_GAME_TYPE}_{index}_{title_text}.png", title_text)
+        return len(records)
+    return run
+
+
+@benchmark("video.create_video_segment.frames", "video", "frame")
+def bench_create_video_segment_frames(ctx: BenchContext):
+    video_path, main_image, bg_image = ctx.clip_assets()
+    from utils.VideoUtils import create_video_segment
+    style_config = get_style_config()
+    fps = 30
+
+    def run():
+        # create_video_segment会修改片段配置中的起止时间，每次使用新的配置
+        clip_config = make_clip_config(0, video_path, main_image, bg_image, ctx.clip_duration)
+        clip = create_video_segment(FIXTURE_GAME_TYPE, clip_config, style_config, ctx.resolution)
+        num_frames = int(ctx.clip_duration * fps)
+        for i in range(num_frames):
+            clip.get_frame(i / fps)
+        clip.close()
+        return num_frames
+    return run
+
+
+@benchmark("video.render_one_video_clip", "video", "frame")
+def bench_render_one_video_clip(ctx: BenchContext):
+    video_path, main_image, bg_image = ctx.clip_assets()
+    from utils.VideoUtils import render_one_video_clip
+    style_config = get_style_config()
+    os.makedirs("./videos", exist_ok=True)
+
+    def run():
+        clip_config = make_clip_config(0, video_path, main_image, bg_image, ctx.clip_duration)
+        result = render_one_video_clip(FIXTURE_GAME_TYPE, clip_config, style_config, "./videos",
+                                       ctx.resolution, "4000k", video_file_name="0_Best_1.mp4")
+        if result['status'] != "success":
+            raise RuntimeError(result['info'])
+        return int(ctx.clip_duration * 30)
+    return run
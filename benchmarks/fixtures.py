@@ -0,0 +1,192 @@
+"""
+基准测试使用的合成数据
+
+所有数据均在本地生成，不需要网络：
+- 乐曲元数据（dxdata.json格式）
+- N条成绩记录（DatabaseDataHandler.update_archive_records的输入格式）
+- 纯色占位曲绘、背景图片
+- 使用ffmpeg testsrc生成的测试图案谱面确认视频（带正弦波音轨）
+
+元数据、数据库等文件的路径均为相对路径（如./music_metadata），因此基准测试在临时工作目录中运行，
+工作目录中的static链接到项目的static文件夹，以复用视频模板素材。
+"""
+import json
+import os
+import shutil
+import subprocess
+from copy import deepcopy
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIXTURE_GAME_TYPE = "maimai"
+FIXTURE_USERNAME = "bench_user"
+# 元数据中的乐曲数量不少于该值，使查询耗时接近真实的元数据规模
+MIN_METADATA_SONGS = 1500
+LEVEL_LABELS = ["basic", "advanced", "expert", "master", "remaster"]
+FC_STATUS = ["", "fc", "fcp", "ap", "app"]
+FS_STATUS = ["", "fs", "fsd", "fsdp"]
+
+
+class BenchmarkSkipped(Exception):
+    """当前环境无法运行该基准测试（如缺少ffmpeg或moviepy）"""
+
+
+def get_ffmpeg_exe() -> str:
+    """优先使用PATH中的ffmpeg，否则使用moviepy自带的imageio-ffmpeg"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        return ffmpeg
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        raise BenchmarkSkipped("未找到ffmpeg")
+
+
+def song_title(index: int) -> str:
+    return f"Bench Song {index:05d}"
+
+
+def jacket_color(index: int) -> tuple:
+    return (37 * index % 256, 91 * index % 256, 53 * index % 256, 255)
+
+
+def prepare_workspace(workspace: str):
+    """创建工作目录并链接项目的static文件夹（不支持符号链接时复制）"""
+    os.makedirs(workspace, exist_ok=True)
+    static_link = os.path.join(workspace, "static")
+    if not os.path.exists(static_link):
+        try:
+            os.symlink(os.path.join(PROJECT_ROOT, "static"), static_link, target_is_directory=True)
+        except OSError:
+            shutil.copytree(os.path.join(PROJECT_ROOT, "static"), static_link)
+
+
+def write_fake_metadata(num_songs: int, metadata_dir: str = "./music_metadata/maimaidx") -> str:
+    """生成dxdata.json格式的乐曲元数据，返回文件路径"""
+    songs = []
+    for i in range(max(num_songs, MIN_METADATA_SONGS)):
+        songs.append({
+            "songId": song_title(i),
+            "title": song_title(i),
+            "artist": f"Bench Artist {i % 97}",
+            "imageName": f"bench_jacket_{i:05d}.png",
+            "sheets": [
+                {
+                    "type": "dx" if i % 2 else "std",
+                    "difficulty": label,
+                    "internalLevelValue": round(1.0 + level_index * 3 + (i % 10) / 10, 1),
+                    "noteCounts": {"total": 300 + 150 * level_index},
+                }
+                for level_index, label in enumerate(LEVEL_LABELS)
+            ],
+        })
+    os.makedirs(metadata_dir, exist_ok=True)
+    json_path = os.path.join(metadata_dir, "dxdata.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"songs": songs}, f, ensure_ascii=False)
+    return json_path
+
+
+def build_record(index: int, seed: int = 0) -> dict:
+    """生成update_archive_records格式的单条成绩记录，seed不同时成绩不同（用于测试更新已有记录）"""
+    level_index = 3 if index % 5 else 4
+    notes = 300 + 150 * level_index
+    return {
+        "chart_data": {
+            "game_type": FIXTURE_GAME_TYPE,
+            "song_id": song_title(index),
+            "chart_type": index % 2,
+            "level_index": level_index,
+            "difficulty": str(round(1.0 + level_index * 3 + (index % 10) / 10, 1)),
+            "song_name": song_title(index),
+            "artist": f"Bench Artist {index % 97}",
+            "max_dx_score": notes * 3,
+        },
+        "order_in_archive": index,
+        "achievement": round(100.5 - ((index + seed) % 400) / 100, 4),
+        "fc_status": FC_STATUS[(index + seed) % len(FC_STATUS)],
+        "fs_status": FS_STATUS[(index + seed) % len(FS_STATUS)],
+        "dx_score": notes * 3 - (index + seed) % 200,
+        "dx_rating": 300 - index,
+        "play_count": (index + seed) % 30,
+        "clip_title_name": f"Best_{index + 1}",
+        "raw_data": {"source": "benchmark", "index": index, "seed": seed},
+    }
+
+
+def build_records(num_records: int, seed: int = 0):
+    return [build_record(i, seed) for i in range(num_records)]
+
+
+def make_jacket(index: int):
+    """纯色占位曲绘（与下载的曲绘相同，为400x400的RGBA图片）"""
+    from PIL import Image
+    return Image.new("RGBA", (400, 400), jacket_color(index))
+
+
+def build_image_record(index: int) -> dict:
+    """生成generate_single_image所需的maimai成绩数据"""
+    record = build_record(index)
+    chart = record["chart_data"]
+    return {
+        "chart_id": index + 1,
+        "song_id": chart["song_id"],
+        "title": chart["song_name"],
+        "artist": chart["artist"],
+        "type": chart["chart_type"],
+        "level_index": chart["level_index"],
+        "ds": float(chart["difficulty"]),
+        "achievements": f"{record['achievement']:.4f}",
+        "fc": record["fc_status"],
+        "fs": record["fs_status"],
+        "dxScore": record["dx_score"],
+        "max_dx_score": chart["max_dx_score"],
+        "jacket": make_jacket(index),
+        "ra": record["dx_rating"],
+        "playCount": record["play_count"],
+        "clip_name": record["clip_title_name"],
+    }
+
+
+def get_style_config(game_type: str = FIXTURE_GAME_TYPE) -> dict:
+    """默认视频模板；评论字体未随项目分发时使用UI字体代替"""
+    from utils.themes import DEFAULT_STYLES
+    style_config = deepcopy(DEFAULT_STYLES[game_type][0])
+    asset_paths = style_config["asset_paths"]
+    if not os.path.exists(asset_paths["comment_font"]):
+        asset_paths["comment_font"] = asset_paths["ui_font"]
+    return style_config
+
+
+def make_test_video(output_path: str, duration: float, size=(1280, 720), fps: int = 30) -> str:
+    """使用ffmpeg testsrc生成测试图案视频（模拟谱面确认视频）"""
+    if os.path.exists(output_path):
+        return output_path
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cmd = [
+        get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size[0]}x{size[1]}:rate={fps}",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        output_path
+    ]
+    subprocess.run(cmd, check=True)
+    return output_path
+
+
+def make_clip_config(index: int, video_path: str, main_image: str, bg_image: str, duration: float) -> dict:
+    """生成create_video_segment使用的片段配置"""
+    return {
+        "clip_title_name": f"Best_{index + 1}",
+        "duration": duration,
+        "start": 0,
+        "end": duration,
+        "video": video_path,
+        "main_image": main_image,
+        "bg_image": bg_image,
+        "text": "基准测试用的评论文本，Benchmark comment text " * 2,
+        "auto_center_align": False,
+    }
@@ -0,0 +1,221 @@
+"""
+离线基准测试：成绩图片生成、视频片段合成与渲染、元数据查询、存档读写
+
+所有测试数据均在临时工作目录中合成（见benchmarks/fixtures.py），不访问网络、不需要GPU，
+不会修改项目中的数据库和元数据文件。结果可保存为JSON，用于比较不同提交之间的性能变化。
+
+用法:
+    python benchmarks/run_benchmarks.py run [--records 50] [--repeat 3] [--only db,image] [--output results.json]
+    python benchmarks/run_benchmarks.py run --baseline results_old.json
+    python benchmarks/run_benchmarks.py compare results_old.json results_new.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.cases import BENCHMARKS, BenchContext
+from benchmarks.fixtures import PROJECT_ROOT, BenchmarkSkipped, prepare_workspace
+from utils.profiling import span, start_recording, stop_recording, summarize
+
+# 与基准结果相比，中位耗时增加超过该比例时标记为性能下降
+REGRESSION_THRESHOLD = 0.10
+
+
+def _block_network():
+    """禁止访问网络，避免被测代码意外联网导致结果不稳定"""
+    original_connect = socket.socket.connect
+
+    def guarded_connect(self, address):
+        if self.family in (socket.AF_INET, socket.AF_INET6):
+            raise OSError(f"基准测试中不允许访问网络: {address}")
+        return original_connect(self, address)
+    socket.socket.connect = guarded_connect
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(bench, ctx: BenchContext, repeat: int, verbose: bool = False) -> Dict:
+    """执行单个用例：准备数据后重复执行repeat次，返回耗时统计"""
+    result = {"group": bench.group, "unit": bench.unit}
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    errors = contextlib.nullcontext() if verbose else contextlib.redirect_stderr(io.StringIO())
+    with output, errors:
+        try:
+            run = bench.setup(ctx)
+            wall_times, cpu_times, items = [], [], 0
+            recorder = None
+            for _ in range(repeat):
+                recorder = start_recording()
+                start_wall, start_cpu = time.perf_counter(), time.process_time()
+                try:
+                    with span(f"benchmark.{bench.name}"):
+                        items = run()
+                finally:
+                    stop_recording()
+                wall_times.append(time.perf_counter() - start_wall)
+                cpu_times.append(time.process_time() - start_cpu)
+        except BenchmarkSkipped as e:
+            return {**result, "status": "skipped", "info": str(e)}
+        except ImportError as e:
+            return {**result, "status": "skipped", "info": f"缺少依赖: {e.name}"}
+        except Exception as e:
+            return {**result, "status": "error", "info": f"{type(e).__name__}: {e}",
+                    "traceback": traceback.format_exc()}
+
+    median = statistics.median(wall_times)
+    benchmark_span = recorder.spans[-1]
+    return {
+        **result,
+        "status": "ok",
+        "items": items,
+        "wall_times": wall_times,
+        "median": median,
+        "min": min(wall_times),
+        "cpu_median": statistics.median(cpu_times),
+        "throughput": items / median if median > 0 else None,
+        "rss_delta_mb": benchmark_span["rss_delta_mb"],
+        "process_peak_rss_mb": benchmark_span["process_peak_rss_mb"],
+        # 最后一次执行中耗时最多的阶段（见utils/profiling.py）
+        "top_spans": [
+            {"name": s["name"], "count": s["count"], "wall_time": s["wall_time"]}
+            for s in summarize(recorder) if s["name"] != benchmark_span["name"]
+        ][:5],
+    }
+
+
+def run_all(ctx: BenchContext, repeat: int, only: Optional[List[str]] = None,
+            workspace: Optional[str] = None, verbose: bool = False) -> Dict:
+    selected = [b for b in BENCHMARKS if not only or b.group in only or b.name in only]
+    keep_workspace = workspace is not None
+    workspace = os.path.abspath(workspace or tempfile.mkdtemp(prefix="videob50_bench_"))
+    prepare_workspace(workspace)
+    _block_network()
+
+    report = {
+        "commit": get_git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"records": ctx.num_records, "images": ctx.num_images, "resolution": list(ctx.resolution),
+                   "clip_duration": ctx.clip_duration, "repeat": repeat},
+        "results": {},
+    }
+    current_dir = os.getcwd()
+    os.chdir(workspace)
+    try:
+        for bench in selected:
+            print(f"正在运行: {bench.name}", file=sys.stderr)
+            report["results"][bench.name] = run_benchmark(bench, ctx, repeat, verbose)
+    finally:
+        os.chdir(current_dir)
+        if not keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return report
+
+
+def print_report(report: Dict):
+    print(f"提交: {report['commit']}  Python {report['python']}  {report['platform']}")
+    print(f"参数: {report['params']}")
+    print(f"{'用例':<40} {'中位耗时(s)':>12} {'最短(s)':>10} {'吞吐量':>18} {'CPU(s)':>9}")
+    for name, result in report["results"].items():
+        if result["status"] != "ok":
+            print(f"{name:<40} {result['status']}: {result['info']}")
+            continue
+        throughput = f"{result['throughput']:.1f} {result['unit']}/s" if result["throughput"] else "-"
+        print(f"{name:<40} {result['median']:>12.4f} {result['min']:>10.4f} {throughput:>18} "
+              f"{result['cpu_median']:>9.3f}")
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """按中位耗时比较两次结果，打印对比表，返回性能下降的用例名称"""
+    print(f"基准: {baseline['commit']} ({baseline['created_at']})  当前: {current['commit']} ({current['created_at']})")
+    if baseline.get("params") != current.get("params"):
+        print(f"Warning: 两次运行的参数不同，结果可能不可比：{baseline.get('params')} / {current.get('params')}")
+    print(f"{'用例':<40} {'基准(s)':>10} {'当前(s)':>10} {'变化':>9}")
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or old["status"] != "ok" or result["status"] != "ok":
+            continue
+        change = result["median"] / old["median"] - 1
+        mark = ""
+        if change > threshold:
+            mark = "  ⚠ 变慢"
+            regressions.append(name)
+        elif change < -threshold:
+            mark = "  ✓ 变快"
+        print(f"{name:<40} {old['median']:>10.4f} {result['median']:>10.4f} {change:>+8.1%}{mark}")
+    return regressions
+
+
+def load_report(file_path: str) -> Dict:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="离线基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--records", type=int, default=50, help="合成存档的记录数量（默认50）")
+    run_parser.add_argument("--images", type=int, default=10, help="每次生成的成绩图片数量（默认10）")
+    run_parser.add_argument("--resolution", default="1920x1080", help="视频分辨率（默认1920x1080）")
+    run_parser.add_argument("--clip-duration", type=float, default=3.0, help="视频片段时长，秒（默认3）")
+    run_parser.add_argument("--repeat", type=int, default=3, help="每个用例的重复次数（默认3）")
+    run_parser.add_argument("--only", help="只运行指定分组或用例，逗号分隔，如 db,image")
+    run_parser.add_argument("--output", help="保存结果的JSON文件")
+    run_parser.add_argument("--baseline", help="与之前保存的结果比较")
+    run_parser.add_argument("--workspace", help="保留合成数据的工作目录（默认使用临时目录，结束后删除）")
+    run_parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    compare_parser = subparsers.add_parser("compare", help="比较两次保存的结果")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        compare_reports(load_report(args.baseline), load_report(args.current))
+        return 0
+
+    width, height = (int(x) for x in args.resolution.lower().split("x"))
+    ctx = BenchContext(num_records=args.records, num_images=args.images, resolution=(width, height),
+                       clip_duration=args.clip_duration)
+    only = [item.strip() for item in args.only.split(",")] if args.only else None
+    report = run_all(ctx, args.repeat, only, args.workspace, args.verbose)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+    if args.baseline:
+        print()
+        compare_reports(load_report(args.baseline), report)
+    return 1 if any(r["status"] == "error" for r in report["results"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
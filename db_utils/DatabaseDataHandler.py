@@ -1,19 +1,30 @@
 from typing import Dict, List, Optional, Tuple, Any, Union
 from unittest import case
 from db_utils.DatabaseManager import DatabaseManager
-from utils.DataUtils import get_jacket_image_from_url, query_songs_metadata, format_record_tag, get_valid_time_range
+from utils.DataUtils import get_jacket_image_from_url, prefetch_jacket_images, query_songs_metadata, format_record_tag, get_valid_time_range
+from utils.segment_fetch import get_segment_offset, SEGMENT_SIDECAR_SUFFIX
+from utils.profiling import timed
 from PIL import Image
 import os
 import json
 from datetime import datetime
 
-# 尝试导入 moviepy，如果失败则使用备用方法
-try:
-    from moviepy import VideoFileClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
-    VideoFileClip = None
+
+def _probe_video_duration(video_path: str) -> Optional[float]:
+    """
+    Return the duration of a video file, or None if moviepy is not available.
+    moviepy is imported on first use so that pages which never touch videos do not pay for it.
+    """
+    try:
+        from moviepy import VideoFileClip
+    except ImportError:
+        return None
+    video_clip = VideoFileClip(video_path)
+    try:
+        return video_clip.duration
+    finally:
+        video_clip.close()
+
 
 class DatabaseDataHandler:
     """
@@ -158,6 +169,51 @@ class DatabaseDataHandler:
             return self.load_chart_by_id(chart_id)
         return None
 
+    # --------------------------------------
+    # Shared video store handler
+    # --------------------------------------
+    def load_stored_video(self, source: str, source_video_id: str, p_index: int = 0) -> Optional[Dict]:
+        """
+        Get the stored video file for a source video, if it has been downloaded
+        and the file still exists on disk.
+        """
+        video_file = self.db.get_video_file(source, source_video_id, p_index)
+        if video_file and os.path.exists(video_file['file_path']):
+            return video_file
+        return None
+
+    def link_chart_to_stored_video(self, chart_id: int, source: str, source_video_id: str,
+                                   p_index: int, video_path: str) -> Optional[Dict]:
+        """Register a downloaded video in the shared store and link the chart to it."""
+        if not video_path or not os.path.exists(video_path):
+            return None
+        video_file_id = self.db.upsert_video_file(source, source_video_id, p_index,
+                                                  video_path, os.path.getsize(video_path))
+        self.db.link_chart_video_file(chart_id, video_file_id)
+        return self.load_chart_by_id(chart_id)
+
+    def collect_unreferenced_videos(self) -> List[str]:
+        """
+        Delete stored video files that are no longer used by any record of any user,
+        together with their trimmed copies in the trim cache.
+        Returns the list of deleted file paths.
+        """
+        from utils.video_trim_cache import remove_trimmed_videos
+        deleted = []
+        for video_file in self.db.get_video_file_reference_counts():
+            if video_file['ref_count'] > 0:
+                continue
+            file_path = video_file['file_path']
+            deleted.extend(remove_trimmed_videos(file_path))
+            sidecar = os.path.splitext(file_path)[0] + SEGMENT_SIDECAR_SUFFIX
+            for path in (file_path, sidecar):
+                if os.path.exists(path):
+                    os.remove(path)
+                    if path == file_path:
+                        deleted.append(path)
+            self.db.delete_video_file(video_file['id'])
+        return deleted
+
     # --------------------------------------
     # Record and archive update handler from json data
     # --------------------------------------
@@ -338,6 +394,7 @@ class DatabaseDataHandler:
         charts = self.db.get_charts_of_archive(archive_id)
         return charts
 
+    @timed()
     def load_archive_for_image_generation(self, archive_id: int) -> Tuple[str, List[Dict]]:
         """Load archive data formatted for image generation scripts."""
         # load game type
@@ -357,14 +414,14 @@ class DatabaseDataHandler:
         ret_records = []
         if game_type == 'maimai':
             # 需要从music metadata中获取max dx score以及封面图片
-            for record in records:
+            metadata_list = [query_songs_metadata(game_type, r['song_name'], r['artist']) for r in records]
+            # 并发下载所有封面图片(pillow Image对象)
+            jackets = prefetch_jacket_images([m.get('imageName', None) for m in metadata_list])
+            for record, metadata in zip(records, metadata_list):
                 title = record['song_name']
                 artist = record['artist']
-                # 获取歌曲元数据
-                metadata = query_songs_metadata(game_type, title, artist)
                 image_code = metadata.get('imageName', None)
-                # 下载封面图片(pillow Image对象) # TODO：优化下载等待速度和提前缓存机制
-                jacket_image = get_jacket_image_from_url(image_code)
+                jacket_image = jackets.get(image_code) or get_jacket_image_from_url(image_code)
                 reformat_data = {
                     'chart_id': record['chart_id'],
                     'song_id': record['song_id'],
@@ -545,14 +602,14 @@ class DatabaseDataHandler:
         ret_records = []
         if game_type == 'maimai':
             # 需要从music metadata中获取max dx score以及封面图片
-            for record in records:
+            metadata_list = [query_songs_metadata(game_type, r['song_name'], r['artist']) for r in records]
+            # 并发下载所有封面图片(pillow Image对象)
+            jackets = prefetch_jacket_images([m.get('imageName', None) for m in metadata_list])
+            for record, metadata in zip(records, metadata_list):
                 title = record['song_name']
                 artist = record['artist']
-                # 获取歌曲元数据
-                metadata = query_songs_metadata(game_type, title, artist)
                 image_code = metadata.get('imageName', None)
-                # 下载封面图片(pillow Image对象) # TODO：优化下载等待速度和提前缓存机制
-                jacket_image = get_jacket_image_from_url(image_code)
+                jacket_image = jackets.get(image_code) or get_jacket_image_from_url(image_code)
                 reformat_data = {
                     'chart_id': record['chart_id'],
                     'song_id': record['song_id'],
@@ -773,6 +830,23 @@ class DatabaseDataHandler:
             }
         )
 
+    def ensure_video_slice(self, archive_id: int, chart_id: int,
+                           default_duration: int = 10, default_start_interval=(15, 30)) -> Tuple[int, int]:
+        """
+        Return the video slice (start, end) of a record on the original video timeline.
+        If not configured yet, a default slice is generated and saved, so that segment-only
+        downloads and the video editing page agree on the same range.
+        """
+        config = self.db.get_configuration(archive_id, chart_id) or {}
+        s, e = config.get('video_slice_start'), config.get('video_slice_end')
+        start, end = get_valid_time_range(s, e, default_duration, default_start_interval)
+        if (start, end) != (s, e):
+            self.db.set_configuration(archive_id, chart_id, {
+                'video_slice_start': start,
+                'video_slice_end': end
+            })
+        return start, end
+
     def save_video_config(self, 
                           video_configs: List[Dict],
                           archive_id: int = None, 
@@ -789,11 +863,14 @@ class DatabaseDataHandler:
             chart_id = entry.get('chart_id', None)
             
             if chart_id:
+                # Slice times are stored on the original video timeline, convert back if the local file is a segment
+                offset = get_segment_offset(entry.get('video'))
+                start, end = entry.get('start'), entry.get('end')
                 config_data = {
                     'background_image_path': entry.get('bg_image'),
                     'achievement_image_path': entry.get('main_image'),
-                    'video_slice_start': entry.get('start'),
-                    'video_slice_end': entry.get('end'),
+                    'video_slice_start': start + offset if start is not None else None,
+                    'video_slice_end': end + offset if end is not None else None,
                     'comment_text': entry.get('text')
                 }
                 self.db.set_configuration(archive_id, chart_id, config_data)
@@ -820,13 +897,19 @@ class DatabaseDataHandler:
             video_url = video_metadata.get('url', None) if video_metadata else None
             video_id = video_metadata.get('id', None) if video_metadata else None
 
+            # Convert slice times to the timeline of the local file (non-zero offset for segment-only downloads)
+            offset = get_segment_offset(record.get('video_path'))
+            start, end = record.get('video_slice_start'), record.get('video_slice_end')
+            if offset and start is not None and end is not None:
+                start, end = max(0, start - offset), max(0, end - offset)
+
             entry = {
                 'game_type': record.get('game_type'),
                 'chart_id': record.get('chart_id', None),
                 'bg_image': record.get('background_image_path'),
                 'main_image': record.get('achievement_image_path'),
-                'start': record.get('video_slice_start'),
-                'end': record.get('video_slice_end'),
+                'start': start,
+                'end': end,
                 'text': record.get('comment_text'),
                 'video': record.get('video_path'),  # From charts table: c.video_path
                 'duration': duration,  # this duration refers to original video duration
@@ -842,6 +925,22 @@ class DatabaseDataHandler:
 
         return ret_configs
 
+    def ensure_default_video_configs(self, archive_id: int, default_duration: int = 10,
+                                     default_start_interval=(15, 30)) -> List[Dict]:
+        """
+        Load video configuration(main) of an archive, filling in a default slice and
+        an empty comment for records that are not configured yet (e.g. a new archive).
+        """
+        video_configs = self.load_video_configs(archive_id=archive_id)
+        for config in video_configs:
+            if not config.get('text'):
+                config['text'] = ""
+            config['start'], config['end'] = get_valid_time_range(config.get('start'), config.get('end'),
+                                                                  default_duration, default_start_interval)
+
+        self.save_video_config(video_configs=video_configs, archive_id=archive_id)
+        return video_configs
+
     def load_full_config_for_composite_video(self, 
                                              archive_id: int = None, 
                                              username: str = None, 
@@ -861,13 +960,18 @@ class DatabaseDataHandler:
             e = record.get('video_slice_end', 0)
             start, end = get_valid_time_range(s, e)
             
-            # 验证并调整时间范围，确保不超过视频实际长度
+            # 仅下载了片段的视频，需要将原视频时间轴上的时间换算为片段文件中的时间
             video_path = record.get('video_path')
-            if video_path and os.path.exists(video_path) and MOVIEPY_AVAILABLE:
+            offset = get_segment_offset(video_path)
+            if offset:
+                start, end = max(0, start - offset), max(0, end - offset)
+            
+            # 验证并调整时间范围，确保不超过视频实际长度
+            if video_path and os.path.exists(video_path):
                 try:
-                    video_clip = VideoFileClip(video_path)
-                    video_duration = video_clip.duration
-                    video_clip.close()
+                    video_duration = _probe_video_duration(video_path)
+                    if video_duration is None:
+                        raise RuntimeError("moviepy不可用")
                     
                     # 如果结束时间超出视频长度，自动调整
                     if end > video_duration:
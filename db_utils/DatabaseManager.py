@@ -6,6 +6,11 @@ from typing import Dict, List, Optional, Tuple, Any
 from contextlib import contextmanager
 import uuid
 
+try:
+    from utils.profiling import instrument_methods
+except ImportError:  # db_utils imported on its own (e.g. from inside db_utils/)
+    instrument_methods = None
+
 class DatabaseManager:
     """
     SQLite database manager for mai-gen-videob50 project.
@@ -90,10 +95,14 @@ class DatabaseManager:
             with open(migration_path, 'r', encoding='utf-8') as f:
                 migration_sql = f.read()
             
+            # Strip comment lines first, so statements preceded by comments are not skipped
+            migration_sql = '\n'.join(
+                line for line in migration_sql.splitlines() if not line.strip().startswith('--')
+            )
             # Execute the migration (split by semicolon to handle multiple statements)
             for statement in migration_sql.split(';'):
                 statement = statement.strip()
-                if statement and not statement.startswith('--'):  # Skip empty statements and comments
+                if statement:  # Skip empty statements
                     cursor.execute(statement)
             
             conn.commit()
@@ -120,7 +129,14 @@ class DatabaseManager:
             
             try:
                 with open(migration_path, 'r', encoding='utf-8') as f:
-                    header = f.readline()
+                    # The version may be on any line of the leading comment block
+                    header = ''
+                    for line in f:
+                        if not line.startswith('--'):
+                            break
+                        if 'Version:' in line:
+                            header = line
+                            break
                     if 'Version:' in header:
                         file_version = header.split('Version:')[1].strip().replace('--', '').strip()
                         
@@ -341,6 +357,344 @@ class DatabaseManager:
                 charts.append(row_dict)
             return charts
 
+    # Bulk internal level refresh methods
+    def get_charts_by_game_type(self, game_type: str) -> List[Dict]:
+        """Get the identifying fields and stored difficulty of every chart of a game type"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, song_id, song_name, chart_type, level_index, difficulty
+                FROM charts WHERE game_type = ?
+            ''', (game_type,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_records_of_charts(self, chart_ids: List[int]) -> List[Dict]:
+        """Get id, archive_id, chart_id and achievement of every record (in an existing archive) of the given charts"""
+        rows = []
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(chart_ids), 500):
+                chunk = chart_ids[i:i + 500]
+                cursor.execute(f'''
+                    SELECT r.id, r.archive_id, r.chart_id, r.achievement
+                    FROM records r
+                    JOIN archives a ON a.id = r.archive_id
+                    WHERE r.chart_id IN ({', '.join(['?'] * len(chunk))})
+                ''', chunk)
+                rows.extend(dict(row) for row in cursor.fetchall())
+        return rows
+
+    def apply_chart_level_updates(self, game_type: str, chart_levels: List[Tuple[str, int]],
+                                  record_ratings: List[Tuple[float, int]], archive_ids: List[int]):
+        """
+        Update chart difficulties, record ratings and the rating totals of 'best' archives in one transaction.
+
+        Args:
+            chart_levels: (difficulty, chart_id) pairs
+            record_ratings: (rating, record_id) pairs, written to dx_rating (maimai) or chuni_rating (chunithm)
+            archive_ids: archives whose total rating is recomputed as the sum of their record ratings.
+                Chunithm totals are only recomputed for archives whose stored total was the sum of the
+                record ratings (LXNS); Diving-Fish archives store the B30 average, which is left unchanged.
+        """
+        rating_field, total_field = ('dx_rating', 'rating_mai') if game_type == 'maimai' else ('chuni_rating', 'rating_chu')
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if game_type != 'maimai':
+                    archive_ids = self._archives_with_summed_total(cursor, archive_ids, rating_field, total_field)
+                cursor.executemany('UPDATE charts SET difficulty = ? WHERE id = ?', chart_levels)
+                cursor.executemany(f'UPDATE records SET {rating_field} = ? WHERE id = ?', record_ratings)
+                cursor.executemany(f'''
+                    UPDATE archives
+                    SET {total_field} = (SELECT COALESCE(SUM({rating_field}), 0) FROM records WHERE archive_id = archives.id)
+                    WHERE id = ? AND sub_type = 'best'
+                ''', [(archive_id,) for archive_id in archive_ids])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _archives_with_summed_total(cursor, archive_ids: List[int], rating_field: str, total_field: str,
+                                    tolerance: float = 0.01) -> List[int]:
+        """Filter the archives whose stored total equals the sum of their (not yet updated) record ratings"""
+        summed = []
+        for archive_id in archive_ids:
+            cursor.execute(f'''
+                SELECT a.{total_field} AS total,
+                       (SELECT COALESCE(SUM({rating_field}), 0) FROM records WHERE archive_id = a.id) AS record_sum
+                FROM archives a WHERE a.id = ?
+            ''', (archive_id,))
+            row = cursor.fetchone()
+            if row and row['total'] is not None and abs(row['total'] - row['record_sum']) <= tolerance:
+                summed.append(archive_id)
+        return summed
+
+    # Shared video store methods
+    def get_video_file(self, source: str, source_video_id: str, p_index: int = 0) -> Optional[Dict]:
+        """Get a stored video file by its source video id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM video_files
+                WHERE source = ? AND source_video_id = ? AND p_index = ?
+            ''', (source, source_video_id, p_index))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def upsert_video_file(self, source: str, source_video_id: str, p_index: int,
+                          file_path: str, file_size: Optional[int] = None) -> int:
+        """Register a stored video file, or update its path and size if it exists. Returns the video_file id."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO video_files (source, source_video_id, p_index, file_path, file_size)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source, source_video_id, p_index)
+                DO UPDATE SET file_path = excluded.file_path, file_size = excluded.file_size
+            ''', (source, source_video_id, p_index, file_path, file_size))
+            cursor.execute('''
+                SELECT id FROM video_files
+                WHERE source = ? AND source_video_id = ? AND p_index = ?
+            ''', (source, source_video_id, p_index))
+            video_file_id = cursor.fetchone()['id']
+            conn.commit()
+            return video_file_id
+
+    def link_chart_video_file(self, chart_id: int, video_file_id: int):
+        """Point a chart at a stored video file, replacing any previous link"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO chart_video_links (chart_id, video_file_id)
+                VALUES (?, ?)
+            ''', (chart_id, video_file_id))
+            cursor.execute('''
+                UPDATE charts SET video_path = (SELECT file_path FROM video_files WHERE id = ?)
+                WHERE id = ?
+            ''', (video_file_id, chart_id))
+            conn.commit()
+
+    def get_video_file_reference_counts(self) -> List[Dict]:
+        """
+        Get every stored video file with the number of records (across all users and archives)
+        that use it. Records whose archive or user no longer exists are not counted.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT
+                    vf.*,
+                    COUNT(u.id) AS ref_count
+                FROM
+                    video_files vf
+                LEFT JOIN
+                    chart_video_links l ON l.video_file_id = vf.id
+                LEFT JOIN
+                    records r ON r.chart_id = l.chart_id
+                LEFT JOIN
+                    archives a ON a.id = r.archive_id
+                LEFT JOIN
+                    users u ON u.id = a.user_id
+                GROUP BY
+                    vf.id
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+
+    def delete_video_file(self, video_file_id: int):
+        """Remove a stored video file entry, its chart links, and the video_path of linked charts"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE charts SET video_path = NULL
+                WHERE id IN (SELECT chart_id FROM chart_video_links WHERE video_file_id = ?)
+                AND video_path = (SELECT file_path FROM video_files WHERE id = ?)
+            ''', (video_file_id, video_file_id))
+            cursor.execute('DELETE FROM chart_video_links WHERE video_file_id = ?', (video_file_id,))
+            cursor.execute('DELETE FROM video_files WHERE id = ?', (video_file_id,))
+            conn.commit()
+
+    # Background job queue methods
+    def create_job(self, job_type: str, params: Dict, username: str = None, archive_id: int = None) -> int:
+        """Queue a background job. Returns the job id."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO jobs (job_type, username, archive_id, params)
+                VALUES (?, ?, ?, ?)
+            ''', (job_type, username, archive_id, json.dumps(params, ensure_ascii=False, default=str)))
+            conn.commit()
+            return cursor.lastrowid
+
+    @staticmethod
+    def _job_from_row(row) -> Dict:
+        job = dict(row)
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        """Get a job with its params and result decoded"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            return self._job_from_row(row) if row else None
+
+    def list_jobs(self, username: str = None, archive_id: int = None, statuses: List[str] = None,
+                  job_types: List[str] = None, limit: int = 50) -> List[Dict]:
+        """List jobs, newest first, optionally filtered by user, archive, status and type"""
+        query = 'SELECT * FROM jobs WHERE 1 = 1'
+        params = []
+        if username is not None:
+            query += ' AND username = ?'
+            params.append(username)
+        if archive_id is not None:
+            query += ' AND archive_id = ?'
+            params.append(archive_id)
+        if statuses:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        if job_types:
+            query += f" AND job_type IN ({', '.join('?' * len(job_types))})"
+            params.extend(job_types)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [self._job_from_row(row) for row in cursor.fetchall()]
+
+    def claim_next_job(self, worker_id: str, job_types: List[str] = None) -> Optional[Dict]:
+        """
+        Atomically take the oldest queued job and mark it as running for the given worker.
+        Returns None if no job is queued.
+        """
+        query = "SELECT id FROM jobs WHERE status = 'queued'"
+        params = []
+        if job_types:
+            query += f" AND job_type IN ({', '.join('?' * len(job_types))})"
+            params.extend(job_types)
+        query += ' ORDER BY id LIMIT 1'
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Take the write lock before reading so two workers cannot claim the same job
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+                if row is None:
+                    conn.rollback()
+                    return None
+                cursor.execute('''
+                    UPDATE jobs
+                    SET status = 'running', worker_id = ?, started_at = CURRENT_TIMESTAMP,
+                        heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (worker_id, row['id']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return self.get_job(row['id'])
+
+    def update_job_progress(self, job_id: int, progress: float = None, message: str = None):
+        """Update the progress and/or message of a running job, and refresh its heartbeat"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs
+                SET progress = COALESCE(?, progress), message = COALESCE(?, message),
+                    heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (progress, message, job_id))
+            conn.commit()
+
+    def finish_job(self, job_id: int, status: str, message: str = None, result: Any = None):
+        """Mark a job as 'succeeded', 'failed' or 'cancelled'"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs
+                SET status = ?, message = COALESCE(?, message), result = ?,
+                    progress = CASE WHEN ? = 'succeeded' THEN 1.0 ELSE progress END,
+                    finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, message, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                  status, job_id))
+            conn.commit()
+
+    def request_job_cancel(self, job_id: int) -> Optional[str]:
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs are flagged and
+        stopped by their worker. Returns the resulting status, or None if the job does not exist.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'queued'
+            ''', (job_id,))
+            cursor.execute('''
+                UPDATE jobs SET cancel_requested = 1
+                WHERE id = ? AND status = 'running'
+            ''', (job_id,))
+            conn.commit()
+            cursor.execute('SELECT status FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            return row['status'] if row else None
+
+    def is_job_cancel_requested(self, job_id: int) -> bool:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            return bool(row and row['cancel_requested'])
+
+    def update_worker_heartbeat(self, worker_id: str, pid: int):
+        """Register a worker process or refresh its heartbeat"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO job_workers (worker_id, pid, heartbeat_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(worker_id) DO UPDATE SET pid = excluded.pid, heartbeat_at = CURRENT_TIMESTAMP
+            ''', (worker_id, pid))
+            conn.commit()
+
+    def remove_worker(self, worker_id: str):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM job_workers WHERE worker_id = ?', (worker_id,))
+            conn.commit()
+
+    def get_live_workers(self, stale_seconds: int) -> List[Dict]:
+        """Get workers whose heartbeat is newer than stale_seconds"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM job_workers
+                WHERE heartbeat_at >= datetime('now', ?)
+            ''', (f'-{int(stale_seconds)} seconds',))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def fail_stale_jobs(self, stale_seconds: int) -> int:
+        """
+        Mark running jobs as failed if their heartbeat is older than stale_seconds
+        (their worker process has exited). Returns the number of jobs affected.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs
+                SET status = CASE WHEN cancel_requested = 1 THEN 'cancelled' ELSE 'failed' END,
+                    message = 'Worker process exited unexpectedly', finished_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND heartbeat_at < datetime('now', ?)
+            ''', (f'-{int(stale_seconds)} seconds',))
+            conn.commit()
+            return cursor.rowcount
+
     # Archive management methods
     def create_archive(self, user_id: int, archive_name: str, game_type: str, sub_type: str, 
                        rating_mai: Optional[int] = None, rating_chu: Optional[float] = None, game_version: str = 'latest') -> int:
@@ -870,4 +1224,9 @@ class DatabaseManager:
             
             summary.update(dict(cursor.fetchone()))
             
-            return summary
\ No newline at end of file
+            return summary
+
+
+if instrument_methods:
+    # Record per-method timings while a profile is being recorded (see utils/profiling.py)
+    instrument_methods(DatabaseManager, exclude=("get_connection",))
@@ -0,0 +1,25 @@
+-- Migration: Add shared chart video store
+-- Version: 1.2
+-- Description: Deduplicate downloaded chart videos by source video, link charts to stored files for reference counting
+
+-- Video files table: Shared store of downloaded videos, one file per source video (and page)
+CREATE TABLE IF NOT EXISTS video_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL, -- 'bilibili' or 'youtube'
+    source_video_id TEXT NOT NULL, -- bvid or youtube video id
+    p_index INTEGER NOT NULL DEFAULT 0, -- page index for multi-page bilibili videos
+    file_path TEXT NOT NULL,
+    file_size INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(source, source_video_id, p_index)
+);
+
+-- Chart video links: Which stored video file each chart uses
+CREATE TABLE IF NOT EXISTS chart_video_links (
+    chart_id INTEGER PRIMARY KEY,
+    video_file_id INTEGER NOT NULL,
+    FOREIGN KEY (chart_id) REFERENCES charts(id) ON DELETE CASCADE,
+    FOREIGN KEY (video_file_id) REFERENCES video_files(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_chart_video_links_file ON chart_video_links (video_file_id);
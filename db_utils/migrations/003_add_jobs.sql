@@ -0,0 +1,32 @@
+-- Migration: Add background job queue
+-- Version: 1.3
+-- Description: Persistent queue of render/search/download/image jobs run by background worker processes
+
+-- Jobs table: One row per submitted background job
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL, -- e.g. 'render_clips', 'render_full_video', 'search_videos'
+    username TEXT,
+    archive_id INTEGER,
+    params TEXT NOT NULL, -- JSON object passed to the job handler
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+    progress REAL NOT NULL DEFAULT 0, -- 0.0 ~ 1.0
+    message TEXT,
+    result TEXT, -- JSON result returned by the job handler
+    worker_id TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    heartbeat_at TIMESTAMP
+);
+
+-- Job workers table: Liveness of running worker processes
+CREATE TABLE IF NOT EXISTS job_workers (
+    worker_id TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (username);
@@ -116,6 +116,52 @@ CREATE TABLE IF NOT EXISTS assets (
     FOREIGN KEY (archive_id) REFERENCES archives(id) ON DELETE SET NULL
 );
 
+-- Video files table: Shared store of downloaded videos, one file per source video (and page)
+CREATE TABLE IF NOT EXISTS video_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL, -- 'bilibili' or 'youtube'
+    source_video_id TEXT NOT NULL, -- bvid or youtube video id
+    p_index INTEGER NOT NULL DEFAULT 0, -- page index for multi-page bilibili videos
+    file_path TEXT NOT NULL,
+    file_size INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(source, source_video_id, p_index)
+);
+
+-- Chart video links: Which stored video file each chart uses, used for reference counting
+CREATE TABLE IF NOT EXISTS chart_video_links (
+    chart_id INTEGER PRIMARY KEY,
+    video_file_id INTEGER NOT NULL,
+    FOREIGN KEY (chart_id) REFERENCES charts(id) ON DELETE CASCADE,
+    FOREIGN KEY (video_file_id) REFERENCES video_files(id) ON DELETE CASCADE
+);
+
+-- Jobs table: One row per submitted background job
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL, -- e.g. 'render_clips', 'render_full_video', 'search_videos'
+    username TEXT,
+    archive_id INTEGER,
+    params TEXT NOT NULL, -- JSON object passed to the job handler
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+    progress REAL NOT NULL DEFAULT 0, -- 0.0 ~ 1.0
+    message TEXT,
+    result TEXT, -- JSON result returned by the job handler
+    worker_id TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    heartbeat_at TIMESTAMP
+);
+
+-- Job workers table: Liveness of running worker processes
+CREATE TABLE IF NOT EXISTS job_workers (
+    worker_id TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Triggers to automatically update the 'updated_at' timestamp
 CREATE TRIGGER IF NOT EXISTS update_users_updated_at
 AFTER UPDATE ON users
@@ -170,4 +216,7 @@ CREATE INDEX IF NOT EXISTS idx_archives_user ON archives (user_id);
 CREATE INDEX IF NOT EXISTS idx_configs_archive_chart ON configurations (archive_id, chart_id);
 CREATE INDEX IF NOT EXISTS idx_charts_song ON charts (song_id);
 CREATE INDEX IF NOT EXISTS idx_assets_record ON assets (record_id);
-CREATE INDEX IF NOT EXISTS idx_assets_archive ON assets (archive_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_assets_archive ON assets (archive_id);
+CREATE INDEX IF NOT EXISTS idx_chart_video_links_file ON chart_video_links (video_file_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (username);
@@ -111,12 +111,109 @@ def test_migration_system():
         if os.path.exists(temp_db_path):
             os.unlink(temp_db_path)
 
+def test_video_store_reference_counting():
+    """Test that shared video files are counted once per record that uses them, across users"""
+    
+    # Create a temporary database file
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        temp_db_path = tmp_db.name
+    
+    try:
+        print("\nTesting shared video store...")
+        
+        db = DatabaseManager(temp_db_path)
+        db.check_and_apply_migrations()
+        
+        chart_id = db.get_or_create_chart({'game_type': 'maimai', 'song_id': '1', 'chart_type': 0, 'level_index': 3})
+        video_file_id = db.upsert_video_file('youtube', 'abcdefghijk', 0, '/videos/youtube-abcdefghijk-p0.mp4', 1024)
+        # Registering the same source video again must reuse the stored file
+        assert db.upsert_video_file('youtube', 'abcdefghijk', 0, '/videos/youtube-abcdefghijk-p0.mp4', 2048) == video_file_id
+        db.link_chart_video_file(chart_id, video_file_id)
+        assert db.get_chart(chart_id)['video_path'] == '/videos/youtube-abcdefghijk-p0.mp4'
+        
+        # Two users share the same chart video
+        for username in ('user_a', 'user_b'):
+            user_id = db.create_user(username)
+            archive_id = db.create_archive(user_id, f"{username}_archive", 'maimai', 'best')
+            db.add_record(archive_id, chart_id, {'order_in_archive': 0, 'achievement': 100.0})
+        
+        counts = {row['id']: row['ref_count'] for row in db.get_video_file_reference_counts()}
+        assert counts[video_file_id] == 2
+        
+        # Deleting one user must keep the video referenced by the other
+        db.delete_user('user_a')
+        counts = {row['id']: row['ref_count'] for row in db.get_video_file_reference_counts()}
+        assert counts[video_file_id] == 1
+        
+        db.delete_user('user_b')
+        counts = {row['id']: row['ref_count'] for row in db.get_video_file_reference_counts()}
+        assert counts[video_file_id] == 0
+        
+        db.delete_video_file(video_file_id)
+        assert db.get_video_file('youtube', 'abcdefghijk', 0) is None
+        assert db.get_chart(chart_id)['video_path'] is None
+        
+        print("✅ Shared video store tests passed!")
+        return True
+    
+    finally:
+        # Clean up temporary database
+        if os.path.exists(temp_db_path):
+            os.unlink(temp_db_path)
+
+def test_job_queue():
+    """Test that jobs are claimed in submission order and can be cancelled"""
+    
+    # Create a temporary database file
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        temp_db_path = tmp_db.name
+    
+    try:
+        print("\nTesting background job queue...")
+        
+        db = DatabaseManager(temp_db_path)
+        db.check_and_apply_migrations()
+        
+        first_id = db.create_job('render_clips', {'video_res': (1920, 1080)}, username='test_user', archive_id=1)
+        second_id = db.create_job('search_videos', {'skip_chart_ids': []}, username='test_user', archive_id=1)
+        
+        # Jobs of other types are not claimed by a worker restricted to one type
+        job = db.claim_next_job('worker-1', job_types=['search_videos'])
+        assert job['id'] == second_id and job['status'] == 'running'
+        job = db.claim_next_job('worker-1')
+        assert job['id'] == first_id and job['params'] == {'video_res': [1920, 1080]}
+        assert db.claim_next_job('worker-1') is None
+        
+        db.update_job_progress(first_id, 0.5, 'half way')
+        db.finish_job(first_id, 'succeeded', 'done', {'output_path': '/videos'})
+        job = db.get_job(first_id)
+        assert job['status'] == 'succeeded' and job['result'] == {'output_path': '/videos'}
+        
+        # Queued jobs are cancelled immediately, running jobs are flagged for the worker
+        queued_id = db.create_job('download_videos', {}, username='test_user', archive_id=1)
+        assert db.request_job_cancel(queued_id) == 'cancelled'
+        assert db.request_job_cancel(second_id) == 'running'
+        assert db.is_job_cancel_requested(second_id)
+        
+        jobs = db.list_jobs(username='test_user', statuses=['queued', 'running'])
+        assert [j['id'] for j in jobs] == [second_id]
+        
+        print("✅ Job queue tests passed!")
+        return True
+    
+    finally:
+        # Clean up temporary database
+        if os.path.exists(temp_db_path):
+            os.unlink(temp_db_path)
+
 if __name__ == "__main__":
     print("=== DatabaseManager Schema Loading Test ===")
     
     success = True
     success &= test_schema_initialization()
     success &= test_migration_system()
+    success &= test_video_store_reference_counting()
+    success &= test_job_queue()
     
     if success:
         print("\n🎉 All tests completed successfully!")
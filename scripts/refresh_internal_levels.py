@@ -0,0 +1,29 @@
+"""
+批量刷新定数脚本
+替换乐曲元数据文件（如新的dxdata.json）后，按最新元数据更新数据库中所有存档的谱面定数和rating
+"""
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils.DatabaseManager import DatabaseManager
+from utils.metadata_relevel import refresh_internal_levels
+
+if __name__ == "__main__":
+    # 用法: python refresh_internal_levels.py [maimai|chunithm] [数据库路径]
+    game_types = [sys.argv[1]] if len(sys.argv) > 1 else ["maimai", "chunithm"]
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "mai_gen_videob50.db"
+
+    print("=" * 60)
+    print("定数批量刷新工具")
+    print("=" * 60)
+
+    db = DatabaseManager(db_path)
+    for game_type in game_types:
+        try:
+            refresh_internal_levels(game_type, db=db)
+        except Exception as e:
+            print(f"✗ 刷新 {game_type} 定数失败: {e}")
+            sys.exit(1)
@@ -3,14 +3,13 @@ import traceback
 import os
 
 from datetime import datetime
-from utils.PageUtils import load_style_config, open_file_explorer, read_global_config, write_global_config, get_game_type_text
+from utils.PageUtils import (open_file_explorer, read_global_config, write_global_config, get_game_type_text,
+                             load_style_config, st_submit_job, st_job_panel)
 from utils.PathUtils import get_user_base_dir, get_user_media_dir
-from utils.VideoUtils import render_all_video_clips, combine_full_video_direct, combine_full_video_ffmpeg_concat_gl, render_complete_full_video
 from db_utils.DatabaseDataHandler import get_database_handler
 
 G_config = read_global_config()
 G_type = st.session_state.get('game_type', 'maimai')
-style_config = load_style_config(game_type=G_type)
 db_handler = get_database_handler()
 
 # =============================================================================
@@ -75,6 +74,7 @@ _video_res = G_config['VIDEO_RES']
 _video_bitrate = 5000 # TODO：存储到配置文件中
 _trans_enable = G_config['VIDEO_TRANS_ENABLE']
 _trans_time = G_config['VIDEO_TRANS_TIME']
+_incremental = G_config.get('VIDEO_INCREMENTAL', False)
 
 options = ["仅生成每个视频片段", "生成完整视频"]
 with st.container(border=True):
@@ -83,6 +83,8 @@ with st.container(border=True):
             index=_mode_index)
     
     force_render_clip = st.checkbox("生成视频片段时，强制覆盖已存在的视频文件", value=False)
+    incremental = st.checkbox("生成完整视频时，复用已生成的视频片段（只重新渲染修改过的片段和过渡部分）",
+                              value=_incremental, disabled=mode_str == options[0])
 
 trans_config_placeholder = st.empty()
 with trans_config_placeholder.container(border=True):
@@ -128,52 +130,59 @@ def save_video_render_config():
     G_config['VIDEO_BITRATE'] = v_bitrate
     G_config['VIDEO_TRANS_ENABLE'] = trans_enable
     G_config['VIDEO_TRANS_TIME'] = trans_time
+    G_config['VIDEO_INCREMENTAL'] = incremental
     write_global_config(G_config)
     st.toast("配置已保存！")
 
-if st.button("开始生成视频"):
+def submit_render_job(job_type, **extra_params):
+    """ 提交视频生成任务，视频在后台任务中生成，生成过程中可以跳转到其他页面或刷新本页面 """
     save_video_render_config()
-    video_res = (v_res_width, v_res_height)
+    params = {
+        "username": username,
+        "archive_name": archive_name,
+        "game_type": G_type,
+        "video_res": (v_res_width, v_res_height),
+        "video_bitrate": v_bitrate_kbps,
+        "trans_enable": trans_enable,
+        "trans_time": trans_time,
+        "force_render": force_render_clip,
+    }
+    params.update(extra_params)
+    st_submit_job(job_type, params, username=username, archive_id=archive_id)
 
-    placeholder = st.empty()
+if st.button("开始生成视频"):
     if v_mode_index == 0:
-        try:
-            with placeholder.container(border=True, height=560):
-                st.warning("生成过程中请不要手动跳转到其他页面，或刷新本页面，否则可能导致生成失败！")
-                with st.spinner("正在生成所有视频片段……"):
-                    render_all_video_clips(
-                        game_type=G_type,
-                        
-                    )
-                    st.info("已启动批量视频片段生成，请在控制台窗口查看进度……")
-            st.success("视频片段生成结束！点击下方按钮打开视频所在文件夹")
-        except Exception as e:
-            st.error(f"视频片段生成失败，错误详情: {traceback.print_exc()}")
-
+        submit_render_job("render_clips")
     else:
-        try:
-            with placeholder.container(border=True, height=560):
-                st.info("请注意，生成完整视频通常需要一定时间，您可以在控制台窗口中查看进度")
-                st.warning("生成过程中请不要手动跳转到其他页面，或刷新本页面，否则可能导致生成失败！")
-                with st.spinner("正在生成完整视频……"):
-                    output_info = render_complete_full_video(
-                        username=username,
-                        game_type=G_type,
-                        main_configs=main_configs,
-                        intro_configs=intro_configs,
-                        ending_configs=ending_configs,
-                        style_config=style_config,
-                        video_output_path=video_output_path,
-                        video_res=video_res,
-                        video_bitrate=v_bitrate_kbps,
-                        video_trans_enable=trans_enable,
-                        video_trans_time=trans_time,
-                        full_last_clip=False
-                    )
-                    st.write(f"【{output_info['info']}")
-            st.success("完整视频生成结束！点击下方按钮打开视频所在文件夹")
-        except Exception as e:
-            st.error(f"完整视频生成失败，错误详情: {traceback.print_exc()}")
+        st.info("请注意，生成完整视频通常需要一定时间，您可以在下方或控制台窗口中查看进度")
+        submit_render_job("render_full_video", full_last_clip=False, incremental=incremental)
+
+st_job_panel(["render_clips", "render_full_video"], username=username, archive_id=archive_id, key="composite")
+
+if st.button("预览时间线（不生成视频）"):
+    from utils.timeline_planner import plan_full_video
+    plan = plan_full_video(main_configs, intro_configs, ending_configs,
+                           style_config=load_style_config(game_type=G_type),
+                           resolution=(v_res_width, v_res_height),
+                           trans_enable=trans_enable, trans_time=trans_time,
+                           full_last_clip=False, video_output_path=video_output_path,
+                           force_render=force_render_clip)
+    if plan['status'] == "error":
+        st.error(plan['info'])
+    else:
+        st.success(plan['info'])
+    for error in plan['errors']:
+        st.error(error)
+    for warning in plan['warnings']:
+        st.warning(warning)
+    st.dataframe([{"片段": item['clip_title_name'], "开始(秒)": round(item['start'], 2),
+                   "结束(秒)": round(item['end'], 2), "时长(秒)": round(item['duration'], 2)}
+                  for item in plan['timeline']], use_container_width=True)
+    if v_mode_index == 0:
+        st.write(f"需要生成的视频片段（{len(plan['clips_to_render'])}个，"
+                 f"预计约 {plan['estimate']['clip_seconds'] / 60:.1f} 分钟）：")
+        for file_path in plan['clips_to_render']:
+            st.text(os.path.basename(file_path))
 
 abs_path = os.path.abspath(video_output_path)
 if st.button("打开视频输出文件夹"):
@@ -189,26 +198,7 @@ with st.container(border=True):
     st.write("【快速模式】先生成所有视频片段，再直接拼接为完整视频")
     st.info("本方案会降低视频生成过程中的内存占用，并减少生成时间，但视频片段之间将只有黑屏过渡。")
     if st.button("直接拼接方式生成完整视频"):
-        save_video_render_config()
-        video_res = (v_res_width, v_res_height)
-        with st.spinner("正在生成所有视频片段……"):
-            render_all_video_clips(
-                game_type=G_type,
-                style_config=style_config,
-                main_configs=main_configs,
-                video_output_path=video_output_path, 
-                video_res=video_res, 
-                video_bitrate=v_bitrate_kbps,
-                intro_configs=intro_configs,
-                ending_configs=ending_configs,
-                auto_add_transition=trans_enable, 
-                trans_time=trans_time,
-                force_render=force_render_clip
-            )
-            st.info("已启动批量视频片段生成，请在控制台窗口查看进度……")
-        with st.spinner("正在拼接视频……"):
-            combine_full_video_direct(video_output_path)
-        st.success("所有任务已退出，请从上方按钮打开文件夹查看视频生成结果")
+        submit_render_job("render_clips", combine="direct")
 
 with st.container(border=True):
     st.write("【更多过渡效果】使用ffmpeg concat生成视频，允许自定义片段过渡效果")
@@ -228,24 +218,4 @@ with st.container(border=True):
         st.write("片段过渡效果")
         trans_name = st.selectbox("选择过渡效果", options=["fade", "circleOpen", "crossWarp", "directionalWarp", "directionalWipe", "crossZoom", "dreamy", "squaresWire"], index=0)
         if st.button("使用ffmpeg concat生成视频"):
-            save_video_render_config()
-            video_res = (v_res_width, v_res_height)
-            with st.spinner("正在生成所有视频片段……"):
-                render_all_video_clips(
-                    game_type=G_type,
-                    style_config=style_config,
-                    main_configs=main_configs,
-                    video_output_path=video_output_path, 
-                    video_res=video_res, 
-                    video_bitrate=v_bitrate_kbps,
-                    intro_configs=intro_configs,
-                    ending_configs=ending_configs,
-                    auto_add_transition=trans_enable,
-                    trans_time=trans_time,
-                    force_render=force_render_clip
-                )
-                st.info("已启动批量视频片段生成，请在控制台窗口查看进度……")
-            with st.spinner("正在拼接视频……"):
-                combine_full_video_ffmpeg_concat_gl(video_output_path, trans_name, trans_time)
-                st.info("已启动视频拼接任务，请在控制台窗口查看进度……")
-            st.success("所有任务已退出，请从上方按钮打开文件夹查看视频生成结果")
+            submit_render_job("render_clips", combine="ffmpeg_concat", trans_name=trans_name)
@@ -1,13 +1,12 @@
 from copy import deepcopy
-import time
-import random
 import traceback
 import os
 import streamlit as st
 from typing import Dict, List, Optional
 from datetime import datetime
-from utils.PageUtils import escape_markdown_text, read_global_config, get_game_type_text
-from utils.WebAgentUtils import download_one_video, get_keyword
+from utils.PageUtils import escape_markdown_text, read_global_config, get_game_type_text, st_submit_job, st_job_panel
+from utils.WebAgentUtils import get_keyword
+from utils.job_queue import list_jobs
 from utils.DataUtils import get_record_tags_from_data_dict, level_index_to_label
 from db_utils.DatabaseDataHandler import get_database_handler
 
@@ -40,39 +39,6 @@ def convert_to_compatible_types(data):
         return {k: str(v) if isinstance(v, (int, float)) else v for k, v in data.items()}
     return data
 
-def st_download_video(placeholder, dl_instance, G_config, charts_data):
-    search_wait_time = G_config['SEARCH_WAIT_TIME']
-    download_high_res = G_config['DOWNLOAD_HIGH_RES']
-    video_download_path = f"./videos/downloads"
-    with placeholder.container(border=True, height=560):
-        with st.spinner("正在下载视频……"):
-            progress_bar = st.progress(0)
-            write_container = st.container(border=True, height=400)
-            i = 0
-            record_len = len(charts_data)
-            for song in charts_data:
-                c_id = song['chart_id']
-                i += 1
-                if 'video_info_match' not in song or not song['video_info_match']:
-                    write_container.write(f"跳过({i}/{record_len}): {song['song_id']} ，因为没有视频信息而无法下载，请检查是否至少确定了一条视频信息")
-                    continue
-                else:
-                    # 自动进行一次数据库保存
-                    db_handler.update_chart_video_metadata(c_id, song['video_info_match'])
-                
-                video_info = song['video_info_match']
-                title = escape_markdown_text(video_info['title'])
-                progress_bar.progress(i / record_len, text=f"正在下载视频({i}/{record_len}): {title}")
-                
-                result = download_one_video(dl_instance, db_handler, song, video_download_path, download_high_res)
-                write_container.write(f"【{i}/{record_len}】{result['info']}")
-
-                # 等待几秒，以减少被检测为bot的风险
-                if search_wait_time[0] > 0 and search_wait_time[1] > search_wait_time[0] and result['status'] == 'success':
-                    time.sleep(random.randint(search_wait_time[0], search_wait_time[1]))
-
-            st.success("下载完成！请点击下一步按钮核对视频素材的详细信息。")
-
 # streamlit component functions
 @st.dialog("分p视频指定", width="large")
 def change_video_page(cur_chart_data, cur_p_index):
@@ -470,16 +436,16 @@ with col2:
         else:
             st.toast("已经是最后一个记录！")
 
-download_info_placeholder = st.empty()
-st.session_state.download_completed = False
 if st.button("确认当前配置，开始下载视频", disabled=not dl_instance):
-    try:
-        st_download_video(download_info_placeholder, dl_instance, G_config, to_edit_chart_data)
-        st.session_state.download_completed = True  # Reset error flag if successful
-    except Exception as e:
-        st.session_state.download_completed = False
-        st.error(f"下载过程中出现错误: {e}, 请尝试重新下载")
-        st.error(f"详细错误信息: {traceback.format_exc()}")
+    # 下载在后台任务中进行，使用上一页保存的下载器配置
+    st_submit_job("download_videos", {"charts_data": to_edit_chart_data},
+                  username=username, archive_id=archive_id)
+
+st_job_panel(["download_videos"], username=username, archive_id=archive_id, key="download")
+latest_download_jobs = list_jobs(username=username, archive_id=archive_id, job_types=["download_videos"], limit=1)
+st.session_state.download_completed = bool(latest_download_jobs) and latest_download_jobs[0]['status'] == "succeeded"
+if st.session_state.download_completed:
+    st.success("下载完成！请点击下一步按钮核对视频素材的详细信息。")
 
 if st.button("进行下一步", disabled=not st.session_state.download_completed):
     st.switch_page("st_pages/Edit_Video_Content.py")
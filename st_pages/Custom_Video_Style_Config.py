@@ -7,7 +7,6 @@ from datetime import datetime
 from utils.themes import DEFAULT_STYLES
 from utils.PageUtils import read_global_config, get_game_type_text, DEFAULT_STYLE_CONFIG_FILE_PATH
 from utils.ImageUtils import generate_single_image
-from utils.VideoUtils import get_video_preview_frame
 
 DEFAULT_STYLE_KEY = "Prism"
 video_style_config_path = DEFAULT_STYLE_CONFIG_FILE_PATH
@@ -117,6 +116,7 @@ def reset_custom_style_dialog():
 
 
 def update_preview_images(style_config, placeholder, test_string):
+    from utils.VideoUtils import get_video_preview_frame  # moviepy仅在生成预览时导入
 
     record_templates = {
         "maimai":{
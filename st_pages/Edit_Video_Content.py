@@ -2,10 +2,10 @@ import streamlit as st
 import os
 import traceback
 from datetime import datetime
-from utils.PageUtils import load_style_config, open_file_explorer, get_video_duration, read_global_config, get_game_type_text
+from utils.PageUtils import (load_style_config, open_file_explorer, get_video_duration, read_global_config, get_game_type_text,
+                             st_submit_job, st_job_panel)
 from utils.PathUtils import get_user_base_dir, get_user_media_dir
-from utils.DataUtils import get_valid_time_range
-from utils.VideoUtils import render_one_video_clip, get_video_preview_frame
+from utils.segment_fetch import get_segment_offset, segment_covers
 from db_utils.DatabaseDataHandler import get_database_handler
 
 DEFAULT_VIDEO_MAX_DURATION = 240
@@ -24,19 +24,19 @@ def get_output_video_name_with_timestamp(clip_id):
     return f"{clip_id}_{timestamp}.mp4"
 
 
-def try_update_default_configs(video_configs, archive_id=None):
-    for config in video_configs:
-        start = config.get('start', None)
-        end = config.get('end', None)
-        text = config.get('text', None)
-        if not text:
-            config['text'] = ""
-        s, e = get_valid_time_range(start, end, G_config['CLIP_PLAY_TIME'], G_config['CLIP_START_INTERVAL'])
-        config['start'] = s
-        config['end'] = e
+def submit_full_download(chart_id):
+    """在后台任务中重新完整下载谱面视频（替换仅包含片段的视频文件）"""
+    charts_data = []
+    for chart in db_handler.load_charts_of_archive_records(username, archive_name):
+        if chart['chart_id'] == chart_id and chart.get('video_metadata'):
+            charts_data.append({**chart, 'video_info_match': chart['video_metadata']})
+            break
+    if not charts_data:
+        st.error("未找到该谱面的视频信息，请回到视频信息检查页面重新下载。")
+        return
+    st_submit_job("download_videos", {"charts_data": charts_data, "full_download": True},
+                  username=username, archive_id=archive_id)
 
-    db_handler.save_video_config(video_configs=video_configs, archive_id=archive_id)
-    return video_configs
 
 # streamlit component functions
 def update_preview(preview_placeholder, config, current_index):
@@ -186,6 +186,15 @@ def update_preview(preview_placeholder, config, current_index):
             else:
                 video_duration = DEFAULT_VIDEO_MAX_DURATION
 
+        # 仅下载了片段的视频：起止时间为片段文件中的时间，上限为片段文件的实际时长
+        segment_offset = get_segment_offset(video_path)
+        if segment_offset and video_path and os.path.exists(video_path):
+            local_duration = get_video_duration(video_path)
+            if local_duration > 0:
+                video_duration = local_duration
+            st.info(f"本地视频仅包含原视频 {int(segment_offset // 60)}分{int(segment_offset % 60)}秒 起"
+                    f"约 {int(video_duration)} 秒的片段，以下时间为片段中的时间。")
+
         # 计算分/秒显示的起止时间
         show_start_minutes = int(start_time // 60)
         show_start_seconds = int(start_time % 60)
@@ -217,6 +226,13 @@ def update_preview(preview_placeholder, config, current_index):
             st.warning("结束时间必须大于开始时间")
             end_time = start_time + 5
 
+        # 截取区间超出已下载的片段时，提示重新完整下载
+        if segment_offset and (end_time > video_duration or
+                               not segment_covers(video_path, start_time + segment_offset, end_time + segment_offset)):
+            st.warning("截取区间超出了已下载的视频片段，需要下载完整视频后才能使用该区间。")
+            if st.button("下载完整视频", key=f"full_download_{chart_id}"):
+                submit_full_download(chart_id)
+
         # 确保结束时间不超过视频时长
         if end_time > video_duration:
             st.warning(f"结束时间不能超过视频时长: {int(video_duration // 60)}分{int(video_duration % 60)}秒")
@@ -301,8 +317,9 @@ else:
 
 # 读取存档的 video_config 查询（包含存储在chart表中的配置）
 try:
-    video_configs = db_handler.load_video_configs(archive_id=archive_id)
-    video_configs = try_update_default_configs(video_configs, archive_id=archive_id)  # 如果是新存档，将会生成默认配置
+    # 如果是新存档，将会生成默认配置
+    video_configs = db_handler.ensure_default_video_configs(archive_id, G_config['CLIP_PLAY_TIME'],
+                                                            G_config['CLIP_START_INTERVAL'])
 except Exception as e:
     st.error(f"读取存档配置失败: {e}")
     with st.expander("错误详情"):
@@ -326,6 +343,8 @@ if video_configs:
     # 片段预览和编辑组件，使用empty容器
     preview_placeholder = st.empty()
     update_preview(preview_placeholder, video_configs, st.session_state.current_index)
+    # 完整下载任务结束后重新运行页面，读取新的视频文件
+    st_job_panel(["download_videos"], username=username, archive_id=archive_id, key="full_download", limit=1)
 
     # 快速跳转组件的实现
     def on_jump_to_clip(target_index):
@@ -382,6 +401,7 @@ if video_configs:
         with col1:
             if st.button("生成当前片段的预览帧"):
                 with st.spinner(f"正在生成帧预览 ……"):
+                    from utils.VideoUtils import get_video_preview_frame  # moviepy仅在生成预览时导入
                     preview_frame = get_video_preview_frame(
                         game_type=target_config['game_type'],
                         clip_config=target_config,
@@ -393,23 +413,18 @@ if video_configs:
         with col2:
             if st.button("导出当前片段视频"):
                 db_handler.save_video_config(video_configs=video_configs, archive_id=archive_id)
-                with st.spinner(f"正在导出视频片段{target_video_filename} ……"):
-                    res = render_one_video_clip(
-                        game_type=target_config['game_type'],
-                        config=target_config,
-                        style_config=style_config,
-                        video_file_name=target_video_filename,
-                        video_output_path=video_output_path,
-                        video_res=v_res,
-                        video_bitrate=v_bitrate_kbps
-                    )
-                if res['status'] == 'success':
-                    st.success(res['info'])
-                else:
-                    st.error(res['info'])
+                st_submit_job("render_one_clip", {
+                    "game_type": target_config['game_type'],
+                    "config": target_config,
+                    "video_file_name": target_video_filename,
+                    "video_output_path": video_output_path,
+                    "video_res": v_res,
+                    "video_bitrate": v_bitrate_kbps
+                }, username=username, archive_id=archive_id)
             absolute_path = os.path.abspath(video_output_path)
             if st.button("打开导出视频所在文件夹"):
                 open_file_explorer(absolute_path)
+        st_job_panel(["render_one_clip"], username=username, archive_id=archive_id, key="export_clip", limit=3)
 
 with st.expander("额外设置"):
     st.write("DEBUG：如果需要检查原始配置，点击下方按钮读取数据库原始信息。")
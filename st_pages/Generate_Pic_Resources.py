@@ -1,82 +1,16 @@
 import streamlit as st
 import os
-import traceback
-from copy import deepcopy
 from datetime import datetime
-from utils.ImageUtils import generate_single_image, check_mask_waring
-from utils.PageUtils import get_game_type_text, load_style_config, open_file_explorer
+from utils.ImageUtils import check_mask_waring
+from utils.PageUtils import get_game_type_text, open_file_explorer, st_submit_job, st_job_panel
 from db_utils.DatabaseDataHandler import get_database_handler
 from utils.PathUtils import get_user_media_dir
-from utils.VideoUtils import save_jacket_background_image
 
 # Initialize database handler
 db_handler = get_database_handler()
 # Start with getting G_type from session state
 G_type = st.session_state.get('game_type', 'maimai')
 
-# Postprocessing function to generate B50 images
-
-def st_generate_b50_images(placeholder, user_id, archive_id, save_paths):
-    # get data format for image generation scripts
-    # TODO：maimai可能需要在此处下载曲绘资源，需要处理可能的等待时间
-    with st.spinner("正在获取资源数据，请稍等 ……"):
-        game_type, records = db_handler.load_archive_for_image_generation(archive_id)
-
-    # read style_config - 使用从数据库加载的game_type，而不是session_state的G_type
-    style_config = load_style_config(game_type=game_type)
-
-    # 根据游戏类型动态设置数据名称
-    data_name = "B30" if game_type == "chunithm" else "B50"
-    
-    with placeholder.container(border=True):
-        pb = st.progress(0, text=f"正在生成{data_name}成绩背景图片...")
-        for index, record_detail in enumerate(records):
-            chart_id = record_detail['chart_id']
-            pb.progress((index + 1) / len(records), text=f"正在生成{data_name}成绩背景图片({index + 1}/{len(records)})")
-            record_for_gene_image = deepcopy(record_detail)
-            clip_name = record_for_gene_image['clip_name']
-            # 标题名称与配置文件中的clip_name一致
-            if "_" in clip_name:
-                prefix = clip_name.split("_")[0]
-                suffix_number = clip_name.split("_")[1]
-                title_text = f"{prefix} {suffix_number}"
-            else:
-                title_text = record_for_gene_image['clip_name']
-            # 按照顺序命名生成图片为 gametype_0_标题.png, gametype_1_标题.png ...
-            image_save_path = os.path.join(save_paths['image_dir'], f"{game_type}_{index}_{title_text}.png")
-            generate_single_image(
-                game_type,
-                style_config,
-                record_for_gene_image,
-                image_save_path,
-                title_text
-            )
-            if game_type == "maimai":
-                # 生成曲绘图片的模糊背景
-                jacket_img_data = record_for_gene_image['jacket']  # type - PIL.Image
-                bg_save_path = os.path.join(save_paths['image_dir'], f"{game_type}_{chart_id}_bg.png")
-                # 如果已经存在背景图片（同一首曲目），则跳过生成
-                if not os.path.exists(bg_save_path):
-                    save_jacket_background_image(jacket_img_data, bg_save_path)
-                # 保存背景图片路径到background_image_path字段，便于视频生成调用
-                db_handler.update_image_config_for_record(
-                    archive_id,
-                    chart_id=chart_id,
-                    image_path_data={
-                        'achievement_image_path': image_save_path,
-                        'background_image_path': bg_save_path
-                    }
-                )
-            else:
-                db_handler.update_image_config_for_record(
-                    archive_id,
-                    chart_id=chart_id,
-                    image_path_data={
-                        'achievement_image_path': image_save_path
-                    }
-                )
-
-
 # =============================================================================
 # Page layout starts here
 # =============================================================================
@@ -190,21 +124,8 @@ if archive_id:
         col_gen1, col_gen2 = st.columns([2, 1])
         with col_gen1:
             if st.button("🎨 开始生成成绩背景图片", use_container_width=True, type="primary"):
-                generate_info_placeholder = st.empty()
-                try:
-                    if not os.path.exists(image_path):
-                        os.makedirs(image_path, exist_ok=True)
-                    st_generate_b50_images(
-                        generate_info_placeholder, 
-                        user_id=username, 
-                        archive_id=archive_id, 
-                        save_paths=current_paths
-                    )
-                    st.success("✅ 生成成绩背景图片完成！")
-                except Exception as e:
-                    st.error(f"❌ 生成成绩背景图片时发生错误: {e}")
-                    with st.expander("错误详情"):
-                        st.code(traceback.format_exc())
+                st_submit_job("generate_images", {"archive_id": archive_id, "image_dir": image_path},
+                              username=username, archive_id=archive_id)
         
         with col_gen2:
             if os.path.exists(image_path):
@@ -214,6 +135,8 @@ if archive_id:
             if st.button("📂 打开图片文件夹", key=f"open_folder_{username}", use_container_width=True):
                 open_file_explorer(absolute_path)
         
+        st_job_panel(["generate_images"], username=username, archive_id=archive_id, key="images")
+
         # 检查是否已有图片
         if os.path.exists(image_path):
             existing_images = [f for f in os.listdir(image_path) if f.endswith('.png')]
@@ -53,6 +53,16 @@ def should_update_metadata(threshold_hours=24):
     
     return False
 
+def show_metadata_update_results(results):
+    """展示各游戏乐曲元数据的条件更新结果"""
+    for result in results.values():
+        if result["status"] == "updated":
+            st.success(f"✅ {result['info']}")
+        elif result["status"] == "not_modified":
+            st.info(f"ℹ️ {result['info']}")
+        else:
+            st.warning(f"⚠️ {result['info']}")
+
 @st.dialog("刷新主题")
 def refresh_theme(theme_name=None):
     st.info("主题已更改，要刷新并应用主题吗？")
@@ -203,9 +213,9 @@ with st.container(border=True):
         needs_update = should_update_metadata(24) or not metadata_exists
         
         if needs_update:
-            with st.spinner("正在更新乐曲元数据..."):
-                update_music_metadata()
-            st.success("✅ 乐曲元数据已更新")
+            with st.spinner("正在检查乐曲元数据更新..."):
+                results = update_music_metadata((G_type,))
+            show_metadata_update_results(results)
         else:
             st.info("ℹ️ 最近已更新过乐曲元数据（24小时内），如有需要可以手动更新")
             col_meta1, col_meta2 = st.columns([3, 1])
@@ -213,10 +223,9 @@ with st.container(border=True):
                 st.caption("乐曲元数据用于识别和匹配歌曲信息，建议定期更新以获取最新曲目")
             with col_meta2:
                 if st.button("🔄 手动更新", key="manual_update_metadata"):
-                    with st.spinner("正在更新..."):
-                        update_music_metadata()
-                    st.success("✅ 乐曲元数据已更新")
-                    st.rerun()
+                    with st.spinner("正在检查更新..."):
+                        results = update_music_metadata((G_type,))
+                    show_metadata_update_results(results)
     except Exception as e:
         st.error(f"❌ 更新乐曲元数据时出错: {e}")
         with st.expander("错误详情"):
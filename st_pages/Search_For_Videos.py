@@ -1,14 +1,12 @@
 import os
-import time
 import shutil
-import random
 import traceback
 import streamlit as st
 from datetime import datetime
-from utils.PageUtils import read_global_config, write_global_config, get_game_type_text
+from utils.PageUtils import read_global_config, write_global_config, get_game_type_text, st_submit_job, st_job_panel
 from utils.PathUtils import get_data_paths, get_user_versions
 from utils.video_crawler import PurePytubefixDownloader, BilibiliDownloader
-from utils.WebAgentUtils import search_one_video
+from utils.job_queue import list_jobs
 from db_utils.DatabaseDataHandler import get_database_handler
 
 G_config = read_global_config()
@@ -190,6 +188,14 @@ with search_setting_container:
         value=_search_wait_time,
         help="每次搜索之间的等待时间，避免被识别为机器人"
     )
+    _search_concurrency = G_config.get('SEARCH_CONCURRENCY', 3)
+    search_concurrency = st.number_input(
+        "并发搜索数",
+        value=_search_concurrency,
+        min_value=1,
+        max_value=8,
+        help="同时进行搜索的谱面数量。总体请求频率仍受搜索间隔时间限制，并发只会减少等待网络响应的时间"
+    )
 
 download_setting_container = st.container(border=True)
 with download_setting_container:
@@ -200,6 +206,20 @@ with download_setting_container:
         value=_download_high_res,
         help="开启后将尽可能下载1080p视频，否则最高下载480p"
     )
+    _download_concurrency = G_config.get('DOWNLOAD_CONCURRENCY', 2)
+    download_concurrency = st.number_input(
+        "并发下载数",
+        value=_download_concurrency,
+        min_value=1,
+        max_value=4,
+        help="同时下载的谱面视频数量"
+    )
+    _download_segment_only = G_config.get('DOWNLOAD_SEGMENT_ONLY', False)
+    download_segment_only = st.checkbox(
+        "仅下载截取片段",
+        value=_download_segment_only,
+        help="只下载视频中将被截取使用的片段（前后额外保留几秒），大幅减少下载量。之后若在编辑页面需要更大的截取范围，重新下载时会自动改为完整下载"
+    )
 
 
 col_save1, col_save2 = st.columns([3, 1])
@@ -225,7 +245,10 @@ with col_save2:
                     }
         G_config['SEARCH_MAX_RESULTS'] = search_max_results
         G_config['SEARCH_WAIT_TIME'] = search_wait_time
+        G_config['SEARCH_CONCURRENCY'] = search_concurrency
         G_config['DOWNLOAD_HIGH_RES'] = download_high_res
+        G_config['DOWNLOAD_CONCURRENCY'] = download_concurrency
+        G_config['DOWNLOAD_SEGMENT_ONLY'] = download_segment_only
         write_global_config(G_config)
         st.success("✅ 配置已保存！")
         st.session_state.config_saved_step2 = True  # 添加状态标记
@@ -281,36 +304,19 @@ def st_init_downloader():
     
     return dl_instance
 
-def st_search_b50_videoes(dl_instance, placeholder, search_wait_time):
-    # read b50_data
-    chart_list = db_handler.load_charts_of_archive_records(username, archive_name)
-    record_len = len(chart_list)
-
-    with placeholder.container(border=True, height=560):
-        with st.spinner("正在搜索b50视频信息..."):
-            progress_bar = st.progress(0)
-            write_container = st.container(border=True, height=400)
-            i = 0
-            for chart in chart_list:
-                chart_id = chart['chart_id']
-                song_id = chart['song_id']
-                i += 1
-                progress_bar.progress(i / record_len, text=f"正在搜索({i}/{record_len}): {song_id}")
-                # 如果有，从session state中读取缓存搜索结果
-                if chart_id in st.session_state.search_results:
-                    write_container.write(f"跳过({i}/{record_len}): {song_id} ，已储存有相关视频信息")
-                    continue
-                
-                ret_data, ouput_info = search_one_video(dl_instance, chart)
-                write_container.write(f"【{i}/{record_len}】{ouput_info}")
-
-                # 搜索结果缓存在session state中
-                # TODO: 考虑是不再进行持久存储（切换存档时需要清除search_results缓存），还是将搜索结果存储到数据库中（新添字段）
-                st.session_state.search_results[chart_id] = ret_data
-                
-                # 等待几秒，以减少被检测为bot的风险
-                if search_wait_time[0] > 0 and search_wait_time[1] > search_wait_time[0]:
-                    time.sleep(random.randint(search_wait_time[0], search_wait_time[1]))
+def st_load_search_results():
+    """ 将该存档最近一次完成的搜索任务的结果读入session state """
+    jobs = list_jobs(username=username, archive_id=archive_id, job_types=["search_videos"], limit=1)
+    if not jobs:
+        return None
+    latest_job = jobs[0]
+    if latest_job['status'] == "succeeded" and latest_job['id'] != st.session_state.get('loaded_search_job_id'):
+        # JSON中的键为字符串，转换回chart_id
+        for chart_id, ret_data in (latest_job['result'] or {}).get('search_results', {}).items():
+            st.session_state.search_results[int(chart_id)] = ret_data
+        st.session_state.loaded_search_job_id = latest_job['id']
+        st.session_state.search_completed = True
+    return latest_job
 
 # 仅在配置已保存时显示搜索控件
 if st.session_state.get('config_saved_step2', False):
@@ -345,30 +351,43 @@ if st.session_state.get('config_saved_step2', False):
     with col_search2:
         if st.button("🚀 开始搜索", use_container_width=True, type="primary"):
             try:
+                # 在页面中初始化一次下载器（完成登录），搜索在后台任务中进行
                 dl_instance = st_init_downloader()
                 # 缓存downloader对象
                 st.session_state.downloader = dl_instance
-                st_search_b50_videoes(dl_instance, info_placeholder, search_wait_time)
-                st.session_state.search_completed = True  # Reset error flag if successful
-                st.success("✅ 搜索完成！请点击下一步按钮检查搜索到的视频信息，以及下载视频。")
-                # print(st.session_state.search_results)  # debug：打印搜索结果
-            except Exception as e:
+                st_submit_job("search_videos",
+                              {"username": username, "archive_name": archive_name,
+                               # 跳过已储存有相关视频信息的谱面
+                               "skip_chart_ids": list(st.session_state.search_results.keys())},
+                              username=username, archive_id=archive_id)
                 st.session_state.search_completed = False
-                error_msg = str(e)
-                if "400" in error_msg or "Bad Request" in error_msg:
-                    st.error(f"❌ 搜索过程中出现错误: HTTP Error 400: Bad Request,请尝试重新搜索")
-                    st.warning("""
-                    **可能的解决方案：**
-                    1. **更新 pytubefix 库**：在终端运行 `pip install --upgrade pytubefix`
-                    2. **配置认证**：在搜索配置中启用 OAuth 或 PO Token 认证
-                    3. **使用代理**：如果网络受限，尝试配置代理服务器
-                    4. **手动输入**：点击"跳过自动搜索"按钮，手动输入视频ID
-                    5. **检查网络**：确保可以正常访问 YouTube
-                    """)
-                else:
-                    st.error(f"❌ 搜索过程中出现错误: {error_msg}, 请尝试重新搜索")
+            except Exception as e:
+                st.error(f"❌ 初始化下载器时出现错误: {e}, 请检查配置后重试")
                 with st.expander("详细错误信息"):
                     st.code(traceback.format_exc())
+
+    st_job_panel(["search_videos"], username=username, archive_id=archive_id, key="search")
+    latest_search_job = st_load_search_results()
+    if latest_search_job and latest_search_job['status'] == "succeeded":
+        st.success("✅ 搜索完成！请点击下一步按钮检查搜索到的视频信息，以及下载视频。")
+    elif latest_search_job and latest_search_job['status'] == "failed":
+        error_msg = latest_search_job.get('message') or ""
+        if "400" in error_msg or "Bad Request" in error_msg:
+            st.error(f"❌ 搜索过程中出现错误: HTTP Error 400: Bad Request,请尝试重新搜索")
+            st.warning("""
+            **可能的解决方案：**
+            1. **更新 pytubefix 库**：在终端运行 `pip install --upgrade pytubefix`
+            2. **配置认证**：在搜索配置中启用 OAuth 或 PO Token 认证
+            3. **使用代理**：如果网络受限，尝试配置代理服务器
+            4. **手动输入**：点击"跳过自动搜索"按钮，手动输入视频ID
+            5. **检查网络**：确保可以正常访问 YouTube
+            """)
+        else:
+            st.error(f"❌ 搜索过程中出现错误: {error_msg}, 请尝试重新搜索")
+        traceback_text = (latest_search_job.get('result') or {}).get('traceback')
+        if traceback_text:
+            with st.expander("详细错误信息"):
+                st.code(traceback_text)
     
     st.divider()
     st.markdown("### ➡️ 下一步")
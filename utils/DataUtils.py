@@ -1,9 +1,10 @@
 from importlib import metadata
-from turtle import st
 from typing import List
 import json
 import os
 import requests
+from io import BytesIO
+from utils import http_client
 import base64
 import hashlib
 import struct
@@ -203,7 +204,7 @@ REVERSE_TYPE_MAP_MAIMAI = {
 @DeprecationWarning
 def download_metadata(data_type="maimaidx"):
     url = f"{BUCKET_ENDPOINT}/metadata_json/{data_type}/songs.json"
-    response = requests.get(url)
+    response = http_client.get(url)
     if response.status_code == 200:
         return response.json()
     else:
@@ -213,9 +214,9 @@ def download_metadata(data_type="maimaidx"):
 @DeprecationWarning
 def download_image_data(image_path):
     url = f"{BUCKET_ENDPOINT}/{image_path}"
-    response = requests.get(url, stream=True)
+    response = http_client.get(url)
     if response.status_code == 200:
-        img = Image.open(response.raw)
+        img = Image.open(BytesIO(response.content))
         return img
     else:
         print(f"Failed to download image from {url}. Status code: {response.status_code}")
@@ -247,9 +248,9 @@ def download_chunithm_jacket_from_lxns(song_id):
     url = f"{LXNS_CDN_ENDPOINT}/chunithm/jacket/{song_id}.png"
     
     try:
-        response = requests.get(url, stream=True, timeout=10)
+        response = http_client.get(url, timeout=10)
         if response.status_code == 200:
-            img = Image.open(response.raw)
+            img = Image.open(BytesIO(response.content))
             return img
         else:
             print(f"Failed to download chunithm jacket from {url}. Status code: {response.status_code}")
@@ -713,20 +714,45 @@ def fish_to_new_record_format(fish_record: dict, game_type: str = "maimai") -> d
 
     return record
 
-def get_jacket_image_from_url(image_code: str, source: str = "dxrating") -> Image.Image:
+def get_jacket_url(image_code: str, source: str = "dxrating") -> str:
     if source == "dxrating":
-        url = f"https://shama.dxrating.net/images/cover/v2/{image_code}.jpg"
+        return f"https://shama.dxrating.net/images/cover/v2/{image_code}.jpg"
     else:
         raise ValueError("Unsupported image source.")
 
-    response = requests.get(url, stream=True)
+def _open_jacket_image(content: bytes) -> Image.Image:
+    return Image.open(BytesIO(content)).convert("RGBA").resize((400, 400), Image.LANCZOS)
+
+def get_jacket_image_from_url(image_code: str, source: str = "dxrating") -> Image.Image:
+    url = get_jacket_url(image_code, source)
+    response = http_client.get(url)
     if response.status_code == 200:
-        img = Image.open(response.raw).convert("RGBA").resize((400, 400), Image.LANCZOS)
+        img = _open_jacket_image(response.content)
         return img
     else:
         print(f"Failed to download image from {url}. Status code: {response.status_code}")
         raise FileNotFoundError
 
+def prefetch_jacket_images(image_codes: List[str], source: str = "dxrating") -> Dict[str, Image.Image]:
+    """
+    并发下载一批曲绘
+
+    Returns:
+        dict: image_code -> 曲绘图片，下载失败的曲绘不包含在结果中（可再用get_jacket_image_from_url单独获取）
+    """
+    urls = {code: get_jacket_url(code, source) for code in image_codes if code}
+    contents = http_client.fetch_all(urls.values())
+    images = {}
+    for code, url in urls.items():
+        content = contents.get(url)
+        if content is None:
+            continue
+        try:
+            images[code] = _open_jacket_image(content)
+        except Exception as e:
+            print(f"Failed to decode image from {url}: {e}")
+    return images
+
 # def download_metadata_chunithm():
 #     url = f"https://www.diving-fish.com/api/chunithmprober/music_data"
 #     response = requests.get(url)
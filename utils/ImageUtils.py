@@ -4,6 +4,7 @@ import traceback
 
 from utils.DataUtils import download_image_data, CHART_TYPE_MAP_MAIMAI
 from utils.PageUtils import load_music_metadata
+from utils.profiling import timed
 from PIL import Image, ImageDraw, ImageFont
 
 # 重构note：成绩图生成模块不再主动获取外部资源（如下载封面、获取谱面详细信息等），而是依赖传入数据
@@ -616,6 +617,7 @@ class ChuniImageGenerater:
     
 
 # 入口：生成单个成绩图片    
+@timed()
 def generate_single_image(game_type, style_config, record_detail, output_path, title_text) -> Image.Image:
     # 查找对应游戏类型的style_config
     try:
@@ -2,12 +2,13 @@ import os
 import re
 import json
 import shutil
+from pathlib import Path
 from urllib.parse import urlparse
 import requests
+from utils import http_client
 import yaml
 import subprocess
 import platform
-from moviepy import VideoFileClip
 from utils.DataUtils import download_metadata, encode_song_id, CHART_TYPE_MAP_MAIMAI
 from db_utils.DatabaseManager import DatabaseManager
 import streamlit as st
@@ -113,6 +114,8 @@ def write_global_config(config):
     try:
         with open("global_config.yaml", "w", encoding='utf-8') as f:
             yaml.dump(config, f)
+        # 超时、重试和代理设置缓存在共享连接池中，配置变更后重新读取
+        http_client.close_all()
     except Exception as e:
         print(f"Error writing global config: {e}")
 
@@ -126,17 +129,15 @@ def load_style_config(game_type, config_file=DEFAULT_STYLE_CONFIG_FILE_PATH):
         return None
 
 
-def update_music_metadata():
-    # TODO: 替换为新的更新源
-    for game_type in ['maimaidx']:
-        metadata_dir = './music_metadata/maimaidx'
-        if not os.path.exists(metadata_dir):
-            os.makedirs(metadata_dir, exist_ok=True)
-        # json_path = os.path.join(metadata_dir, f"songs.json")
-        # latest = download_metadata(game_type)
-        # # 覆盖现有metadata信息
-        # with open(json_path, 'w', encoding='utf-8') as f:
-        #     json.dump(latest, f, ensure_ascii=False, indent=4)
+def update_music_metadata(game_types=("maimai", "chunithm"), force=False):
+    """
+    使用条件请求更新乐曲元数据，数据源未变化时不重新下载
+
+    Returns:
+        dict: {game_type: {"status": "updated"/"not_modified"/"error", "info", ...}}
+    """
+    from utils.metadata_updater import update_all_metadata
+    return update_all_metadata(game_types, force=force)
 
 
 def load_music_metadata(game_type="maimaidx"):
@@ -179,9 +180,64 @@ def get_db_manager() -> "DatabaseManager":
     return st.session_state['db_manager']
 
 
+def st_submit_job(job_type: str, params: dict, username: str = None, archive_id: int = None) -> int:
+    """提交后台任务，并确保有worker进程在运行；返回任务id"""
+    from utils.job_queue import submit_job, ensure_workers
+    job_id = submit_job(job_type, params, username=username, archive_id=archive_id)
+    ensure_workers(read_global_config().get('JOB_WORKERS', 1))
+    st.toast(f"已提交后台任务（#{job_id}），可在下方查看进度")
+    return job_id
+
+
+@st.fragment(run_every=2)
+def st_job_panel(job_types: list, username: str = None, archive_id: int = None, key: str = "jobs", limit: int = 5):
+    """
+    显示最近的后台任务及其进度，每2秒刷新一次
+
+    刷新或重新打开页面后按用户/存档重新找到任务；有任务结束时重新运行整个页面，以便页面读取任务结果
+    """
+    from utils.job_queue import (list_jobs, cancel_job, ensure_workers,
+                                 JOB_TYPE_TEXT, JOB_STATUS_TEXT, ACTIVE_JOB_STATUSES)
+    jobs = list_jobs(username=username, archive_id=archive_id, job_types=job_types, limit=limit)
+    active_ids = {job['id'] for job in jobs if job['status'] in ACTIVE_JOB_STATUSES}
+    state_key = f"active_job_ids_{key}"
+    finished_ids = st.session_state.get(state_key, set()) - active_ids
+    st.session_state[state_key] = active_ids
+    if finished_ids:
+        st.rerun()
+    if not jobs:
+        return
+    if any(job['status'] == "queued" for job in jobs):
+        # worker进程可能已退出（如重启电脑），重新启动
+        ensure_workers(read_global_config().get('JOB_WORKERS', 1))
+
+    with st.container(border=True):
+        st.markdown("##### 后台任务")
+        for job in jobs:
+            status_text = JOB_STATUS_TEXT.get(job['status'], job['status'])
+            title = f"#{job['id']} {JOB_TYPE_TEXT.get(job['job_type'], job['job_type'])}（{status_text}）"
+            col_info, col_action = st.columns([4, 1])
+            with col_info:
+                if job['status'] in ACTIVE_JOB_STATUSES:
+                    st.progress(min(max(job.get('progress') or 0.0, 0.0), 1.0),
+                                text=f"{title} {job.get('message') or ''}")
+                elif job['status'] == "succeeded":
+                    st.success(f"{title} {job.get('message') or ''}")
+                elif job['status'] == "failed":
+                    st.error(f"{title} {job.get('message') or ''}")
+                else:
+                    st.info(title)
+            with col_action:
+                if job['status'] in ACTIVE_JOB_STATUSES:
+                    if st.button("取消", key=f"{key}_cancel_job_{job['id']}"):
+                        cancel_job(job['id'])
+                        st.toast(f"已请求取消任务 #{job['id']}")
+
+
 def get_video_duration(video_path):
     """Returns the duration of a video file in seconds"""
     try:
+        from moviepy import VideoFileClip  # 首次使用时才导入，避免拖慢页面启动
         with VideoFileClip(video_path) as clip:
             return clip.duration
     except Exception as e:
@@ -246,13 +302,13 @@ def download_temp_image_to_static(image_url, local_dir="./static/thumbnails"):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(image_url, stream=True, headers=headers, timeout=10) # 设置超时
-        response.raise_for_status()  # 如果请求失败 (例如 404, 403)，则抛出HTTPError异常
+        with http_client.get(image_url, stream=True, headers=headers, timeout=10) as response: # 设置超时
+            response.raise_for_status()  # 如果请求失败 (例如 404, 403)，则抛出HTTPError异常
 
-        # 以二进制写模式打开本地文件，并将图片内容写入文件
-        with open(local_file_path, 'wb') as f:
-            # response.raw.decode_content = True # 确保内容被正确解码
-            shutil.copyfileobj(response.raw, f)
+            # 以二进制写模式打开本地文件，并将图片内容写入文件
+            with open(local_file_path, 'wb') as f:
+                # response.raw.decode_content = True # 确保内容被正确解码
+                shutil.copyfileobj(response.raw, f)
         return ret_file_path
 
     except requests.exceptions.RequestException as e:
@@ -270,6 +326,7 @@ def clear_all_user_data(username: str) -> dict:
     清空指定用户的所有个人数据，包括：
     - 数据库中的用户数据（用户、存档、记录、配置等）
     - 本地存档文件夹（b50_datas 和 chunithm_datas）
+    - 共享视频库中不再被任何存档引用的谱面视频
     - 配置文件中的敏感信息（API Key、Token等）
     - 用户配置目录
     
@@ -331,6 +388,13 @@ def clear_all_user_data(username: str) -> dict:
                 result['errors'].append(f"数据库中没有找到用户: {username}")
         else:
             result['errors'].append(f"数据库中没有找到用户: {username}")
+
+        # 删除共享视频库中不再被任何用户的存档引用的视频（仍被其他用户使用的视频会保留）
+        try:
+            from db_utils.DatabaseDataHandler import get_database_handler
+            result['deleted_files'].extend(get_database_handler().collect_unreferenced_videos())
+        except Exception as e:
+            result['errors'].append(f"清理未引用的谱面视频时出错: {e}")
         
         # 2. 删除本地存档文件夹
         data_dirs = [
@@ -1,6 +1,9 @@
 import os
 from datetime import datetime
 
+# 下载任务的临时目录名（位于视频下载目录下），其中均为未完成的中间文件
+DOWNLOAD_TEMP_DIRNAME = ".download_tmp"
+
 def get_data_dir_name(game_type="maimai"):
     """根据游戏类型返回数据目录名称"""
     if game_type == "chunithm":
@@ -29,6 +32,15 @@ def get_user_media_dir(username, game_type="maimai"):
         'output_video_dir': os.path.join(base_dir, "videos"),
     }
 
+def get_download_job_dir(output_path, job_name):
+    """
+    获取单个下载任务的临时目录（每个任务独立，下载失败时保留其中的中间文件以便续传）
+    临时目录与最终文件位于同一文件系统，合并完成后可通过os.replace原子地移动到目标位置
+    """
+    job_dir = os.path.join(output_path, DOWNLOAD_TEMP_DIRNAME, job_name)
+    os.makedirs(job_dir, exist_ok=True)
+    return job_dir
+
 # TODO: 重构，下方函数不再使用，替换为仅缓存媒体资源的上方函数
 
 @DeprecationWarning
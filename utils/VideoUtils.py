@@ -3,10 +3,14 @@ import numpy as np
 import subprocess
 import traceback
 from PIL import Image, ImageFilter
-from moviepy import VideoFileClip, ImageClip, TextClip, AudioFileClip, CompositeVideoClip, CompositeAudioClip, concatenate_videoclips
+from moviepy import VideoFileClip, ImageClip, TextClip, AudioFileClip, ColorClip, CompositeVideoClip, CompositeAudioClip, concatenate_videoclips
 from moviepy import vfx, afx
-from utils.VisionUtils import find_circle_center, draw_center_marker
 from utils.PageUtils import remove_invalid_chars
+from utils.profiling import span, timed
+from utils.video_writer import write_video_clip
+from utils.background_cache import get_background_video
+from utils.video_trim_cache import get_trimmed_video
+from utils.clip_manifest import ClipManifest, compute_clip_key, CHANGED, UNKNOWN, UP_TO_DATE
 from typing import Union, Tuple
 
 
@@ -132,6 +136,7 @@ def save_jacket_background_image(img_data: Image.Image, save_path: str):
 
 
 
+@timed()
 def normalize_audio_volume(clip, target_dbfs=-20):
     """均衡化音频响度到指定的分贝值"""
     if clip.audio is None:
@@ -175,6 +180,19 @@ def normalize_audio_volume(clip, target_dbfs=-20):
         return clip
 
 
+def load_background_video(video_path, duration, resolution, brightness=1.0) -> VideoFileClip:
+    """ 加载循环播放的背景视频，优先使用已缩放、已调整亮度的缓存（见utils/background_cache.py） """
+    cache_path = get_background_video(video_path, resolution, brightness)
+    if cache_path:
+        # 不加载音频以避免循环时的索引错误
+        return VideoFileClip(cache_path, audio=False).with_effects([vfx.Loop(duration=duration)])
+    bg_video = VideoFileClip(video_path, audio=False)
+    return bg_video.with_effects([vfx.Loop(duration=duration),
+                                  vfx.MultiplyColor(brightness),
+                                  vfx.Resize(width=resolution[0])])
+
+
+@timed()
 def create_info_segment(clip_config, style_config, resolution):
     """ 合成一个信息介绍的Moviepy Clip，用于开场或结尾 """
 
@@ -206,12 +224,7 @@ def create_info_segment(clip_config, style_config, resolution):
     bg_image = ImageClip(intro_text_bg_path).with_duration(clip_config['duration'])
     bg_image = bg_image.with_effects([vfx.Resize(width=resolution[0])])
 
-    bg_video = VideoFileClip(intro_video_bg_path)
-    # 移除音频以避免循环时的索引错误
-    bg_video = bg_video.without_audio()
-    bg_video = bg_video.with_effects([vfx.Loop(duration=clip_config['duration']), 
-                                      vfx.MultiplyColor(0.75),
-                                      vfx.Resize(width=resolution[0])])
+    bg_video = load_background_video(intro_video_bg_path, clip_config['duration'], resolution, brightness=0.75)
 
     # 创建文字
     text_list = get_splited_text(clip_config['text'], text_max_bytes=inline_max_len)
@@ -257,11 +270,14 @@ def create_info_segment(clip_config, style_config, resolution):
     return composite_clip.with_duration(clip_config['duration'])
 
 
+@timed()
 def edit_game_video_clip(game_type, clip_config, resolution, auto_center_align=False) -> Union[VideoFileClip, tuple]:
     if 'video' in clip_config and clip_config['video'] is not None and os.path.exists(clip_config['video']):
-        video_clip = VideoFileClip(clip_config['video'])
+        # 截取时间靠后时先用ffmpeg预裁剪，offset为裁剪文件的0时刻在原视频中的时间
+        video_path, offset = get_trimmed_video(clip_config['video'], clip_config['start'], clip_config['end'])
+        video_clip = VideoFileClip(video_path)
         # 添加调试信息
-        print(f"Start time: {clip_config['start']}, Clip duration: {video_clip.duration}, End time: {clip_config['end']}")
+        print(f"Start time: {clip_config['start']}, Clip duration: {offset + video_clip.duration}, End time: {clip_config['end']}")
         # 等比例缩放
         h_resize_ratio = 0.5 if game_type == "maimai" else 0.667  # 540/1080 for maimai, 720/1080 for chunithm
         video_clip = video_clip.with_effects([vfx.Resize(height=h_resize_ratio * resolution[1])])
@@ -270,8 +286,8 @@ def edit_game_video_clip(game_type, clip_config, resolution, auto_center_align=F
         video_height = video_clip.h
         video_width = video_clip.w
 
-        # 检查并自动调整 start_time 和 end_time，确保不超出视频长度
-        video_duration = video_clip.duration
+        # 检查并自动调整 start_time 和 end_time，确保不超出视频长度（按原视频的时间计算）
+        video_duration = offset + video_clip.duration
         
         # 调整开始时间
         if clip_config['start'] < 0:
@@ -293,12 +309,13 @@ def edit_game_video_clip(game_type, clip_config, resolution, auto_center_align=F
         clip_config['end'] = min(clip_config['end'], video_duration)
         
         # 裁剪目标视频片段
-        video_clip = video_clip.subclipped(start_time=clip_config['start'],
-                                            end_time=clip_config['end'])
+        video_clip = video_clip.subclipped(start_time=clip_config['start'] - offset,
+                                            end_time=clip_config['end'] - offset)
 
         if game_type == "maimai":
             visual_center = None
             if auto_center_align:
+                from utils.VisionUtils import find_circle_center  # OpenCV仅在自动居中时需要
                 # 从未剪裁的视频中提取中间一帧用于分析
                 analysis_frame = video_clip.get_frame(t=(video_clip.duration / 2))
                 # 检测传入谱面确认视频的视觉中心，此操作的目的是为了识别原始视频存在中心偏移的情况
@@ -444,6 +461,7 @@ def edit_game_text_clip(game_type, clip_config, resolution, style_config) -> Uni
     return txt_clip, text_pos
 
 
+@timed()
 def create_video_segment(
         game_type: str,
         clip_config: dict, 
@@ -457,12 +475,8 @@ def create_video_segment(
     override_content_bg = style_config['options'].get('override_content_default_bg', False)
     using_video_content_bg = style_config['options'].get('content_use_video_bg', False)
 
-    # black_video仅作为纯黑色背景，避免透明素材的遮挡问题
-    black_clip = VideoFileClip("./static/assets/bg_clips/black_bg.mp4")
-    # 移除音频以避免循环时的索引错误
-    black_clip = black_clip.without_audio()
-    black_clip = black_clip.with_effects([vfx.Loop(duration=clip_config['duration']), 
-                                      vfx.Resize(width=resolution[0])])
+    # 纯黑色背景，避免透明素材的遮挡问题
+    black_clip = ColorClip(size=resolution, color=(0, 0, 0), duration=clip_config['duration'])
     
     # 检查图片资源是否存在
     # 'main_image' == achievement_image
@@ -487,12 +501,8 @@ def create_video_segment(
     if using_video_content_bg:
         bg_video_path = style_config['asset_paths'].get('content_bg_video', None)
         if bg_video_path and os.path.exists(bg_video_path):
-            bg_clip = VideoFileClip(bg_video_path)
-            # 移除音频以避免循环时的索引错误
-            bg_clip = bg_clip.without_audio()
-            bg_clip = bg_clip.with_effects([vfx.Loop(duration=clip_config['duration']), 
-                                              vfx.Resize(width=resolution[0]),
-                                              vfx.MultiplyColor(0.8)])  # apply 80% brightness on bg video
+            # apply 80% brightness on bg video
+            bg_clip = load_background_video(bg_video_path, clip_config['duration'], resolution, brightness=0.8)
         else:
             print(f"Video Generator Warning: 无法加载背景视频，将使用背景图片代替")
             bg_clip = bg_image_clip
@@ -569,6 +579,7 @@ def add_clip_with_transition(clips, new_clip, set_start=False, trans_time=1):
     clips.append(new_clip)
 
 
+@timed()
 def create_full_video(game_type: str, style_config: dict, resolution: tuple,
                       main_configs: list, 
                       intro_configs: list = None, ending_configs: list = None,
@@ -759,23 +770,46 @@ def get_combined_ending_clip(ending_clips, combined_start_time, trans_time):
 def render_all_video_clips(game_type: str, style_config: dict, main_configs: list,
                            video_output_path: str, video_res: tuple, video_bitrate: str,
                            intro_configs: list = None, ending_configs: list = None,
-                           auto_add_transition=True, trans_time=1, force_render=False):
-    """ 渲染所有视频片段，并按照clip_title_name输出到指定路径文件 """
+                           auto_add_transition=True, trans_time=1, force_render=False,
+                           progress_callback=None, verify_existing=False):
+    """
+    渲染所有视频片段，并按照clip_title_name输出到指定路径文件
+    progress_callback(done, total, clip_title_name)在每个片段处理完成后调用
+
+    已存在的片段文件会按片段清单（见utils/clip_manifest.py）检查，配置或素材修改过的片段会重新渲染；
+    没有清单记录的旧片段默认跳过，verify_existing为True时也重新渲染。
+
+    Returns:
+        list: 按顺序排列的片段，[{"output_file", "rendered"}]
+    """
     vfile_prefix = 0
+    total = len(intro_configs or []) + len(main_configs) + len(ending_configs or [])
+    manifest = ClipManifest(video_output_path)
+    fps = 30
+    results = []
 
-    def modify_and_rend_clip(clip, config, prefix, auto_add_transition, trans_time):
+    def report(config):
+        if progress_callback:
+            progress_callback(vfile_prefix + 1, total, config['clip_title_name'])
+
+    def modify_and_rend_clip(make_clip, config, prefix, auto_add_transition, trans_time):
         clip_title_name = remove_invalid_chars(config['clip_title_name'])  # clip_title_name作为输出文件名的一部分，需要进行清洗，去除不合法字符
         output_file = os.path.join(video_output_path, f"{prefix}_{clip_title_name}.mp4")
+        clip_key = compute_clip_key(config, style_config, video_res, video_bitrate, auto_add_transition, trans_time)
 
-        # 检查文件是否已经存在
-        if os.path.exists(output_file) and not force_render:
+        # 检查文件是否已经存在，且与当前配置一致
+        state = manifest.check(output_file, clip_key)
+        if not force_render and (state == UP_TO_DATE or (state == UNKNOWN and not verify_existing)):
             print(f"视频文件{output_file}已存在，跳过渲染。如果需要强制覆盖已存在的文件，请设置勾选force_render")
-            clip.close()
-            del clip
+            results.append({"output_file": output_file, "rendered": False})
             return
-        
-        clip = normalize_audio_volume(clip)
+        if state in (CHANGED, UNKNOWN) and not force_render:
+            print(f"视频文件{output_file}的配置或素材已修改，重新渲染")
+
+        clip = normalize_audio_volume(make_clip())
         # 如果启用了自动添加转场效果，则在头尾加入淡入淡出
+        keyframes = []
+        frames = int(clip.duration * fps)
         if auto_add_transition:
             clip = clip.with_effects([
                 vfx.FadeIn(duration=trans_time),
@@ -783,9 +817,16 @@ def render_all_video_clips(game_type: str, style_config: dict, main_configs: lis
                 afx.AudioFadeIn(duration=trans_time),
                 afx.AudioFadeOut(duration=trans_time)
             ])
+            # 在渐入结束、渐出开始的位置插入关键帧，拼接完整视频时中间部分可以直接复制
+            trans_frames = round(trans_time * fps)
+            keyframes = [trans_frames / fps, (frames - trans_frames) / fps]
         # 直接渲染clip为视频文件
         print(f"正在合成视频片段: {prefix}_{clip_title_name}.mp4")
-        clip.write_videofile(output_file, fps=30, threads=4, preset='ultrafast', bitrate=video_bitrate)
+        write_video_clip(clip, output_file, fps=fps, bitrate=video_bitrate, preset='ultrafast', threads=4,
+                         keyframe_times=keyframes)
+        manifest.record(output_file, clip_key, fps=fps, frames=frames, keyframes=keyframes,
+                        has_audio=clip.audio is not None)
+        results.append({"output_file": output_file, "rendered": True})
         clip.close()
         # 强制垃圾回收
         del clip
@@ -793,22 +834,26 @@ def render_all_video_clips(game_type: str, style_config: dict, main_configs: lis
 
     if intro_configs:
         for clip_config in intro_configs:
-            clip = create_info_segment(clip_config, style_config, video_res)
-            clip = modify_and_rend_clip(clip, clip_config, vfile_prefix, auto_add_transition, trans_time)
+            modify_and_rend_clip(lambda: create_info_segment(clip_config, style_config, video_res),
+                                 clip_config, vfile_prefix, auto_add_transition, trans_time)
+            report(clip_config)
             vfile_prefix += 1
 
     for clip_config in main_configs:
-        clip = create_video_segment(game_type, clip_config, style_config, video_res)
-        clip = modify_and_rend_clip(clip, clip_config, vfile_prefix, auto_add_transition, trans_time)
-
+        modify_and_rend_clip(lambda: create_video_segment(game_type, clip_config, style_config, video_res),
+                             clip_config, vfile_prefix, auto_add_transition, trans_time)
+        report(clip_config)
         vfile_prefix += 1
 
     if ending_configs:
         for clip_config in ending_configs:
-            clip = create_info_segment(clip_config, style_config, video_res)
-            clip = modify_and_rend_clip(clip, clip_config, vfile_prefix, auto_add_transition, trans_time)
+            modify_and_rend_clip(lambda: create_info_segment(clip_config, style_config, video_res),
+                                 clip_config, vfile_prefix, auto_add_transition, trans_time)
+            report(clip_config)
             vfile_prefix += 1
 
+    return results
+
 
 def render_one_video_clip(
         game_type: str,
@@ -823,8 +868,8 @@ def render_one_video_clip(
     print(f"正在合成视频片段: {video_file_name}")
     try:
         clip = create_video_segment(game_type, config, style_config, video_res)
-        clip.write_videofile(os.path.join(video_output_path, video_file_name), 
-                             fps=30, threads=4, preset='ultrafast', bitrate=video_bitrate)
+        write_video_clip(clip, os.path.join(video_output_path, video_file_name),
+                         fps=30, bitrate=video_bitrate, preset='ultrafast', threads=4)
         clip.close()
         return {"status": "success", "info": f"合成视频片段{video_file_name}成功"}
     except Exception as e:
@@ -840,8 +885,9 @@ def render_complete_full_video(
         video_output_path: str, 
         intro_configs: list=None, ending_configs: list=None,
         video_res: tuple = (1920, 1080), video_bitrate: str = "4000k",
-        video_trans_enable: bool = True, video_trans_time: float = 1.0, full_last_clip: bool = False):
-    """ 根据完整配置合成完整视频，并保存到指定路径的文件 """
+        video_trans_enable: bool = True, video_trans_time: float = 1.0, full_last_clip: bool = False,
+        logger='bar'):
+    """ 根据完整配置合成完整视频，并保存到指定路径的文件；logger为moviepy的进度输出（'bar'或proglog logger） """
 
     print(f"正在合成完整视频...")
     try:
@@ -870,25 +916,27 @@ def render_complete_full_video(
         print("  3. 关闭转场效果")
         print("=" * 60)
         
-        final_video.write_videofile(
-            output_file, 
-            fps=30,
-            threads=12,  # CPU模式使用多线程
-            codec='libx264',
-            preset='medium',  # balanced 质量：medium preset
-            bitrate=video_bitrate,
-            audio_codec='aac',
-            audio_bitrate='192k',
-            logger='bar'
-        )
+        with span("VideoUtils.write_videofile", output=output_file):
+            final_video.write_videofile(
+                output_file, 
+                fps=30,
+                threads=12,  # CPU模式使用多线程
+                codec='libx264',
+                preset='medium',  # balanced 质量：medium preset
+                bitrate=video_bitrate,
+                audio_codec='aac',
+                audio_bitrate='192k',
+                logger=logger
+            )
         print("✓ CPU 渲染完成")
         final_video.close()
-        return {"status": "success", "info": f"合成完整视频成功"}
+        return {"status": "success", "info": f"合成完整视频成功", "output_file": output_file}
     except Exception as e:
         print(f"Error: 合成完整视频时发生异常: {traceback.print_exc()}")
         return {"status": "error", "info": f"合成完整视频时发生异常: {traceback.print_exc()}"}
 
 
+@timed()
 def combine_full_video_direct(video_clip_path):
     """ 
         拼接指定文件夹下的所有视频片段，生成最终视频文件
@@ -966,6 +1014,7 @@ def combine_full_video_direct(video_clip_path):
     return output_path
 
 
+@timed()
 def combine_full_video_ffmpeg_concat_gl(video_clip_path, trans_name="fade", trans_time=1):
     """ 
         使用ffmpeg的concat_gl脚本，以指定的转场效果拼接指定文件夹下的所有视频片段，生成最终视频文件
@@ -1,7 +1,9 @@
 import cv2
 import numpy as np
 import traceback
+from utils.profiling import timed
 
+@timed()
 def find_circle_center(frame, debug=False, name="video"):
     """
     使用霍夫圆变换检测视频帧中圆形区域的中心。
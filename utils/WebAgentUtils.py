@@ -1,13 +1,18 @@
 import json
 import os
 import random
-import time
 import re
+import shutil
+import threading
 
 from copy import deepcopy
 from utils.video_crawler import PurePytubefixDownloader, BilibiliDownloader
 from utils.DataUtils import chart_type_value2str, level_index_to_label
-from utils.video_search_strategy import VideoSearchStrategy, SearchStrategy
+from utils.video_search_strategy import VideoSearchStrategy, SearchStrategy, SearchPlanner
+from utils.segment_fetch import (DEFAULT_SEGMENT_MARGIN, get_segment_info, plan_segment_window, segment_covers,
+                                 remove_segment_info)
+from utils.PathUtils import get_download_job_dir
+from utils.profiling import timed
 
 def _clean_title_for_search(title: str) -> str:
     """
@@ -85,14 +90,15 @@ def get_keyword(downloader_type, game_type, title_name, difficulty_name, type):
     elif downloader_type == "bilibili":
         return f"{dif_game_CN_name} {title_name} {type_CN_name} {dif_CN_name}  "
     
+@timed()
 def search_one_video(downloader, chart_data):
     """
     使用成熟的搜索策略搜索视频
     
-    采用多策略搜索：
+    采用多策略搜索（见SearchPlanner）：
     1. 生成多个关键词变体（从精确到模糊）
-    2. 按优先级尝试每个关键词
-    3. 对结果进行评分和排序
+    2. 先尝试优先级最高的关键词，结果足够可信则直接结束
+    3. 否则并行尝试剩余关键词，跨策略去重后评分和排序
     4. 选择最佳匹配
     """
     game_type = chart_data['game_type']
@@ -126,104 +132,64 @@ def search_one_video(downloader, chart_data):
         ret_chart_data['video_info_match'] = videos[match_index]
         return ret_chart_data, output_info
     
-    # 对于YouTube，使用新的多策略搜索
+    # 对于YouTube，使用多策略搜索规划器：首个策略命中可信结果即结束，否则并行尝试剩余策略
     if dl_type == "youtube":
         search_strategy = VideoSearchStrategy(game_type)
+        planner = SearchPlanner(search_strategy, downloader.search_video, min_score=20.0)
+        best_match, scored_results, all_results = planner.run(title_name, difficulty_name, chart_type)
+        max_results = getattr(downloader, 'search_max_results', 3)
+
+        if best_match:
+            # 转换为原有格式
+            formatted_videos = []
+            for result in scored_results[:max_results]:
+                formatted_videos.append({
+                    'id': result.url,
+                    'pure_id': result.video_id,
+                    'title': result.title,
+                    'url': result.url,
+                    'duration': result.duration,
+                    '_score': result.score,
+                    '_matched_game': result.matched_game,
+                    '_matched_difficulty': result.matched_difficulty
+                })
+            
+            # 选择最佳匹配作为默认结果
+            best_video = {
+                'id': best_match.url,
+                'pure_id': best_match.video_id,
+                'title': best_match.title,
+                'url': best_match.url,
+                'duration': best_match.duration
+            }
+            
+            # 输出匹配信息
+            match_info = []
+            if best_match.matched_game:
+                match_info.append("✓游戏类型匹配")
+            if best_match.matched_difficulty:
+                match_info.append("✓难度匹配")
+            if best_match.matched_title:
+                match_info.append("✓歌曲名匹配")
+            
+            match_status = " | ".join(match_info) if match_info else "⚠️部分匹配"
+            output_info = f"找到最佳匹配 (评分: {best_match.score:.1f}, {match_status}): {best_match.title}"
+            print(output_info)
+            
+            ret_chart_data['video_info_list'] = formatted_videos
+            ret_chart_data['video_info_match'] = best_video
+            return ret_chart_data, output_info
         
-        # 生成多个关键词变体
-        keyword_variants = search_strategy.generate_search_keywords(
-            title_name, difficulty_name, chart_type
-        )
-        
-        all_results = []
-        last_error = None
-        
-        # 按优先级尝试每个关键词
-        for keyword, strategy in keyword_variants:
-            try:
-                print(f"尝试搜索策略 [{strategy.value}]: {keyword}")
-                videos = downloader.search_video(keyword)
-                
-                if videos and len(videos) > 0:
-                    # 对结果进行评分和排序
-                    scored_results = search_strategy.filter_and_rank_results(
-                        videos, title_name, difficulty_name, strategy, min_score=20.0
-                    )
-                    
-                    if scored_results:
-                        # 选择最佳匹配
-                        best_match = search_strategy.get_best_match(scored_results)
-                        
-                        if best_match:
-                            # 转换为原有格式
-                            max_results = getattr(downloader, 'search_max_results', 3)
-                            formatted_videos = []
-                            for result in scored_results[:max_results]:
-                                formatted_videos.append({
-                                    'id': result.url,
-                                    'pure_id': result.video_id,
-                                    'title': result.title,
-                                    'url': result.url,
-                                    'duration': result.duration,
-                                    '_score': result.score,
-                                    '_matched_game': result.matched_game,
-                                    '_matched_difficulty': result.matched_difficulty
-                                })
-                            
-                            # 选择最佳匹配作为默认结果
-                            best_video = {
-                                'id': best_match.url,
-                                'pure_id': best_match.video_id,
-                                'title': best_match.title,
-                                'url': best_match.url,
-                                'duration': best_match.duration
-                            }
-                            
-                            # 输出匹配信息
-                            match_info = []
-                            if best_match.matched_game:
-                                match_info.append("✓游戏类型匹配")
-                            if best_match.matched_difficulty:
-                                match_info.append("✓难度匹配")
-                            if best_match.matched_title:
-                                match_info.append("✓歌曲名匹配")
-                            
-                            match_status = " | ".join(match_info) if match_info else "⚠️部分匹配"
-                            output_info = f"找到最佳匹配 (评分: {best_match.score:.1f}, {match_status}): {best_match.title}"
-                            print(output_info)
-                            
-                            ret_chart_data['video_info_list'] = formatted_videos
-                            ret_chart_data['video_info_match'] = best_video
-                            return ret_chart_data, output_info
-                    
-                    # 如果当前策略有结果但评分不够，继续尝试下一个策略
-                    all_results.extend(videos)
-                
-            except Exception as e:
-                error_msg = str(e)
-                last_error = e
-                
-                # 如果是400错误，继续尝试下一个策略
-                if "400" in error_msg or "Bad Request" in error_msg:
-                    print(f"搜索策略 [{strategy.value}] 失败: {error_msg}，尝试下一个策略...")
-                    time.sleep(1)  # 短暂延迟
-                    continue
-                else:
-                    # 其他错误，记录但继续尝试
-                    print(f"搜索策略 [{strategy.value}] 出错: {error_msg}，尝试下一个策略...")
-                    continue
-        
-        # 所有策略都失败
+        # 所有策略都没有达到评分阈值
         if all_results:
             # 即使所有策略都失败，如果有任何结果，使用第一个
-            max_results = getattr(downloader, 'search_max_results', 3)
             print(f"⚠️ 所有搜索策略都遇到问题，使用备用结果")
             ret_chart_data['video_info_list'] = all_results[:max_results]
             ret_chart_data['video_info_match'] = all_results[0]
             output_info = f"备用结果: {all_results[0]['title']}, {all_results[0]['url']}"
             return ret_chart_data, output_info
         else:
-            error_msg = str(last_error) if last_error else "未知错误"
+            error_msg = str(planner.last_error) if planner.last_error else "未知错误"
             output_info = f"Error: 所有搜索策略均失败，未找到{title_name}-{difficulty_name}-{chart_type}的视频。最后错误: {error_msg}"
             print(output_info)
             ret_chart_data['video_info_list'] = []
@@ -236,43 +202,131 @@ def search_one_video(downloader, chart_data):
     ret_chart_data['video_info_match'] = {}
     return ret_chart_data, output_info
 
-def download_one_video(downloader, db_handler, song, video_download_path, high_res=False):
+def _get_video_store_key(downloader, video_info):
+    """
+    获取谱面视频在共享视频库中的键 (来源平台, 源视频ID, 分P序号)
+    同一源视频只下载并保存一份，被多个谱面、存档和用户共享
+    """
+    source = "bilibili" if isinstance(downloader, BilibiliDownloader) else "youtube"
+    source_video_id = video_info.get('pure_id') or str(video_info.get('id', ''))
+    if source == "youtube":
+        # 使用pytubefix搜索时id为视频url，需要从中提取视频ID
+        match = re.search(r'(?:v=|youtu\.be/|shorts/)([\w-]{11})', source_video_id)
+        if match:
+            source_video_id = match.group(1)
+    return source, source_video_id, int(video_info.get('p_index', 0) or 0)
+
+
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+
+def _get_store_lock(store_file_name):
+    """同一源视频的下载任务共用一个锁，避免并发下载时写入同一个临时目录"""
+    with _store_locks_guard:
+        return _store_locks.setdefault(store_file_name, threading.Lock())
+
+
+@timed()
+def download_one_video(downloader, db_handler, song, video_download_path, high_res=False, rate_limiter=None,
+                       video_slice=None, segment_margin=DEFAULT_SEGMENT_MARGIN):
+    """
+    下载一个谱面的确认视频
+
+    视频保存在共享视频库中，以源视频ID命名（`{source}-{video_id}-p{p_index}.mp4`），
+    其他谱面、存档或用户已下载过同一视频时直接复用，不重复下载。
+
+    Args:
+        video_slice: (start, end)，原视频时间轴上需要使用的区间。提供时只下载覆盖该区间（前后各留segment_margin秒）
+            的片段；片段下载失败时回退到完整下载。已有的片段不覆盖该区间，或未提供该参数而已有的只是片段时，
+            重新完整下载并在成功后替换原文件
+    """
     chart_id = song.get('chart_id', None)
     if not chart_id:
         return {"status": "error", "info": f"Error: 错误的谱面数据，未找到chart_id，Skipping………"}
     
     clip_tag = f"{song['game_type']}-{song['song_id']}-{song['level_index']}-{song['chart_type']}"
-    # Do not use song_id in video file name, because song name may not consisted with windows file name rules
-    clip_file_name = f"{song['game_type']}-{song['chart_id']}-{song['level_index']}-{song['chart_type']}"
-    
-    # Check if video already exists
-    video_path = os.path.join(video_download_path, f"{clip_file_name}.mp4")
-    # 转换为绝对路径
-    abs_video_path = os.path.abspath(video_path)
-    if os.path.exists(video_path):
-        print(f"已找到谱面视频的缓存: {clip_tag}")
-        # Write video path info to database
-        db_handler.update_chart_video_path(chart_id=song['chart_id'], video_path=abs_video_path)
-        return {"status": "skip", "info": f"已找到谱面视频的缓存: {clip_tag}"}
-        
+
     if 'video_info_match' not in song or not song['video_info_match']:
         print(f"Error: 没有{clip_tag}的视频信息，Skipping………")
         return {"status": "error", "info": f"Error: 没有{clip_tag}的视频信息，Skipping………"}
     
     video_info = song['video_info_match']
     v_id = video_info['id']
-    try:
-        downloader.download_video(v_id, 
-                                clip_file_name, 
-                                video_download_path, 
-                                high_res=high_res,
-                                p_index=video_info.get('p_index', 0))
-        # Write video path info to database
-        db_handler.update_chart_video_path(chart_id=song['chart_id'], video_path=abs_video_path)
-        return {"status": "success", "info": f"下载{clip_tag}完成"}
-    except Exception as e:
-        print(f"Error: 谱面视频下载失败: {clip_tag}，error: {e}")
-        return {"status": "error", "info": f"Error: 谱面视频下载失败: {clip_tag}，Skipping………"}
+    source, source_video_id, p_index = _get_video_store_key(downloader, video_info)
+    # 源视频ID可能包含不适用于文件名的字符，统一替换
+    store_file_name = re.sub(r'[^\w-]', '_', f"{source}-{source_video_id}-p{p_index}")
+
+    with _get_store_lock(store_file_name):
+        # Check if video already exists in the shared store
+        stored = db_handler.load_stored_video(source, source_video_id, p_index)
+        if stored:
+            video_path = stored['file_path']
+        else:
+            # 兼容旧版本按谱面命名的缓存文件
+            # Do not use song_id in video file name, because song name may not consisted with windows file name rules
+            legacy_file_name = f"{song['game_type']}-{song['chart_id']}-{song['level_index']}-{song['chart_type']}"
+            legacy_path = os.path.abspath(os.path.join(video_download_path, f"{legacy_file_name}.mp4"))
+            if os.path.exists(legacy_path):
+                video_path = legacy_path
+            else:
+                video_path = os.path.abspath(os.path.join(video_download_path, f"{store_file_name}.mp4"))
+
+        # 片段文件不包含截取区间，或需要完整视频（video_slice为None）而已有的只是片段时，重新完整下载
+        replace_existing = False
+        if os.path.exists(video_path):
+            if video_slice is None:
+                covered = get_segment_info(video_path) is None
+            else:
+                covered = segment_covers(video_path, *video_slice)
+            if covered:
+                print(f"已找到谱面视频的缓存: {clip_tag}")
+                # Write video path info to database
+                db_handler.link_chart_to_stored_video(chart_id, source, source_video_id, p_index, video_path)
+                return {"status": "skip", "info": f"已找到谱面视频的缓存: {clip_tag}"}
+            print(f"已缓存的谱面视频片段不包含截取区间 {video_slice or '（完整视频）'}，将重新完整下载: {clip_tag}")
+            video_slice = None
+            replace_existing = True
+
+        output_path, output_name = os.path.split(video_path)
+        output_name = os.path.splitext(output_name)[0]
+        # 已有的文件可能被其他谱面引用，先下载到任务临时目录，成功后再替换，下载失败时保留原文件
+        download_path = get_download_job_dir(output_path, f"{output_name}_replace") if replace_existing else output_path
+        downloaded_file = os.path.join(download_path, f"{output_name}.mp4")
+        try:
+            # 仅在实际发起下载时占用请求配额，已缓存的视频不受限流影响
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            if video_slice:
+                seg_start, seg_end = plan_segment_window(*video_slice, margin=segment_margin)
+                try:
+                    downloader.download_video_segment(v_id, output_name, output_path,
+                                                      seg_start, seg_end,
+                                                      high_res=high_res,
+                                                      p_index=p_index)
+                except Exception as e:
+                    print(f"片段下载失败，改为完整下载: {clip_tag}，error: {e}")
+                    video_slice = None
+            if not video_slice:
+                downloader.download_video(v_id, 
+                                        output_name, 
+                                        download_path, 
+                                        high_res=high_res,
+                                        p_index=p_index)
+                if not os.path.exists(downloaded_file):
+                    raise FileNotFoundError(f"下载结束后未找到视频文件: {downloaded_file}")
+                if replace_existing:
+                    os.replace(downloaded_file, video_path)
+                    shutil.rmtree(download_path, ignore_errors=True)
+                remove_segment_info(video_path)
+            if not os.path.exists(video_path):
+                raise FileNotFoundError(f"下载结束后未找到视频文件: {video_path}")
+            # Write video path info to database
+            db_handler.link_chart_to_stored_video(chart_id, source, source_video_id, p_index, video_path)
+            return {"status": "success", "info": f"下载{clip_tag}{'片段' if video_slice else ''}完成"}
+        except Exception as e:
+            print(f"Error: 谱面视频下载失败: {clip_tag}，error: {e}")
+            return {"status": "error", "info": f"Error: 谱面视频下载失败: {clip_tag}，Skipping………"}
 
 
 def st_init_cache_pathes():
@@ -0,0 +1,98 @@
+"""
+背景视频缓存
+
+开场/结尾的背景视频（intro_video_bg）和片段的背景视频（content_bg_video）在每个片段中都是同一个文件，
+原先每个片段都要重新解码原视频并逐帧缩放、调整亮度。这里对每个背景视频按 分辨率 + 亮度 只用ffmpeg预处理一次，
+生成已缩放、已调整亮度、无音轨、便于快速解码的中间文件，片段直接读取缓存文件并循环播放即可。
+
+缓存文件名包含原文件的路径、大小和修改时间的哈希，替换模板中的背景视频后会自动重新生成。
+同一背景视频的其他缓存文件（旧版本或其他分辨率、亮度）超过BACKGROUND_CACHE_MAX_AGE未被使用时自动删除。
+"""
+import hashlib
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Optional, Tuple
+
+from utils.profiling import timed
+from utils.video_writer import get_ffmpeg_binary
+
+BACKGROUND_CACHE_DIR = "./videos/bg_cache"
+# 同一背景视频的其他缓存文件超过该时长（秒）未被使用时删除
+BACKGROUND_CACHE_MAX_AGE = 24 * 3600
+
+_cache_lock = threading.Lock()
+
+
+def _cache_file_path(source_path: str, resolution: Tuple[int, int], brightness: float) -> str:
+    stat = os.stat(source_path)
+    key = f"{os.path.abspath(source_path)}|{stat.st_size}|{stat.st_mtime_ns}|{resolution[0]}|{brightness:.3f}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(BACKGROUND_CACHE_DIR, f"{name}_{resolution[0]}w_b{int(brightness * 100)}_{digest}.mp4")
+
+
+def _remove_stale_backgrounds(source_path: str, keep: str):
+    """删除同一背景视频超过BACKGROUND_CACHE_MAX_AGE未被使用的其他缓存文件"""
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    pattern = re.compile(rf"{re.escape(name)}_\d+w_b\d+_[0-9a-f]{{12}}\.mp4")
+    for file_name in os.listdir(BACKGROUND_CACHE_DIR):
+        file_path = os.path.join(BACKGROUND_CACHE_DIR, file_name)
+        if not pattern.fullmatch(file_name) or os.path.abspath(file_path) == os.path.abspath(keep):
+            continue
+        try:
+            if time.time() - os.path.getmtime(file_path) >= BACKGROUND_CACHE_MAX_AGE:
+                os.remove(file_path)
+        except OSError:
+            # 文件正被其他任务使用（Windows）或已被删除
+            continue
+
+
+@timed()
+def prerender_background(source_path: str, output_path: str, width: int, brightness: float):
+    """按宽度等比缩放并调整亮度（与vfx.Resize(width=...)、vfx.MultiplyColor相同），去掉音轨"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # 先写入临时文件再重命名，多个进程同时生成时不会读到不完整的文件
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    video_filter = (f"scale={width}:-2:flags=lanczos,format=rgb24,"
+                    f"colorchannelmixer=rr={brightness}:gg={brightness}:bb={brightness},format=yuv420p")
+    cmd = [
+        get_ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-i", source_path, "-an",
+        "-vf", video_filter,
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "fastdecode", "-crf", "16",
+        temp_path
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_background_video(source_path: str, resolution: Tuple[int, int], brightness: float = 1.0) -> Optional[str]:
+    """
+    获取预处理后的背景视频路径，首次调用时生成
+
+    Returns:
+        缓存文件路径；预处理失败时返回None，由调用方按原方式处理原视频
+    """
+    try:
+        cache_path = _cache_file_path(source_path, resolution, brightness)
+        if os.path.exists(cache_path):
+            # 更新修改时间，标记为最近使用过
+            os.utime(cache_path)
+        else:
+            with _cache_lock:
+                if not os.path.exists(cache_path):
+                    print(f"正在生成背景视频缓存: {source_path} -> {cache_path}")
+                    prerender_background(source_path, cache_path, resolution[0], brightness)
+        _remove_stale_backgrounds(source_path, keep=cache_path)
+        return cache_path
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        print(f"Warning: 生成背景视频缓存失败，将直接使用原视频: {e} {stderr.decode(errors='replace') if stderr else ''}")
+        return None
@@ -0,0 +1,213 @@
+"""
+使用已渲染的视频片段增量拼接完整视频
+
+render_complete_full_video每次都从原始素材重新合成并编码整个视频。这里改为：
+1. 调用render_all_video_clips，只渲染片段清单（见utils/clip_manifest.py）中缺失或已过期的片段
+2. 片段在渐入结束、渐出开始的位置有关键帧，中间部分使用ffmpeg concat直接复制视频流，不重新编码
+3. 只重新编码相邻片段之间的转场部分（前一片段的渐出与后一片段的渐入叠加，两者已分别淡出/淡入，
+   相加即为交叉淡化），转场文件按两侧片段的清单记录缓存，只有相邻片段变化时才重新生成
+4. 音频按时间线将所有片段的音频混合后整体编码一次（音频编码耗时很短，可以避免逐段拼接产生的音画偏移）
+
+与create_full_video的区别：第一个片段开头和最后一个片段结尾保留片段自身的渐入渐出；不支持full_last_clip。
+修改一个片段后重新生成，只需要重新渲染该片段和与其相邻的两个转场。
+"""
+import hashlib
+import os
+import subprocess
+import traceback
+from typing import Dict, List
+
+from utils.clip_manifest import ClipManifest
+from utils.profiling import span, timed
+from utils.video_writer import get_ffmpeg_binary
+
+TRANSITION_DIR = "transitions"
+AUDIO_BITRATE = "192k"
+
+
+def _run_ffmpeg(cmd: List[str]):
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg执行失败（退出码{result.returncode}）: "
+                           f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+
+
+def _concat_path(file_path: str) -> str:
+    """concat列表中的路径，单引号需要转义"""
+    return os.path.abspath(file_path).replace('\\', '/').replace("'", "'\\''")
+
+
+@timed()
+def encode_transition(prev_file: str, next_file: str, prev_start: float, trans_time: float,
+                      output_file: str, video_bitrate: str, fps: int = 30):
+    """将前一片段结尾trans_time秒与后一片段开头trans_time秒叠加，编码为单独的转场片段（不含音频）"""
+    temp_file = f"{output_file}.{os.getpid()}.tmp.mp4"
+    filter_graph = ("[0:v]setpts=PTS-STARTPTS,format=gbrp[a];"
+                    "[1:v]setpts=PTS-STARTPTS,format=gbrp[b];"
+                    "[a][b]blend=all_mode=addition,format=yuv420p[v]")
+    # 编码参数与render_all_video_clips相同，拼接时可以直接复制
+    cmd = [
+        get_ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-ss", f"{prev_start:.6f}", "-t", f"{trans_time:.6f}", "-i", prev_file,
+        "-t", f"{trans_time:.6f}", "-i", next_file,
+        "-filter_complex", filter_graph, "-map", "[v]", "-an",
+        "-r", str(fps), "-vcodec", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-b:v", video_bitrate, "-threads", "4",
+        temp_file
+    ]
+    try:
+        _run_ffmpeg(cmd)
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+@timed()
+def mix_timeline_audio(audio_inputs: List[Dict], total_duration: float, output_file: str):
+    """按开始时间混合所有片段的音频，audio_inputs为[{"file", "start"}]"""
+    cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error"]
+    filters, labels = [], []
+    for index, item in enumerate(audio_inputs):
+        cmd.extend(["-i", item["file"]])
+        delay = int(round(item["start"] * 1000))
+        filters.append(f"[{index}:a]adelay={delay}:all=1[a{index}]")
+        labels.append(f"[a{index}]")
+    # 相邻片段的音频已分别淡出/淡入，不归一化直接相加
+    filters.append(f"{''.join(labels)}amix=inputs={len(labels)}:normalize=0:duration=longest,"
+                   f"atrim=0:{total_duration:.6f}[out]")
+    cmd.extend(["-filter_complex", ";".join(filters), "-map", "[out]",
+                "-c:a", "aac", "-b:a", AUDIO_BITRATE, output_file])
+    _run_ffmpeg(cmd)
+
+
+def _transition_file(transitions_dir: str, index: int, prev_entry: Dict, next_entry: Dict,
+                     trans_time: float, video_bitrate: str) -> str:
+    key = f"{prev_entry['key']}|{prev_entry['file']}|{next_entry['key']}|{next_entry['file']}|{trans_time}|{video_bitrate}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(transitions_dir, f"{index}_{digest}.mp4")
+
+
+@timed()
+def assemble_full_video_from_clips(
+        username: str,
+        game_type: str,
+        style_config: dict,
+        main_configs: list,
+        video_output_path: str,
+        intro_configs: list = None, ending_configs: list = None,
+        video_res: tuple = (1920, 1080), video_bitrate: str = "4000k",
+        video_trans_enable: bool = True, video_trans_time: float = 1.0, full_last_clip: bool = False,
+        progress_callback=None) -> Dict:
+    """
+    复用已渲染的片段增量生成完整视频，输出文件与render_complete_full_video相同
+    progress_callback(progress, message)中progress为0~1
+    """
+    from utils.VideoUtils import render_all_video_clips
+
+    def report(progress, message):
+        if progress_callback:
+            progress_callback(progress, message)
+
+    if full_last_clip:
+        return {"status": "error", "info": "增量生成完整视频不支持完整播放最终片段，请使用普通方式生成"}
+
+    try:
+        clips = render_all_video_clips(
+            game_type=game_type,
+            style_config=style_config,
+            main_configs=main_configs,
+            video_output_path=video_output_path,
+            video_res=video_res,
+            video_bitrate=video_bitrate,
+            intro_configs=intro_configs,
+            ending_configs=ending_configs,
+            auto_add_transition=video_trans_enable,
+            trans_time=video_trans_time,
+            verify_existing=True,
+            progress_callback=lambda done, total, name: report(0.8 * done / total, f"已准备视频片段 {name} ({done}/{total})")
+        )
+        if not clips:
+            return {"status": "error", "info": "没有需要生成的视频片段"}
+
+        manifest = ClipManifest(video_output_path)
+        entries = [manifest.get(clip['output_file']) for clip in clips]
+        fps = entries[0]['fps']
+        trans_time = round(video_trans_time * fps) / fps if video_trans_enable else 0
+        for clip, entry in zip(clips, entries):
+            if trans_time and entry['duration'] <= 2 * trans_time:
+                return {"status": "error",
+                        "info": f"视频片段{os.path.basename(clip['output_file'])}的时长不足两倍过渡时间，无法增量拼接"}
+
+        # 时间线：每个片段比前一片段的结尾提前trans_time秒开始
+        starts, position = [], 0.0
+        for entry in entries:
+            starts.append(position)
+            position += entry['duration'] - trans_time
+        total_duration = position + trans_time
+
+        # 重新编码相邻片段之间的转场
+        transitions_dir = os.path.join(video_output_path, TRANSITION_DIR)
+        os.makedirs(transitions_dir, exist_ok=True)
+        transition_files, encoded = [], 0
+        if trans_time:
+            for index in range(len(clips) - 1):
+                transition_file = _transition_file(transitions_dir, index, entries[index], entries[index + 1],
+                                                   trans_time, video_bitrate)
+                if not os.path.exists(transition_file):
+                    report(0.8 + 0.1 * index / (len(clips) - 1), f"正在生成转场 ({index + 1}/{len(clips) - 1})")
+                    encode_transition(clips[index]['output_file'], clips[index + 1]['output_file'],
+                                      entries[index]['keyframes'][1], trans_time, transition_file, video_bitrate, fps)
+                    encoded += 1
+                transition_files.append(transition_file)
+        # 删除不再使用的转场
+        for file_name in os.listdir(transitions_dir):
+            file_path = os.path.join(transitions_dir, file_name)
+            if file_path not in transition_files and file_name.endswith(".mp4"):
+                os.remove(file_path)
+
+        # 视频部分：片段中间部分直接复制，与转场交替拼接
+        concat_list = os.path.join(transitions_dir, "concat_list.txt")
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            f.write("ffconcat version 1.0\n")
+            for index, (clip, entry) in enumerate(zip(clips, entries)):
+                f.write(f"file '{_concat_path(clip['output_file'])}'\n")
+                if trans_time and index > 0:
+                    f.write(f"inpoint {entry['keyframes'][0]:.6f}\n")
+                if trans_time and index < len(clips) - 1:
+                    f.write(f"outpoint {entry['keyframes'][1]:.6f}\n")
+                    f.write(f"file '{_concat_path(transition_files[index])}'\n")
+
+        report(0.9, "正在合成音频……")
+        audio_file = os.path.join(transitions_dir, "full_audio.m4a")
+        audio_inputs = [{"file": clip['output_file'], "start": start}
+                        for clip, entry, start in zip(clips, entries, starts) if entry.get('has_audio', True)]
+        if audio_inputs:
+            mix_timeline_audio(audio_inputs, total_duration, audio_file)
+
+        report(0.95, "正在拼接完整视频……")
+        output_file = os.path.join(video_output_path, f"{username}_FULL_VIDEO.mp4")
+        temp_output = f"{output_file}.{os.getpid()}.tmp.mp4"
+        cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", concat_list]
+        if audio_inputs:
+            cmd.extend(["-i", audio_file, "-map", "0:v:0", "-map", "1:a:0"])
+        else:
+            cmd.extend(["-map", "0:v:0"])
+        cmd.extend(["-c", "copy", "-movflags", "+faststart", temp_output])
+        try:
+            with span("clip_assembly.concat", output=output_file):
+                _run_ffmpeg(cmd)
+            os.replace(temp_output, output_file)
+        finally:
+            for file_path in (temp_output, audio_file, concat_list):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+        rendered = sum(1 for clip in clips if clip['rendered'])
+        return {"status": "success",
+                "info": f"增量生成完整视频成功：重新渲染 {rendered}/{len(clips)} 个片段，{encoded} 个转场",
+                "output_file": output_file, "rendered_clips": rendered, "encoded_transitions": encoded}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "info": f"增量生成完整视频时发生异常: {e}"}
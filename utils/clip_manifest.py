@@ -0,0 +1,112 @@
+"""
+视频片段清单
+
+render_all_video_clips每渲染完成一个片段，就在输出文件夹的.clip_manifest.json中记录该片段的渲染参数哈希
+（片段配置、视频模板、分辨率、比特率、转场设置，以及配置中引用的素材文件的大小和修改时间），
+以及输出文件的大小、修改时间、帧数和强制插入的关键帧位置。
+
+之后再次生成时，可以据此判断已存在的片段文件是否与当前配置一致：
+一致的片段直接复用，配置或素材修改过的片段重新渲染（见utils/clip_assembly.py）。
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+CLIP_MANIFEST_FILE = ".clip_manifest.json"
+# 片段的渲染方式（如关键帧位置）变化时增加版本号，旧版本记录的片段会被重新渲染
+MANIFEST_VERSION = 1
+
+UP_TO_DATE = "up_to_date"
+CHANGED = "changed"
+MISSING = "missing"
+UNKNOWN = "unknown"
+
+
+def _file_stamp(file_path: str):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _collect_file_stamps(value, stamps: Dict):
+    """递归收集配置中引用的已存在文件的大小和修改时间"""
+    if isinstance(value, dict):
+        for item in value.values():
+            _collect_file_stamps(item, stamps)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_file_stamps(item, stamps)
+    elif isinstance(value, str) and value and os.path.isfile(value):
+        stamps[os.path.abspath(value)] = _file_stamp(value)
+
+
+def compute_clip_key(config: Dict, style_config: Dict, resolution, bitrate: str,
+                     trans_enable: bool, trans_time: float) -> str:
+    """计算片段渲染参数的哈希，任何影响片段画面或音频的参数变化都会改变该值"""
+    stamps = {}
+    _collect_file_stamps(config, stamps)
+    _collect_file_stamps(style_config, stamps)
+    payload = {
+        "version": MANIFEST_VERSION,
+        "config": config,
+        "style_config": style_config,
+        "resolution": list(resolution),
+        "bitrate": bitrate,
+        "trans_time": trans_time if trans_enable else 0,
+        "files": stamps,
+    }
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ClipManifest:
+    """输出文件夹中已渲染片段的清单，以文件名为键"""
+    def __init__(self, video_output_path: str):
+        self.video_output_path = video_output_path
+        self.manifest_file = os.path.join(video_output_path, CLIP_MANIFEST_FILE)
+        self.entries = {}
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.entries = {}
+
+    def get(self, output_file: str) -> Optional[Dict]:
+        return self.entries.get(os.path.basename(output_file))
+
+    def check(self, output_file: str, clip_key: str) -> str:
+        """
+        Returns:
+            UP_TO_DATE：文件存在且与当前参数一致；CHANGED：参数或文件已变化；
+            MISSING：文件不存在；UNKNOWN：文件存在但没有记录（旧版本生成的片段）
+        """
+        if not os.path.exists(output_file):
+            return MISSING
+        entry = self.get(output_file)
+        if not entry:
+            return UNKNOWN
+        if entry.get("key") != clip_key or entry.get("file") != _file_stamp(output_file):
+            return CHANGED
+        return UP_TO_DATE
+
+    def record(self, output_file: str, clip_key: str, fps: int, frames: int, keyframes=None, has_audio=True):
+        self.entries[os.path.basename(output_file)] = {
+            "key": clip_key,
+            "file": _file_stamp(output_file),
+            "fps": fps,
+            "frames": frames,
+            "duration": frames / fps,
+            "keyframes": list(keyframes or []),
+            "has_audio": has_audio,
+        }
+        self.save()
+
+    def save(self):
+        # 清除已不存在的片段，先写入临时文件再替换，避免中断时清单损坏
+        self.entries = {name: entry for name, entry in self.entries.items()
+                        if os.path.exists(os.path.join(self.video_output_path, name))}
+        temp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.manifest_file)
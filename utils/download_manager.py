@@ -0,0 +1,113 @@
+"""
+谱面视频下载管理模块
+
+使用有界线程池并发下载谱面视频，任务按优先级（数值越小越优先）出队，
+以便视频合成时最先需要的谱面最先下载完成。
+每个下载任务在独立的临时目录中完成下载与合并，再原子地移动到共享视频库中的
+`{source}-{video_id}-p{p_index}.mp4`，因此任务之间互不干扰；指向同一源视频的任务依次执行，只下载一次。
+"""
+import itertools
+import queue
+import threading
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.WebAgentUtils import download_one_video
+from utils.search_scheduler import TokenBucketLimiter
+from utils.segment_fetch import DEFAULT_SEGMENT_MARGIN
+
+
+@dataclass(order=True)
+class DownloadJob:
+    priority: int
+    seq: int
+    song: Dict = field(compare=False)
+    video_slice: Optional[Tuple[float, float]] = field(default=None, compare=False)
+
+
+class DownloadManager:
+    """
+    并发下载管理器
+
+    Example:
+        manager = DownloadManager(downloader, db_handler, "./videos/downloads", max_workers=2)
+        for index, song in enumerate(charts):
+            manager.submit(song, priority=index)
+        for song, result in manager.run():
+            ...  # 在调用线程中更新界面
+    """
+    def __init__(self, downloader, db_handler, video_download_path: str, high_res: bool = False,
+                 max_workers: int = 2, wait_time: Optional[Tuple[int, int]] = None,
+                 segment_margin: float = DEFAULT_SEGMENT_MARGIN):
+        self.downloader = downloader
+        self.db_handler = db_handler
+        self.video_download_path = video_download_path
+        self.high_res = high_res
+        self.max_workers = max(1, int(max_workers))
+        self.segment_margin = segment_margin
+
+        # 与原先每次下载后随机等待的设置保持相同的平均请求频率，以减少被检测为bot的风险
+        self.limiter = None
+        if wait_time and len(wait_time) == 2 and wait_time[1] > 0:
+            low, high = wait_time
+            self.limiter = TokenBucketLimiter(rate=2.0 / (low + high), burst=self.max_workers,
+                                              jitter=(0.0, (high - low) / 2))
+
+        self._jobs = queue.PriorityQueue()
+        self._results = queue.Queue()
+        self._seq = itertools.count()
+        self._pending = 0
+        self._cancelled = threading.Event()
+
+    def submit(self, song: Dict, priority: int = 0, video_slice: Optional[Tuple[float, float]] = None):
+        """
+        添加一个下载任务，priority越小越先下载
+        提供video_slice（原视频时间轴上的截取区间）时只下载该区间附近的片段
+        """
+        self._jobs.put(DownloadJob(priority, next(self._seq), song, video_slice))
+        self._pending += 1
+
+    def cancel(self):
+        """取消尚未开始的下载任务，已开始的任务会继续完成"""
+        self._cancelled.set()
+
+    def _worker(self):
+        while not self._cancelled.is_set():
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = download_one_video(self.downloader, self.db_handler, job.song,
+                                            self.video_download_path, self.high_res,
+                                            rate_limiter=self.limiter,
+                                            video_slice=job.video_slice,
+                                            segment_margin=self.segment_margin)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"status": "error", "info": f"Error: 谱面视频下载失败: {job.song.get('song_id')}，{e}"}
+            self._results.put((job.song, result))
+
+    def run(self) -> Iterator[Tuple[Dict, Dict]]:
+        """启动工作线程，并按完成顺序产出 (song, result)"""
+        total = self._pending
+        if total == 0:
+            return
+        workers = [threading.Thread(target=self._worker, name=f"video_download_{i}", daemon=True)
+                   for i in range(min(self.max_workers, total))]
+        for w in workers:
+            w.start()
+
+        finished = 0
+        while finished < total:
+            try:
+                song, result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                # 所有工作线程都已退出（例如任务被取消），不再等待剩余结果
+                if not any(w.is_alive() for w in workers) and self._results.empty():
+                    break
+                continue
+            finished += 1
+            self._pending -= 1
+            yield song, result
@@ -1,83 +1,40 @@
+import os
+import threading
+import unicodedata
 from utils.PageUtils import load_music_metadata
+from utils.DataUtils import chart_type_str2value, level_label_to_index
+from utils.rating_engine import (
+    MAIMAI_RATE_THRESHOLDS, MAIMAI_FACTOR_THRESHOLDS, MAIMAI_MAX_ACHIEVEMENT, CHUNITHM_RATING_TIERS
+)
 
 # Parse achievement to rate name
 def get_rate(achievement):
-    rates = [
-        (100.5, "sssp"),
-        (100, "sss"),
-        (99.5, "ssp"),
-        (99, "ss"),
-        (98, "sp"),
-        (97, "s"),
-        (94, "aaa"),
-        (90, "aa"),
-        (80, "a"),
-        (75, "bbb"),
-        (70, "bb"),
-        (60, "b"),
-        (50, "c"),
-        (0, "d")
-    ]
-    
-    for threshold, rate in rates:
+    for threshold, rate in MAIMAI_RATE_THRESHOLDS:
         if achievement >= threshold:
             return rate
     return "d"
 
 # DX rating factors
 def get_factor(achievement):
-    factors = [
-        (100.5, 0.224),
-        (100.4999, 0.222),
-        (100, 0.216),
-        (99.9999, 0.214),
-        (99.5, 0.211),
-        (99, 0.208),
-        (98.9999, 0.206),
-        (98, 0.203),
-        (97, 0.2),
-        (96.9999, 0.176),
-        (94, 0.168),
-        (90, 0.152),
-        (80, 0.136),
-        (79.9999, 0.128),
-        (75, 0.12),
-        (70, 0.112),
-        (60, 0.096),
-        (50, 0.08),
-        (0, 0.016)
-    ]
-    
-    for threshold, factor in factors:
+    for threshold, factor in MAIMAI_FACTOR_THRESHOLDS:
         if achievement >= threshold:
             return factor
     return 0
 
 # Compute DX rating for a single song
+# For batches of records use utils.rating_engine.compute_ratings
 def compute_rating(ds, score):
-    return int(ds * min(score, 100.5) * get_factor(score))
+    return int(ds * min(score, MAIMAI_MAX_ACHIEVEMENT) * get_factor(score))
 
 # Compute Chunithm rating for a single song
+# For batches of records use utils.rating_engine.compute_chunithm_ratings
 def compute_chunithm_rating(ds, score):
     try:
         s = int(float(score))
     except Exception:
         raise ValueError("Failed to parse chunithm score.")
 
-    tiers = [
-        (1_009_000, None,        ('fixed', 2.15)),
-        (1_007_500, 1_009_000,   ('step',  2.00, 100, 0.01, 2.15)),
-        (1_005_000, 1_007_500,   ('step',  1.50, 50,  0.01, 2.00)),
-        (1_000_000, 1_005_000,   ('step',  1.00, 100, 0.01, 1.50)),
-        (990_000,   1_000_000,   ('step',  0.60, 250, 0.01, 1.00)),
-        (975_000,   990_000,     ('step',  0.00, 250, 0.01, 0.60)),
-        (950_000,   975_000,     ('fixed', -1.5)),
-        (925_000,   950_000,     ('fixed', -3.0)),
-        (900_000,   925_000,     ('fixed', -5.0)),
-        (800_000,   900_000,     ('func',  lambda ds, s: (ds - 5.0) / 2.0)),
-    ]
-
-    for mn, mx, rule in tiers:
+    for mn, mx, rule in CHUNITHM_RATING_TIERS:
         if s >= mn and (mx is None or s < mx):
             typ = rule[0]
             if typ == 'fixed':
@@ -95,16 +52,107 @@ def compute_chunithm_rating(ds, score):
 def parse_level(ds):
     return f"{int(ds)}+" if int((ds * 10) % 10) >= 6 else str(int(ds))
 
+MAIMAI_METADATA_FILE = "./music_metadata/maimaidx/dxdata.json"
+
+# 标题别名表的归一化规则：全角/半角字符统一（NFKC），连续空白合并为一个空格
+def normalize_title(title):
+    if not title:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", title).split())
+
+class SongIndex:
+    """
+    maimai乐曲元数据的哈希索引：(曲名, 谱面类型) -> 歌曲，以及归一化曲名的别名表
+
+    兼容旧版歌曲列表（含name/type/charts字段）和dxdata.json（songs/sheets）两种元数据格式。
+    """
+    def __init__(self, metadata):
+        self.songs = self._to_song_entries(metadata)
+        self.by_name = {}
+        self.aliases = {}
+        for entry in self.songs:
+            self._add(entry)
+
+    def _add(self, entry):
+        key = (entry.get("name"), entry.get("type"))
+        self.by_name.setdefault(key, entry)
+        self.aliases.setdefault((normalize_title(key[0]), key[1]), entry)
+
+    def replace_titles(self, titles, songs):
+        """将曲名在titles中的条目替换为由songs（dxdata.json格式）构造的条目"""
+        titles = set(titles)
+        entries = self._to_song_entries({"songs": songs})
+        self.songs = [e for e in self.songs if e.get("name") not in titles] + entries
+        self.by_name = {k: e for k, e in self.by_name.items() if e.get("name") not in titles}
+        self.aliases = {k: e for k, e in self.aliases.items() if e.get("name") not in titles}
+        for entry in entries:
+            self._add(entry)
+
+    @staticmethod
+    def _to_song_entries(metadata):
+        if not isinstance(metadata, dict):
+            return metadata
+        # dxdata.json：按谱面类型拆分为与旧版格式一致的条目，charts按level_index排列
+        entries = []
+        for song in metadata.get("songs", []):
+            by_type = {}
+            for sheet in song.get("sheets", []):
+                chart_type = chart_type_str2value(sheet.get("type", "std"))
+                level_index = level_label_to_index("maimai", sheet.get("difficulty", ""))
+                if level_index > 4 or sheet.get("internalLevelValue") is None:
+                    continue
+                charts = by_type.setdefault(chart_type, [None] * 5)
+                charts[level_index] = {"level": sheet.get("internalLevelValue")}
+            for chart_type, charts in by_type.items():
+                entries.append({"name": song.get("title"), "type": chart_type, "charts": charts})
+        return entries
+
+    def find(self, chart_title, chart_type):
+        return self.by_name.get((chart_title, chart_type)) \
+            or self.aliases.get((normalize_title(chart_title), chart_type))
+
+_song_index = None
+_song_index_mtime = None
+_song_index_lock = threading.Lock()
+
+def get_song_index():
+    """获取所有ChartManager共享的歌曲索引，元数据文件更新后自动重建"""
+    global _song_index, _song_index_mtime
+    mtime = os.path.getmtime(MAIMAI_METADATA_FILE) if os.path.exists(MAIMAI_METADATA_FILE) else None
+    with _song_index_lock:
+        if _song_index is None or mtime != _song_index_mtime:
+            _song_index = SongIndex(load_music_metadata("maimaidx"))
+            _song_index_mtime = mtime
+        return _song_index
+
+def patch_song_index(titles, songs, previous_mtime):
+    """
+    元数据文件改写后增量更新共享的歌曲索引
+
+    Args:
+        titles: 新增、删除或变化的歌曲曲名
+        songs: 更新后元数据中曲名在titles中的所有歌曲
+        previous_mtime: 改写前元数据文件的修改时间；与索引加载时的不一致时放弃增量更新，下次访问时重新加载
+    """
+    global _song_index, _song_index_mtime
+    with _song_index_lock:
+        if _song_index is None:
+            return
+        if _song_index_mtime != previous_mtime:
+            _song_index = None
+            return
+        _song_index.replace_titles(titles, songs)
+        _song_index_mtime = os.path.getmtime(MAIMAI_METADATA_FILE) if os.path.exists(MAIMAI_METADATA_FILE) else None
+
 class ChartManager:
     
     def __init__(self, compute_total_rating = True):
-        self.all_songs = []
-        self.results = []
         self.compute_total_rating = compute_total_rating
         self.total_rating = 0
 
         # with open("./music_datasets/jp_songs_info.json", 'r', encoding="utf-8") as f:
-        self.all_songs = load_music_metadata("maimaidx")    
+        self.song_index = get_song_index()
+        self.all_songs = self.song_index.songs
 
     def fill_json(self, chart_json):
         #chart = {
@@ -133,6 +181,11 @@ class ChartManager:
         matched_song = self.find_song(chart_title, chart_type)
         song_rating = 0
         
+        # The dataset may lack this difficulty (e.g. a newly added Re:MASTER)
+        charts = matched_song.get("charts", []) if matched_song else []
+        if matched_song and not (0 <= chart_level_index < len(charts) and charts[chart_level_index]):
+            matched_song = None
+
         # Extract info from matched json object
         if matched_song:
             if ("id" in matched_song) and (matched_song["id"] is not None):
@@ -160,23 +213,4 @@ class ChartManager:
         return chart_json
 
     def find_song(self, chart_title, chart_type):
-        # Search in cached results first to save time
-
-        matched_song = next(
-            (entry for entry in self.results if entry.get("name") == chart_title and entry.get("type") == chart_type),
-            None
-        )
-        
-        if matched_song:
-            print(f"Info: song {chart_title} with chart type {chart_type} found in cached results.")
-        else:
-            matched_song = next(
-                (entry for entry in self.all_songs if entry.get("name") == chart_title and entry.get("type") == chart_type),
-                None
-            )
-            if matched_song:
-                self.results.append(matched_song)
-            # print(f"Info: song {chart_title} with chart type {chart_type} found and cached.")
-        
-        return matched_song
-            
+        return self.song_index.find(chart_title, chart_type)
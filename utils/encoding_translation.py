@@ -1,23 +1,38 @@
+"""
+视频编码统一（转为H.264编码的mp4）
+
+- 并发使用ffprobe探测所有视频的编码，探测结果按文件大小和修改时间缓存在目录下的
+  CODEC_CACHE_FILE中，未变化的文件（包括此前已转换过的文件）不会被重复探测
+- 视频编码已是H.264、仅容器不是mp4的文件直接无损封装（remux），不重新编码
+- 需要转码的文件在与CPU核数匹配的有界进程池中并行处理
+- 转换后的文件替换原文件，且同一视频文件可能被多个谱面以不同的截取区间共享，因此始终转换完整视频
+"""
 import subprocess
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from utils.PathUtils import DOWNLOAD_TEMP_DIRNAME
 
-def get_video_codec(file_path: str) -> str:
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
+CODECS_TO_CONVERT = ['av1', 'vp8', 'vp9']  # 需要转换的编码列表
+CODEC_CACHE_FILE = ".codec_cache.json"
+PROBE_CONCURRENCY = 8  # 同时运行的ffprobe进程数
+
+def probe_video(file_path: str) -> Dict:
     """
-    使用 ffprobe 获取视频的编码格式
-    
-    Args:
-        file_path (str): 视频文件路径
-    
+    使用 ffprobe 获取视频的音视频编码和时长
+
     Returns:
-        str: 视频编码格式，如果获取失败则返回空字符串
+        dict: {"video_codec", "audio_codec", "duration"}，获取失败的字段为空字符串或0
     """
+    info = {"video_codec": "", "audio_codec": "", "duration": 0.0}
     try:
         cmd = [
             'ffprobe',
             '-v', 'error',  # 只显示错误信息
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=codec_name',
+            '-show_entries', 'stream=codec_type,codec_name:format=duration',
             '-of', 'json',
             str(file_path)
         ]
@@ -28,18 +43,68 @@ def get_video_codec(file_path: str) -> str:
             text=True
         )
         data = json.loads(result.stdout)
-        return data['streams'][0]['codec_name']
+        for stream in data.get('streams', []):
+            key = f"{stream.get('codec_type')}_codec"
+            if key in info and not info[key]:
+                info[key] = stream.get('codec_name', '')
+        info["duration"] = float(data.get('format', {}).get('duration', 0) or 0)
     except Exception as e:
         print(f"获取视频编码信息失败: {str(e)}")
-        return ""
+    return info
 
-def needs_conversion(file_path: Path) -> bool:
+def get_video_codec(file_path: str) -> str:
+    """
+    使用 ffprobe 获取视频的编码格式
+
+    Args:
+        file_path (str): 视频文件路径
+
+    Returns:
+        str: 视频编码格式，如果获取失败则返回空字符串
+    """
+    return probe_video(file_path)["video_codec"]
+
+class ProbeCache:
+    """按文件大小和修改时间缓存ffprobe的探测结果"""
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+        self.entries = {}
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.entries = {}
+
+    @staticmethod
+    def _stat_key(file_path: Path) -> Tuple[int, float]:
+        stat = file_path.stat()
+        return stat.st_size, stat.st_mtime
+
+    def get(self, file_path: Path) -> Optional[Dict]:
+        entry = self.entries.get(str(file_path.resolve()))
+        if entry and (entry["size"], entry["mtime"]) == self._stat_key(file_path):
+            return entry["info"]
+        return None
+
+    def put(self, file_path: Path, info: Dict):
+        size, mtime = self._stat_key(file_path)
+        self.entries[str(file_path.resolve())] = {"size": size, "mtime": mtime, "info": info}
+
+    def save(self):
+        # 清除已不存在的文件的缓存
+        self.entries = {k: v for k, v in self.entries.items() if os.path.exists(k)}
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+
+def needs_conversion(file_path: Path, info: Optional[Dict] = None) -> bool:
     """
     检查视频是否需要转换
-    
+
     Args:
         file_path (Path): 视频文件路径
-    
+        info (dict): 已探测的编码信息，不提供时调用ffprobe探测
+
     Returns:
         bool: 是否需要转换
     """
@@ -47,85 +112,139 @@ def needs_conversion(file_path: Path) -> bool:
     extension = file_path.suffix.lower()
     if extension != '.mp4':
         return True
-    
+
     # 检查视频编码
-    codec = get_video_codec(str(file_path))
-    # 需要转换的编码列表
-    codecs_to_convert = ['av1', 'vp8', 'vp9']
-    return codec.lower() in codecs_to_convert
+    codec = (info or probe_video(str(file_path)))["video_codec"]
+    return codec.lower() in CODECS_TO_CONVERT
+
+def build_conversion_args(file_path: Path, output_path: Path, info: Dict, threads: int = 0) -> List[str]:
+    """构造ffmpeg参数：H.264视频直接封装，其余转码为H.264"""
+    args = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', str(file_path)]
+
+    if info["video_codec"].lower() == 'h264':
+        args += ['-c:v', 'copy']
+    else:
+        args += ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+        if threads:
+            args += ['-threads', str(threads)]
+    if info["audio_codec"].lower() == 'aac':
+        args += ['-c:a', 'copy']
+    else:
+        args += ['-c:a', 'aac', '-b:a', '192k']
+    args += ['-movflags', '+faststart', '-y', str(output_path)]
+    return args
+
+def _run_conversion(file_path: str, args: List[str], temp_output_path: str, output_path: str) -> Tuple[bool, str]:
+    """在进程池中执行单个文件的转换"""
+    file_path, temp_output_path, output_path = Path(file_path), Path(temp_output_path), Path(output_path)
+    try:
+        process = subprocess.run(args,
+                                 stdout=subprocess.PIPE,  # 捕获标准输出
+                                 stderr=subprocess.PIPE,  # 捕获错误输出
+                                 text=True)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=process.stderr)
+        if file_path != output_path:
+            file_path.unlink()
+        os.replace(temp_output_path, output_path)
+        warning = f"\n转码警告: {process.stderr}" if process.stderr else ""
+        return True, f"成功转换: {file_path} -> {output_path}{warning}"
+    except Exception as e:
+        # 清理临时文件
+        if temp_output_path.exists():
+            temp_output_path.unlink()
+        stderr = getattr(e, 'stderr', None)
+        return False, f"转换失败 {file_path}: {str(e)}{f' {stderr}' if stderr else ''}"
+
+def _collect_video_files(directory: Path) -> List[Path]:
+    files = []
+    for file_path in directory.rglob('*'):
+        # 跳过正在进行的下载任务的临时文件
+        if DOWNLOAD_TEMP_DIRNAME in file_path.parts:
+            continue
+        # 跳过非视频文件和上次中断遗留的临时文件
+        if not file_path.is_file() or file_path.suffix.lower() not in VIDEO_EXTENSIONS \
+                or file_path.name.endswith('.temp.mp4'):
+            continue
+        files.append(file_path)
+    return files
+
+def _probe_all(files: List[Path], cache: ProbeCache) -> Dict[Path, Dict]:
+    """并发探测缓存中没有（或已变化）的文件"""
+    results = {}
+    to_probe = []
+    for file_path in files:
+        info = cache.get(file_path)
+        if info is not None:
+            results[file_path] = info
+        else:
+            to_probe.append(file_path)
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY) as pool:
+            futures = {pool.submit(probe_video, str(f)): f for f in to_probe}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                info = future.result()
+                results[file_path] = info
+                if info["video_codec"]:
+                    cache.put(file_path, info)
+    return results
 
-def convert_videos_to_avc1_mp4(directory_path: str) -> None:
+def convert_videos_to_avc1_mp4(directory_path: str, max_workers: Optional[int] = None) -> List[str]:
     """
     遍历指定目录，将非mp4格式或非H.264编码的视频文件转换为mp4格式（H.264编码）
-    
+
     Args:
         directory_path (str): 需要处理的目录路径
+        max_workers (int): 同时转码的进程数，默认为CPU核数
+
+    Returns:
+        list: 转换成功的输出文件路径
     """
+    converted = []
     try:
         directory = Path(directory_path)
-        
-        # 遍历目录下的所有文件
-        for file_path in directory.rglob('*'):
-            # 跳过非视频文件
-            if not file_path.is_file() or file_path.suffix.lower() not in \
-                ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']:
-                continue
-                
-            if needs_conversion(file_path):
-                print(f"正在处理文件: {file_path}")
-                
-                # 构建输出文件路径
-                output_path = file_path.with_suffix('.mp4')
-                temp_output_path = file_path.with_suffix('.temp.mp4')
-                
-                try:
-                    # 使用 ffmpeg 进行转码，重定向输出
-                    process = subprocess.run([
-                        'ffmpeg',
-                        '-hide_banner',  # 隐藏 ffmpeg 版本信息
-                        '-loglevel', 'error',  # 只显示错误信息
-                        '-i', str(file_path),
-                        '-c:v', 'libx264',     
-                        '-preset', 'medium',    
-                        '-crf', '23',          
-                        '-c:a', 'aac',         
-                        '-b:a', '192k',        
-                        '-y',                  
-                        str(temp_output_path)
-                    ], 
-                    stdout=subprocess.PIPE,  # 捕获标准输出
-                    stderr=subprocess.PIPE,  # 捕获错误输出
-                    text=True)
-                    
-                    # 如果有错误输出，打印错误信息
-                    if process.stderr:
-                        print(f"转码警告/错误: {process.stderr}")
-                    
-                    if process.returncode == 0:
-                        if file_path != output_path:
-                            file_path.unlink()
-                        if output_path.exists():
-                            output_path.unlink()
-                        temp_output_path.rename(output_path)
-                        print(f"成功转换: {file_path} -> {output_path}")
-                    else:
-                        raise subprocess.CalledProcessError(process.returncode, process.args)
-                    
-                except subprocess.CalledProcessError as e:
-                    print(f"转换失败 {file_path}: {str(e)}")
-                    # 清理临时文件
-                    if temp_output_path.exists():
-                        temp_output_path.unlink()
-                except Exception as e:
-                    print(f"处理文件时出错 {file_path}: {str(e)}")
-                    # 清理临时文件
-                    if temp_output_path.exists():
-                        temp_output_path.unlink()
-            else:
+        cache = ProbeCache(directory / CODEC_CACHE_FILE)
+        files = _collect_video_files(directory)
+        probe_results = _probe_all(files, cache)
+
+        jobs = []
+        for file_path in files:
+            info = probe_results[file_path]
+            if not needs_conversion(file_path, info):
                 print(f"跳过文件（无需转换）: {file_path}")
-                    
+                continue
+            # 构建输出文件路径
+            output_path = file_path.with_suffix('.mp4')
+            temp_output_path = file_path.with_suffix('.temp.mp4')
+            jobs.append((file_path, output_path, temp_output_path, info))
+
+        if jobs:
+            cpu_count = os.cpu_count() or 1
+            workers = max(1, min(max_workers or cpu_count, len(jobs)))
+            # 各转码进程平分CPU核数，避免线程过度竞争
+            threads = max(1, cpu_count // workers)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for file_path, output_path, temp_output_path, info in jobs:
+                    print(f"正在处理文件: {file_path}")
+                    args = build_conversion_args(file_path, temp_output_path, info, threads)
+                    future = pool.submit(_run_conversion, str(file_path), args,
+                                         str(temp_output_path), str(output_path))
+                    futures[future] = (output_path, info)
+                for future in as_completed(futures):
+                    output_path, info = futures[future]
+                    ok, message = future.result()
+                    print(message)
+                    if not ok:
+                        continue
+                    converted.append(str(output_path))
+                    # 转换结果已知，下次运行无需重新探测
+                    cache.put(output_path, {**info, "video_codec": "h264", "audio_codec": "aac"})
+        cache.save()
     except Exception as e:
         print(f"遍历目录时出错: {str(e)}")
+    return converted
 
 if __name__ == "__main__":
     # 使用示例
@@ -0,0 +1,213 @@
+"""
+统一的HTTP客户端
+
+所有访问远程服务（水鱼、落雪、YouTube Data API、曲绘CDN等）的请求都通过本模块发出：
+- 每个主机（scheme://host:port）共享一个requests.Session，连接池保持长连接，
+  重复请求同一服务时不再重新进行TCP/TLS握手
+- 连接失败以及502/503/504等临时错误按指数退避自动重试，最终仍失败时返回最后一次的响应，
+  由调用方按状态码处理（429不自动重试，由调用方的限流器处理）
+- 超时、重试次数、连接池大小和代理从global_config.yaml读取，未配置代理时使用环境变量中的代理（HTTP(S)_PROXY）；
+  修改配置后需要调用close_all（write_global_config会自动调用）
+- fetch_all提供基于httpx.AsyncClient的异步批量请求，用于一次性获取大量小文件（如曲绘）
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONFIG_FILE = "global_config.yaml"
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_POOL_SIZE = 10
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+Timeout = Union[float, Tuple[float, float]]
+
+_sessions: Dict[Tuple[str, Optional[str]], requests.Session] = {}
+_sessions_lock = threading.Lock()
+_settings: Optional[Dict] = None
+
+
+def load_http_settings(reload: bool = False) -> Dict:
+    """
+    读取HTTP相关配置
+
+    Returns:
+        dict: {"timeout", "retries", "pool_size", "proxy"}，proxy为None表示不使用代理
+    """
+    global _settings
+    if _settings is not None and not reload:
+        return _settings
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                config = yaml.load(f, Loader=yaml.FullLoader) or {}
+        except Exception as e:
+            print(f"读取HTTP配置失败，使用默认配置: {e}")
+    proxy = None
+    if config.get("HTTP_USE_PROXY", False) and config.get("PROXY_ADDRESS"):
+        proxy = normalize_proxy(config["PROXY_ADDRESS"])
+    _settings = {
+        "timeout": config.get("HTTP_TIMEOUT", DEFAULT_TIMEOUT),
+        "retries": config.get("HTTP_RETRIES", DEFAULT_RETRIES),
+        "pool_size": config.get("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE),
+        "proxy": proxy,
+    }
+    return _settings
+
+
+def normalize_proxy(proxy: Optional[str]) -> Optional[str]:
+    """为不带协议的代理地址（如127.0.0.1:7890）补全http://"""
+    if not proxy:
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _create_session(proxy: Optional[str], settings: Dict) -> requests.Session:
+    retry = Retry(
+        total=settings["retries"],
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings["pool_size"], max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if proxy:
+        session.proxies = {"http": proxy, "https": proxy}
+        # 指定了代理时不再读取环境变量中的代理设置（HTTP(S)_PROXY），否则与requests.get相同，使用系统代理
+        session.trust_env = False
+    return session
+
+
+def get_session(url: str, proxy: Optional[str] = None) -> requests.Session:
+    """
+    获取url所在主机的共享Session
+
+    Args:
+        proxy: 为该请求指定的代理，不提供时使用配置中的代理
+    """
+    settings = load_http_settings()
+    proxy = normalize_proxy(proxy) or settings["proxy"]
+    key = (_host_key(url), proxy)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _create_session(proxy, settings)
+                _sessions[key] = session
+    return session
+
+
+def request(method: str, url: str, timeout: Optional[Timeout] = None,
+            proxy: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    通过共享连接池发送请求，参数与requests.request相同
+
+    不会因HTTP错误状态码抛出异常，连接失败或超时（重试后）抛出requests.exceptions.RequestException
+    """
+    if timeout is None:
+        timeout = load_http_settings()["timeout"]
+    return get_session(url, proxy).request(method, url, timeout=timeout, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def close_all():
+    """关闭所有共享Session（如配置变更后需要重新创建连接池时）"""
+    global _settings
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _settings = None
+
+
+async def _fetch_all_async(urls: List[str], concurrency: int, timeout: Timeout,
+                           proxy: Optional[str], headers: Optional[Dict]) -> List[Optional[bytes]]:
+    import httpx
+
+    settings = load_http_settings()
+    if isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # httpx的传输层重试只处理连接失败，状态码重试在下面进行
+    transport = httpx.AsyncHTTPTransport(retries=settings["retries"], limits=limits, proxy=proxy)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, timeout=timeout, headers=headers,
+                                 follow_redirects=True, trust_env=proxy is None) as client:
+        async def fetch(url: str) -> Optional[bytes]:
+            async with semaphore:
+                for attempt in range(settings["retries"] + 1):
+                    try:
+                        response = await client.get(url)
+                    except httpx.HTTPError as e:
+                        print(f"请求失败 (URL: {url}): {e}")
+                        return None
+                    if response.status_code == 200:
+                        return response.content
+                    if response.status_code not in RETRY_STATUS_CODES or attempt == settings["retries"]:
+                        print(f"请求失败 (URL: {url})，状态码: {response.status_code}")
+                        return None
+                    await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+            return None
+
+        return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+def fetch_all(urls: Iterable[str], concurrency: int = 8, timeout: Optional[Timeout] = None,
+              proxy: Optional[str] = None, headers: Optional[Dict] = None) -> Dict[str, Optional[bytes]]:
+    """
+    异步并发获取一批URL的内容，相同的URL只请求一次
+
+    Args:
+        concurrency: 同时进行的请求数
+        proxy: 指定的代理，不提供时使用配置中的代理
+
+    Returns:
+        dict: url -> 响应内容，请求失败（或状态码不为200）时为None
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+    settings = load_http_settings()
+    if timeout is None:
+        timeout = settings["timeout"]
+    proxy = normalize_proxy(proxy) or settings["proxy"]
+    coro = _fetch_all_async(unique_urls, concurrency, timeout, proxy, headers)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        contents = asyncio.run(coro)
+    else:
+        # 已在事件循环中（如部分Streamlit环境），在独立线程中运行
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault("contents", asyncio.run(coro)))
+        thread.start()
+        thread.join()
+        contents = result["contents"]
+    return dict(zip(unique_urls, contents))
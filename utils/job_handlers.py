@@ -0,0 +1,314 @@
+"""
+后台任务处理函数
+
+由utils.job_queue在worker子进程中调用，签名为 handler(params, ctx) -> result：
+params为提交任务时的参数（JSON），ctx为JobContext，用于汇报进度；
+返回{"status", "info", ...}，status为"error"时任务记为失败。
+各函数中的参数与对应页面中原先直接调用的函数一致，页面只需提交参数。
+"""
+import os
+from copy import deepcopy
+from typing import Dict
+
+from db_utils.DatabaseDataHandler import get_database_handler
+from utils.PageUtils import load_style_config, read_global_config
+from utils.PathUtils import get_user_media_dir
+
+
+class JobProgressLogger:
+    """将moviepy（proglog）的进度条转为任务进度"""
+    def __new__(cls, ctx, start: float = 0.0, end: float = 1.0, bar_name: str = "frame_index"):
+        from proglog import ProgressBarLogger
+
+        class _Logger(ProgressBarLogger):
+            def bars_callback(self, bar, attr, value, old_value=None):
+                if bar != bar_name or attr != "index":
+                    return
+                total = self.bars[bar].get("total") or 0
+                if total:
+                    ctx.report(start + (end - start) * value / total, f"正在渲染视频 ({value}/{total} 帧)")
+
+        return _Logger()
+
+
+def _load_composite_configs(params: Dict):
+    db_handler = get_database_handler()
+    return db_handler.load_full_config_for_composite_video(username=params['username'],
+                                                           archive_name=params['archive_name'])
+
+
+def _output_dir(params: Dict) -> str:
+    video_output_path = get_user_media_dir(params['username'], game_type=params['game_type'])['output_video_dir']
+    os.makedirs(video_output_path, exist_ok=True)
+    return video_output_path
+
+
+def render_clips_job(params: Dict, ctx) -> Dict:
+    """
+    渲染存档的所有视频片段；params['combine']为"direct"或"ffmpeg_concat"时，
+    片段渲染完成后再拼接为完整视频
+    """
+    from utils.VideoUtils import (render_all_video_clips, combine_full_video_direct,
+                                  combine_full_video_ffmpeg_concat_gl)
+    game_type = params['game_type']
+    main_configs, intro_configs, ending_configs = _load_composite_configs(params)
+    video_output_path = _output_dir(params)
+    combine = params.get('combine')
+    clip_share = 0.9 if combine else 1.0
+
+    def on_clip_done(done, total, clip_title_name):
+        ctx.report(clip_share * done / total, f"已生成视频片段 {clip_title_name} ({done}/{total})", force=True)
+
+    render_all_video_clips(
+        game_type=game_type,
+        style_config=load_style_config(game_type=game_type),
+        main_configs=main_configs,
+        video_output_path=video_output_path,
+        video_res=tuple(params['video_res']),
+        video_bitrate=params['video_bitrate'],
+        intro_configs=intro_configs,
+        ending_configs=ending_configs,
+        auto_add_transition=params.get('trans_enable', True),
+        trans_time=params.get('trans_time', 1),
+        force_render=params.get('force_render', False),
+        progress_callback=on_clip_done
+    )
+    if combine == "direct":
+        ctx.report(clip_share, "正在拼接视频……", force=True)
+        combine_full_video_direct(video_output_path)
+    elif combine == "ffmpeg_concat":
+        ctx.report(clip_share, "正在拼接视频……", force=True)
+        combine_full_video_ffmpeg_concat_gl(video_output_path, params.get('trans_name', 'fade'),
+                                            params.get('trans_time', 1))
+    return {"status": "success", "info": "视频生成结束", "output_path": os.path.abspath(video_output_path)}
+
+
+def plan_render(params: Dict) -> Dict:
+    """按渲染任务的参数规划完整视频时间线，不渲染（见utils/timeline_planner.py）"""
+    from utils.timeline_planner import plan_full_video
+    game_type = params['game_type']
+    main_configs, intro_configs, ending_configs = _load_composite_configs(params)
+    return plan_full_video(
+        main_configs, intro_configs, ending_configs,
+        style_config=load_style_config(game_type=game_type),
+        resolution=tuple(params['video_res']),
+        trans_enable=params.get('trans_enable', True),
+        trans_time=params.get('trans_time', 1.0),
+        full_last_clip=params.get('full_last_clip', False),
+        video_output_path=_output_dir(params),
+        force_render=params.get('force_render', False)
+    )
+
+
+def render_full_video_job(params: Dict, ctx) -> Dict:
+    """渲染完整视频；params['incremental']为True时复用已渲染的片段增量拼接（见utils/clip_assembly.py）"""
+    from utils.VideoUtils import render_complete_full_video
+    game_type = params['game_type']
+    main_configs, intro_configs, ending_configs = _load_composite_configs(params)
+    ctx.report(0.0, "正在合成完整视频……", force=True)
+    if params.get('incremental'):
+        from utils.clip_assembly import assemble_full_video_from_clips
+        return assemble_full_video_from_clips(
+            username=params['username'],
+            game_type=game_type,
+            main_configs=main_configs,
+            intro_configs=intro_configs,
+            ending_configs=ending_configs,
+            style_config=load_style_config(game_type=game_type),
+            video_output_path=_output_dir(params),
+            video_res=tuple(params['video_res']),
+            video_bitrate=params['video_bitrate'],
+            video_trans_enable=params.get('trans_enable', True),
+            video_trans_time=params.get('trans_time', 1.0),
+            full_last_clip=params.get('full_last_clip', False),
+            progress_callback=lambda progress, message: ctx.report(progress, message, force=True)
+        )
+    return render_complete_full_video(
+        username=params['username'],
+        game_type=game_type,
+        main_configs=main_configs,
+        intro_configs=intro_configs,
+        ending_configs=ending_configs,
+        style_config=load_style_config(game_type=game_type),
+        video_output_path=_output_dir(params),
+        video_res=tuple(params['video_res']),
+        video_bitrate=params['video_bitrate'],
+        video_trans_enable=params.get('trans_enable', True),
+        video_trans_time=params.get('trans_time', 1.0),
+        full_last_clip=params.get('full_last_clip', False),
+        logger=JobProgressLogger(ctx)
+    )
+
+
+def render_one_clip_job(params: Dict, ctx) -> Dict:
+    """导出单个视频片段"""
+    from utils.VideoUtils import render_one_video_clip
+    game_type = params['game_type']
+    ctx.report(0.0, f"正在导出视频片段 {params.get('video_file_name')}", force=True)
+    return render_one_video_clip(
+        game_type=game_type,
+        config=params['config'],
+        style_config=load_style_config(game_type=game_type),
+        video_file_name=params.get('video_file_name'),
+        video_output_path=params['video_output_path'],
+        video_res=tuple(params['video_res']),
+        video_bitrate=params['video_bitrate']
+    )
+
+
+def generate_images_job(params: Dict, ctx) -> Dict:
+    """生成存档所有成绩的背景图片"""
+    from utils.ImageUtils import generate_single_image
+    from utils.VideoUtils import save_jacket_background_image
+    db_handler = get_database_handler()
+    archive_id = params['archive_id']
+    image_dir = params['image_dir']
+    os.makedirs(image_dir, exist_ok=True)
+
+    ctx.report(0.0, "正在获取资源数据……", force=True)
+    game_type, records = db_handler.load_archive_for_image_generation(archive_id)
+    style_config = load_style_config(game_type=game_type)
+    data_name = "B30" if game_type == "chunithm" else "B50"
+
+    for index, record_detail in enumerate(records):
+        chart_id = record_detail['chart_id']
+        ctx.report(index / len(records), f"正在生成{data_name}成绩背景图片({index + 1}/{len(records)})")
+        record_for_gene_image = deepcopy(record_detail)
+        clip_name = record_for_gene_image['clip_name']
+        # 标题名称与配置文件中的clip_name一致
+        if "_" in clip_name:
+            prefix = clip_name.split("_")[0]
+            suffix_number = clip_name.split("_")[1]
+            title_text = f"{prefix} {suffix_number}"
+        else:
+            title_text = record_for_gene_image['clip_name']
+        # 按照顺序命名生成图片为 gametype_0_标题.png, gametype_1_标题.png ...
+        image_save_path = os.path.join(image_dir, f"{game_type}_{index}_{title_text}.png")
+        generate_single_image(
+            game_type,
+            style_config,
+            record_for_gene_image,
+            image_save_path,
+            title_text
+        )
+        image_path_data = {'achievement_image_path': image_save_path}
+        if game_type == "maimai":
+            # 生成曲绘图片的模糊背景
+            jacket_img_data = record_for_gene_image['jacket']  # type - PIL.Image
+            bg_save_path = os.path.join(image_dir, f"{game_type}_{chart_id}_bg.png")
+            # 如果已经存在背景图片（同一首曲目），则跳过生成
+            if not os.path.exists(bg_save_path):
+                save_jacket_background_image(jacket_img_data, bg_save_path)
+            # 保存背景图片路径到background_image_path字段，便于视频生成调用
+            image_path_data['background_image_path'] = bg_save_path
+        db_handler.update_image_config_for_record(archive_id, chart_id=chart_id, image_path_data=image_path_data)
+    return {"status": "success", "info": f"生成{data_name}成绩背景图片完成，共 {len(records)} 张"}
+
+
+def build_downloader(config: Dict):
+    """
+    按全局配置创建下载器（与搜索页面保存的下载器配置一致）
+
+    页面提交任务前会先初始化一次下载器（完成登录并缓存凭据），worker中直接加载已缓存的凭据
+    """
+    from utils.video_crawler import PurePytubefixDownloader, BilibiliDownloader
+    downloader = config.get('DOWNLOADER', 'bilibili')
+    proxy = config.get('PROXY_ADDRESS') if config.get('USE_PROXY', False) else None
+    search_max_results = config.get('SEARCH_MAX_RESULTS', 3)
+    if downloader == "youtube":
+        use_api = config.get('USE_YOUTUBE_API', False)
+        use_potoken = not use_api and (config.get('USE_CUSTOM_PO_TOKEN', False) or config.get('USE_AUTO_PO_TOKEN', False))
+        return PurePytubefixDownloader(
+            proxy=proxy,
+            use_potoken=use_potoken,
+            use_oauth=not use_api and config.get('USE_OAUTH', False),
+            auto_get_potoken=not use_api and config.get('USE_AUTO_PO_TOKEN', False),
+            search_max_results=search_max_results,
+            use_api=use_api,
+            api_key=config.get('YOUTUBE_API_KEY') if use_api else None
+        )
+    elif downloader == "bilibili":
+        return BilibiliDownloader(
+            proxy=proxy,
+            no_credential=config.get('NO_BILIBILI_CREDENTIAL', False),
+            credential_path="./cred_datas/bilibili_cred.pkl",
+            search_max_results=search_max_results
+        )
+    raise ValueError(f"未配置正确的下载器: {downloader}")
+
+
+def search_videos_job(params: Dict, ctx) -> Dict:
+    """
+    搜索存档中所有谱面的确认视频，跳过params['skip_chart_ids']中已有搜索结果的谱面
+
+    Returns:
+        result["search_results"]: {chart_id: 搜索结果}
+    """
+    from utils.search_scheduler import SearchScheduler, build_search_limiter
+    config = read_global_config()
+    downloader_type = config.get('DOWNLOADER', 'bilibili')
+    db_handler = get_database_handler()
+    chart_list = db_handler.load_charts_of_archive_records(params['username'], params['archive_name'])
+    skip_chart_ids = set(params.get('skip_chart_ids', []))
+    pending_charts = [chart for chart in chart_list if chart['chart_id'] not in skip_chart_ids]
+
+    ctx.report(0.0, "正在初始化下载器……", force=True)
+    dl_instance = build_downloader(config)
+    # 所有搜索线程共享同一个令牌桶，总体请求频率与搜索间隔设置保持一致，以减少被检测为bot的风险
+    limiter = build_search_limiter(downloader_type, config.get('SEARCH_WAIT_TIME'),
+                                   config.get('SEARCH_RATE_LIMITS', {}).get(downloader_type))
+    scheduler = SearchScheduler(dl_instance, limiter, max_workers=config.get('SEARCH_CONCURRENCY', 3))
+
+    search_results = {}
+    for i, (_, chart, ret_data, output_info) in enumerate(scheduler.run(pending_charts), start=1):
+        search_results[chart['chart_id']] = ret_data
+        ctx.report(i / len(pending_charts), f"【{i}/{len(pending_charts)}】{output_info}", force=True)
+    return {"status": "success", "info": f"搜索完成，共搜索 {len(pending_charts)} 个谱面",
+            "search_results": search_results}
+
+
+def download_videos_job(params: Dict, ctx) -> Dict:
+    """
+    下载params['charts_data']中各谱面已确定的视频
+
+    params['full_download']为True时忽略片段下载设置，完整下载视频（替换已有的片段文件）
+    """
+    from utils.download_manager import DownloadManager
+    config = read_global_config()
+    db_handler = get_database_handler()
+    charts_data = params['charts_data']
+    segment_only = config.get('DOWNLOAD_SEGMENT_ONLY', False) and not params.get('full_download', False)
+
+    ctx.report(0.0, "正在初始化下载器……", force=True)
+    manager = DownloadManager(build_downloader(config), db_handler, "./videos/downloads",
+                              high_res=config.get('DOWNLOAD_HIGH_RES', True),
+                              max_workers=config.get('DOWNLOAD_CONCURRENCY', 2),
+                              wait_time=config.get('SEARCH_WAIT_TIME'),
+                              segment_margin=config.get('SEGMENT_FETCH_MARGIN', 5))
+    record_len = len(charts_data)
+    done, failed = 0, 0
+    # 按谱面在视频中的顺序设置优先级，最先需要的谱面最先下载
+    for index, song in enumerate(charts_data):
+        c_id = song['chart_id']
+        if not song.get('video_info_match'):
+            done += 1
+            continue
+        # 自动进行一次数据库保存
+        db_handler.update_chart_video_metadata(c_id, song['video_info_match'])
+        # 片段下载模式：确定（必要时生成）截取区间，只下载该区间附近的片段
+        video_slice = None
+        if segment_only:
+            video_slice = db_handler.ensure_video_slice(song['archive_id'], c_id,
+                                                        config['CLIP_PLAY_TIME'],
+                                                        config['CLIP_START_INTERVAL'])
+        manager.submit(song, priority=index, video_slice=video_slice)
+
+    try:
+        for song, result in manager.run():
+            done += 1
+            if result.get('status') == 'error':
+                failed += 1
+            ctx.report(done / record_len, f"【{done}/{record_len}】{result['info']}", force=True)
+    finally:
+        manager.cancel()
+    return {"status": "success", "info": f"下载完成，{failed} 个视频下载失败" if failed else "下载完成"}
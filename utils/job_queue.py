@@ -0,0 +1,266 @@
+"""
+后台任务队列
+
+渲染、搜索、下载、生成图片等耗时任务不在Streamlit脚本线程中执行，而是写入数据库的jobs表，
+由独立的worker进程按提交顺序执行：
+- 页面只负责提交任务、轮询进度和取消任务，刷新页面或关闭标签页不影响正在执行的任务，
+  重新打开页面后可按用户/存档重新找到任务
+- 每个worker进程同一时间只执行一个任务，任务在单独的子进程中运行，取消时直接结束子进程
+- worker定期写入心跳，worker异常退出后其正在执行的任务会被标记为失败
+
+任务处理函数注册在JOB_HANDLERS中（见utils/job_handlers.py），签名为 handler(params, ctx) -> result，
+通过ctx.report(progress, message)汇报进度；返回值需可JSON序列化，保存到任务的result字段。
+
+独立启动worker: python -m utils.job_queue [--db 数据库路径] [--types 任务类型,...]
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from db_utils.DatabaseManager import DatabaseManager
+from utils.profiling import save_report, span, start_recording, stop_recording
+
+DEFAULT_DB_PATH = "mai_gen_videob50.db"
+
+# 任务类型 -> 处理函数（"模块:函数"），在执行任务时才导入，页面提交任务时无需加载渲染相关的依赖
+JOB_HANDLERS = {
+    "render_clips": "utils.job_handlers:render_clips_job",
+    "render_full_video": "utils.job_handlers:render_full_video_job",
+    "render_one_clip": "utils.job_handlers:render_one_clip_job",
+    "generate_images": "utils.job_handlers:generate_images_job",
+    "search_videos": "utils.job_handlers:search_videos_job",
+    "download_videos": "utils.job_handlers:download_videos_job",
+}
+
+JOB_TYPE_TEXT = {
+    "render_clips": "生成视频片段",
+    "render_full_video": "生成完整视频",
+    "render_one_clip": "导出视频片段",
+    "generate_images": "生成成绩图片",
+    "search_videos": "搜索谱面视频",
+    "download_videos": "下载谱面视频",
+}
+
+JOB_STATUS_TEXT = {
+    "queued": "排队中",
+    "running": "执行中",
+    "succeeded": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+ACTIVE_JOB_STATUSES = ["queued", "running"]
+
+WORKER_POLL_INTERVAL = 2  # worker轮询新任务和取消请求的间隔（秒）
+JOB_STALE_SECONDS = 60  # 超过该时间没有心跳的worker视为已退出
+PROGRESS_REPORT_INTERVAL = 0.5  # 进度写入数据库的最小间隔（秒）
+
+_last_spawn_time = 0.0
+
+
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+class JobContext:
+    """传给任务处理函数的上下文，用于汇报进度和检查取消请求"""
+    def __init__(self, db: DatabaseManager, job: Dict):
+        self.db = db
+        self.job_id = job['id']
+        self.job = job
+        self._last_report = 0.0
+
+    def report(self, progress: Optional[float] = None, message: Optional[str] = None, force: bool = False):
+        """
+        汇报进度（0~1）和当前状态信息；任务已被取消时抛出JobCancelled
+
+        为避免频繁写库，距上次写入不足PROGRESS_REPORT_INTERVAL秒的汇报会被忽略（force=True时除外）
+        """
+        if message:
+            print(f"[任务 {self.job_id}] {message}")
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_REPORT_INTERVAL:
+            return
+        self._last_report = now
+        self.db.update_job_progress(self.job_id, progress, message)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.db.is_job_cancel_requested(self.job_id):
+            raise JobCancelled()
+
+
+def _load_handler(job_type: str) -> Callable[[Dict, JobContext], Any]:
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"未知的任务类型: {job_type}")
+    module_name, func_name = JOB_HANDLERS[job_type].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def submit_job(job_type: str, params: Dict, username: str = None, archive_id: int = None,
+               db: Optional[DatabaseManager] = None) -> int:
+    """提交后台任务，返回任务id；params需可JSON序列化"""
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"未知的任务类型: {job_type}")
+    db = db or DatabaseManager(DEFAULT_DB_PATH)
+    job_id = db.create_job(job_type, params, username=username, archive_id=archive_id)
+    print(f"已提交后台任务 {job_id}: {job_type}")
+    return job_id
+
+
+def get_job(job_id: int, db: Optional[DatabaseManager] = None) -> Optional[Dict]:
+    return (db or DatabaseManager(DEFAULT_DB_PATH)).get_job(job_id)
+
+
+def list_jobs(username: str = None, archive_id: int = None, statuses: List[str] = None,
+              job_types: List[str] = None, limit: int = 50, db: Optional[DatabaseManager] = None) -> List[Dict]:
+    return (db or DatabaseManager(DEFAULT_DB_PATH)).list_jobs(username, archive_id, statuses, job_types, limit)
+
+
+def cancel_job(job_id: int, db: Optional[DatabaseManager] = None) -> Optional[str]:
+    """取消任务，排队中的任务立即取消，执行中的任务由worker结束；返回取消后的任务状态"""
+    return (db or DatabaseManager(DEFAULT_DB_PATH)).request_job_cancel(job_id)
+
+
+def _execute_job(db_path: str, job_id: int):
+    """在子进程中执行单个任务，并将各阶段耗时报告保存到 profiles/job_{id}.json（见utils/profiling.py）"""
+    db = DatabaseManager(db_path)
+    job = db.get_job(job_id)
+    ctx = JobContext(db, job)
+    recorder = start_recording()
+
+    def finish(status, message, result=None):
+        stop_recording()
+        try:
+            profile = save_report(recorder, f"job_{job_id}")
+        except OSError as e:
+            print(f"Warning: 保存任务{job_id}的耗时报告失败: {e}")
+            profile = {}
+        if profile:
+            print(f"任务{job_id}的耗时报告已保存到: {profile['report']}")
+            if isinstance(result, dict):
+                result = {**result, "profile": profile}
+            elif result is None:
+                result = {"profile": profile}
+        db.finish_job(job_id, status, message, result)
+
+    try:
+        handler = _load_handler(job['job_type'])
+        with span(f"job.{job['job_type']}", job_id=job_id):
+            result = handler(job['params'], ctx)
+        if db.is_job_cancel_requested(job_id):
+            # 部分处理函数会捕获异常并返回错误信息，取消请求优先
+            finish("cancelled", "任务已取消")
+        elif isinstance(result, dict) and result.get("status") == "error":
+            finish("failed", result.get("info"), result)
+        else:
+            info = result.get("info") if isinstance(result, dict) else None
+            finish("succeeded", info or "任务已完成", result)
+    except JobCancelled:
+        finish("cancelled", "任务已取消")
+    except Exception as e:
+        traceback.print_exc()
+        finish("failed", f"任务执行失败: {e}", {"traceback": traceback.format_exc()})
+
+
+def _run_job_process(db: DatabaseManager, db_path: str, worker_id: str, job: Dict, poll_interval: float):
+    """启动子进程执行任务，并在等待期间维持心跳、响应取消请求"""
+    job_id = job['id']
+    print(f"[worker {worker_id}] 开始执行任务 {job_id}: {job['job_type']}")
+    process = multiprocessing.get_context("spawn").Process(target=_execute_job, args=(db_path, job_id))
+    process.start()
+    while True:
+        process.join(poll_interval)
+        if not process.is_alive():
+            break
+        db.update_worker_heartbeat(worker_id, os.getpid())
+        db.update_job_progress(job_id)
+        if db.is_job_cancel_requested(job_id):
+            print(f"[worker {worker_id}] 正在取消任务 {job_id}")
+            process.terminate()
+            process.join()
+            db.finish_job(job_id, "cancelled", "任务已取消")
+            return
+
+    job = db.get_job(job_id)
+    if job and job['status'] == "running":
+        # 子进程没有写入结果就退出了（如被系统结束）
+        db.finish_job(job_id, "failed", f"任务进程异常退出，退出码: {process.exitcode}")
+    print(f"[worker {worker_id}] 任务 {job_id} 结束")
+
+
+def run_worker(db_path: str = DEFAULT_DB_PATH, job_types: Optional[List[str]] = None,
+               poll_interval: float = WORKER_POLL_INTERVAL, once: bool = False):
+    """
+    worker主循环：按提交顺序领取并执行任务
+
+    Args:
+        job_types: 只执行这些类型的任务，不提供时执行所有类型
+        once: 队列为空时退出（用于命令行或测试）
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    db = DatabaseManager(db_path)
+    db.check_and_apply_migrations()
+    print(f"[worker {worker_id}] 已启动，等待任务...")
+    try:
+        while True:
+            db.update_worker_heartbeat(worker_id, os.getpid())
+            db.fail_stale_jobs(JOB_STALE_SECONDS)
+            job = db.claim_next_job(worker_id, job_types)
+            if job:
+                _run_job_process(db, db_path, worker_id, job, poll_interval)
+            elif once:
+                break
+            else:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.remove_worker(worker_id)
+        print(f"[worker {worker_id}] 已退出")
+
+
+def ensure_workers(count: int = 1, db_path: str = DEFAULT_DB_PATH) -> int:
+    """
+    确保至少有count个worker进程在运行，不足时启动新的worker进程
+
+    worker进程独立于Streamlit会话运行，页面刷新或Streamlit重新运行脚本不会影响它们。
+    Returns:
+        新启动的worker数量
+    """
+    global _last_spawn_time
+    # 刚启动的worker可能尚未写入心跳，短时间内不重复启动
+    if time.time() - _last_spawn_time < JOB_STALE_SECONDS:
+        return 0
+    db = DatabaseManager(db_path)
+    missing = count - len(db.get_live_workers(JOB_STALE_SECONDS))
+    if missing <= 0:
+        return 0
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    for _ in range(missing):
+        subprocess.Popen([sys.executable, "-m", "utils.job_queue", "--db", os.path.abspath(db_path)],
+                         cwd=project_root, **kwargs)
+    _last_spawn_time = time.time()
+    print(f"已启动 {missing} 个后台任务worker进程")
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后台任务worker")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="数据库路径")
+    parser.add_argument("--types", default=None, help="只执行这些类型的任务，以逗号分隔")
+    parser.add_argument("--once", action="store_true", help="队列为空时退出")
+    args = parser.parse_args()
+    run_worker(args.db, args.types.split(",") if args.types else None, once=args.once)
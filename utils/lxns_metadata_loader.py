@@ -3,6 +3,7 @@
 用于从落雪查分器API获取中二节奏曲目列表并保存为metadata文件
 """
 import requests
+from utils import http_client
 import json
 import os
 from typing import Optional, Dict, List
@@ -41,7 +42,7 @@ def fetch_song_list_from_lxns(api_key: Optional[str] = None, version: Optional[i
         headers['Authorization'] = api_key
     
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = http_client.get(url, headers=headers, params=params, timeout=30)
         
         if response.status_code == 200:
             return response.json()
@@ -162,7 +163,8 @@ def save_lxns_metadata_to_file(data: Dict, output_file: Optional[str] = None) ->
         return False
 
 
-def update_chunithm_metadata_from_lxns(api_key: Optional[str] = None, version: Optional[int] = None, notes: bool = False) -> bool:
+def update_chunithm_metadata_from_lxns(api_key: Optional[str] = None, version: Optional[int] = None, notes: bool = False,
+                                       refresh_levels: bool = True) -> bool:
     """
     从落雪查分器API获取曲目列表并更新本地metadata文件
     
@@ -170,6 +172,7 @@ def update_chunithm_metadata_from_lxns(api_key: Optional[str] = None, version: O
         api_key: 开发者API密钥（可选）
         version: 游戏版本（可选）
         notes: 是否包含谱面物量（可选，默认False）
+        refresh_levels: 更新成功后，是否批量刷新数据库中定数发生变化的谱面及相关记录的rating（默认True）
     
     Returns:
         是否更新成功
@@ -186,12 +189,24 @@ def update_chunithm_metadata_from_lxns(api_key: Optional[str] = None, version: O
         print("✗ 获取曲目列表失败")
         return False
     
+    # 记录更新前的曲目，更新后只需处理发生变化的歌曲
+    from utils.metadata_updater import load_local_songs, apply_song_diff, diff_songs
+    old_songs = load_local_songs(CHUNITHM_METADATA_FILE)
+    
     # 保存数据
     print("\n正在保存曲目列表到本地文件...")
     success = save_lxns_metadata_to_file(data)
     
     if success:
         print("\n✓ 曲目列表更新成功!")
+        if refresh_levels:
+            try:
+                new_songs = [convert_lxns_song_to_metadata_format(song) for song in data.get('songs', [])]
+                diff = diff_songs("chunithm", old_songs, new_songs)
+                print(f"  - 新增 {len(diff['added'])} 首，删除 {len(diff['removed'])} 首，变化 {len(diff['changed'])} 首")
+                apply_song_diff("chunithm", diff, new_songs)
+            except Exception as e:
+                print(f"✗ 刷新数据库中的定数失败: {e}")
         return True
     else:
         print("\n✗ 曲目列表更新失败")
@@ -0,0 +1,142 @@
+"""
+乐曲元数据更新后的定数批量刷新（re-level）
+
+元数据（maimai的dxdata.json、中二节奏的lxns_songs.json）更新后，数据库中charts.difficulty
+以及各存档记录的dx_rating/chuni_rating可能已经过期。本模块：
+1. 从元数据构造定数表 {(song_id, chart_type, level_index): 定数}，可与旧元数据的定数表比较得到变化的谱面
+2. 将定数表与数据库中所有谱面的定数比较，只更新发生变化的谱面
+3. 使用rating_engine批量重新计算受影响记录的rating，并重新统计best存档的总rating
+所有数据库更新在同一个事务中完成，不经过逐条记录加载存档的流程。
+"""
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from db_utils.DatabaseManager import DatabaseManager
+from utils.DataUtils import chart_type_str2value, level_label_to_index, load_songs_metadata
+from utils.rating_engine import compute_chunithm_ratings, compute_ratings
+
+LevelKey = Tuple[str, int, int]
+
+
+def _normalize_song_id(game_type: str, song_id) -> str:
+    song_id = str(song_id)
+    if game_type == "chunithm" and song_id.startswith("chunithm_"):
+        return song_id[len("chunithm_"):]
+    return song_id
+
+
+def build_level_table(game_type: str, songs: Optional[List[Dict]] = None) -> Dict[LevelKey, float]:
+    """
+    从元数据构造定数表
+
+    Args:
+        songs: 元数据中的歌曲列表，不提供时读取本地元数据文件
+    """
+    if songs is None:
+        songs = load_songs_metadata(game_type)
+    table = {}
+    for song in songs:
+        if game_type == "maimai":
+            # 数据库中maimai谱面的song_id可能为元数据的songId或曲名
+            song_ids = {song.get('songId'), song.get('title')}
+        else:
+            song_ids = {song.get('id')}
+        song_ids = {_normalize_song_id(game_type, s) for s in song_ids if s not in (None, '')}
+        for sheet in song.get('sheets', []):
+            level = sheet.get('internalLevelValue')
+            if level is None:
+                continue
+            level_index = level_label_to_index(game_type, sheet.get('difficulty', ''))
+            chart_type = chart_type_str2value(sheet.get('type', 'std')) if game_type == "maimai" else 0
+            for song_id in song_ids:
+                table[(song_id, chart_type, level_index)] = float(level)
+    return table
+
+
+def diff_level_tables(old: Dict[LevelKey, float], new: Dict[LevelKey, float]) -> Set[LevelKey]:
+    """返回新元数据中定数发生变化或新增的谱面"""
+    return {key for key, level in new.items() if old.get(key) != level}
+
+
+def _parse_level(difficulty) -> Optional[float]:
+    try:
+        return float(difficulty)
+    except (TypeError, ValueError):
+        return None
+
+
+def refresh_internal_levels(game_type: str, level_table: Optional[Dict[LevelKey, float]] = None,
+                            changed_keys: Optional[Iterable[LevelKey]] = None,
+                            db: Optional[DatabaseManager] = None) -> Dict:
+    """
+    按最新元数据批量刷新数据库中的谱面定数、记录rating和存档总rating
+
+    Args:
+        level_table: 新元数据的定数表，不提供时读取本地元数据文件
+        changed_keys: diff_level_tables的结果；提供时只检查这些谱面
+        db: 数据库管理器，不提供时使用默认数据库
+
+    Returns:
+        dict: {"charts", "records", "archives", "elapsed"}，分别为更新的谱面数、记录数、存档数和耗时（秒）
+    """
+    start_time = time.perf_counter()
+    if level_table is None:
+        level_table = build_level_table(game_type)
+    if changed_keys is not None:
+        changed_keys = set(changed_keys)
+    if db is None:
+        db = DatabaseManager()
+
+    # 1. 找出定数发生变化的谱面
+    chart_ids, chart_levels = [], []
+    for chart in db.get_charts_by_game_type(game_type):
+        candidates = [chart['song_id'], chart['song_name']] if game_type == "maimai" else [chart['song_id']]
+        for song_id in candidates:
+            if song_id in (None, ''):
+                continue
+            key = (_normalize_song_id(game_type, song_id), chart['chart_type'], chart['level_index'])
+            if key not in level_table:
+                continue
+            if changed_keys is None or key in changed_keys:
+                new_level = level_table[key]
+                if _parse_level(chart['difficulty']) != new_level:
+                    chart_ids.append(chart['id'])
+                    chart_levels.append(new_level)
+            break
+
+    summary = {"charts": len(chart_ids), "records": 0, "archives": 0}
+    if chart_ids:
+        # 2. 批量重新计算受影响记录的rating
+        records = db.get_records_of_charts(chart_ids)
+        order = np.argsort(chart_ids)
+        sorted_chart_ids = np.asarray(chart_ids, dtype=np.int64)[order]
+        sorted_levels = np.asarray(chart_levels, dtype=np.float64)[order]
+
+        record_ratings = []
+        archive_ids = set()
+        if records:
+            record_ids = [r['id'] for r in records]
+            record_chart_ids = np.fromiter((r['chart_id'] for r in records), dtype=np.int64, count=len(records))
+            achievements = np.fromiter((r['achievement'] or 0 for r in records), dtype=np.float64, count=len(records))
+            ds = sorted_levels[np.searchsorted(sorted_chart_ids, record_chart_ids)]
+            if game_type == "maimai":
+                ratings = compute_ratings(ds, achievements).tolist()
+            else:
+                ratings = compute_chunithm_ratings(ds, achievements).tolist()
+            record_ratings = list(zip(ratings, record_ids))
+            archive_ids = {r['archive_id'] for r in records}
+
+        # 3. 在同一事务中写回谱面定数、记录rating和存档总rating
+        db.apply_chart_level_updates(game_type,
+                                     list(zip((str(level) for level in chart_levels), chart_ids)),
+                                     record_ratings, sorted(archive_ids))
+        summary["records"] = len(record_ratings)
+        summary["archives"] = len(archive_ids)
+
+    summary["elapsed"] = time.perf_counter() - start_time
+    print(f"[定数刷新] {game_type}: 更新了 {summary['charts']} 个谱面的定数，"
+          f"重新计算了 {summary['records']} 条记录（涉及 {summary['archives']} 个存档）的rating，"
+          f"耗时 {summary['elapsed']:.3f} 秒")
+    return summary
@@ -0,0 +1,222 @@
+"""
+乐曲元数据的条件更新
+
+- 每个数据源的ETag/Last-Modified和内容哈希保存在METADATA_STATE_FILE中，更新时发送条件请求，
+  服务器返回304（或内容与上次相同）时不下载、不改写本地文件
+- 元数据发生变化时按歌曲计算差异（新增/删除/变化），只对变化的歌曲：
+  1. 增量更新dxnet_extension中共享的歌曲索引，不重新加载整个元数据文件
+  2. 使用metadata_relevel只刷新数据库中定数发生变化的谱面及相关记录的rating
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from utils import http_client
+
+METADATA_STATE_FILE = "./music_metadata/metadata_sources.json"
+MAIMAI_METADATA_FILE = "./music_metadata/maimaidx/dxdata.json"
+MAIMAI_DXDATA_URL = "https://raw.githubusercontent.com/gekichumai/dxrating/main/packages/dxdata/dxdata.json"
+METADATA_FETCH_TIMEOUT = 60
+
+
+def load_source_state() -> Dict:
+    """读取各数据源的缓存校验信息 {source: {"etag", "last_modified", "sha256", "checked_at"}}"""
+    if os.path.exists(METADATA_STATE_FILE):
+        try:
+            with open(METADATA_STATE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+    return {}
+
+
+def save_source_state(state: Dict):
+    os.makedirs(os.path.dirname(METADATA_STATE_FILE), exist_ok=True)
+    with open(METADATA_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+
+def conditional_fetch(url: str, validators: Optional[Dict], headers: Optional[Dict] = None,
+                      params: Optional[Dict] = None) -> Tuple[Optional[bytes], Dict]:
+    """
+    发送条件请求获取数据源内容
+
+    Args:
+        validators: 上次保存的校验信息，为None时（如本地文件不存在）发送普通请求
+
+    Returns:
+        (content, validators): 内容未变化时content为None；validators为需要保存的新校验信息
+    """
+    validators = validators or {}
+    request_headers = dict(headers or {})
+    if validators.get("etag"):
+        request_headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        request_headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = http_client.get(url, headers=request_headers, params=params, timeout=METADATA_FETCH_TIMEOUT)
+    new_validators = {**validators, "checked_at": time.time()}
+    if response.status_code == 304:
+        return None, new_validators
+    response.raise_for_status()
+
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    new_validators.update({
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": digest,
+    })
+    # 服务器不支持条件请求时，内容哈希相同也视为未变化
+    if digest == validators.get("sha256"):
+        return None, new_validators
+    return content, new_validators
+
+
+def _song_key(game_type: str, song: Dict) -> str:
+    if game_type == "maimai":
+        return str(song.get("songId") or song.get("title"))
+    return str(song.get("id"))
+
+
+def diff_songs(game_type: str, old_songs: Iterable[Dict], new_songs: Iterable[Dict]) -> Dict[str, List]:
+    """
+    按歌曲比较新旧元数据
+
+    Returns:
+        dict: {"added": [新歌曲], "removed": [旧歌曲], "changed": [(旧歌曲, 新歌曲)]}
+    """
+    old_by_key = {_song_key(game_type, s): s for s in old_songs}
+    new_by_key = {_song_key(game_type, s): s for s in new_songs}
+    diff = {"added": [], "removed": [], "changed": []}
+    for key, song in new_by_key.items():
+        old = old_by_key.get(key)
+        if old is None:
+            diff["added"].append(song)
+        elif old != song:
+            diff["changed"].append((old, song))
+    diff["removed"] = [song for key, song in old_by_key.items() if key not in new_by_key]
+    return diff
+
+
+def apply_song_diff(game_type: str, diff: Dict[str, List], new_songs: List[Dict],
+                    previous_mtime: Optional[float] = None, refresh_levels: bool = True) -> Dict:
+    """
+    将元数据差异应用到内存中的歌曲索引和数据库
+
+    Args:
+        new_songs: 更新后的完整歌曲列表
+        previous_mtime: 改写元数据文件前的修改时间，用于判断内存中的歌曲索引是否可以增量更新
+
+    Returns:
+        dict: metadata_relevel.refresh_internal_levels的统计结果，没有定数变化时为空字典
+    """
+    old_subset = diff["removed"] + [old for old, _ in diff["changed"]]
+    new_subset = diff["added"] + [new for _, new in diff["changed"]]
+
+    if game_type == "maimai":
+        from utils.dxnet_extension import patch_song_index
+        titles = {s.get("title") for s in old_subset} | {s.get("title") for s in new_subset}
+        # 同名歌曲共用索引中的曲名键，需要一并重建
+        patch_song_index(titles, [s for s in new_songs if s.get("title") in titles], previous_mtime)
+
+    if not refresh_levels:
+        return {}
+    from utils.metadata_relevel import build_level_table, diff_level_tables, refresh_internal_levels
+    new_levels = build_level_table(game_type, new_subset)
+    changed_keys = diff_level_tables(build_level_table(game_type, old_subset), new_levels)
+    if not changed_keys:
+        return {}
+    return refresh_internal_levels(game_type, new_levels, changed_keys)
+
+
+def load_local_songs(file_path: str) -> List[Dict]:
+    if not os.path.exists(file_path):
+        return []
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("songs", [])
+    except (OSError, json.JSONDecodeError, AttributeError) as e:
+        print(f"读取本地元数据失败: {e}，将视为全部歌曲已变化")
+        return []
+
+
+def _write_atomic(file_path: str, content: bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    os.replace(temp_path, file_path)
+
+
+def update_metadata_source(game_type: str, force: bool = False, api_key: Optional[str] = None,
+                           refresh_levels: bool = True) -> Dict:
+    """
+    使用条件请求更新单个游戏的乐曲元数据
+
+    Args:
+        game_type: "maimai"（dxdata.json）或 "chunithm"（落雪查分器曲目列表）
+        force: 忽略已保存的校验信息，重新下载
+        api_key: 落雪查分器开发者API密钥（可选）
+
+    Returns:
+        dict: {"status": "updated"/"not_modified"/"error", "info", "added", "removed", "changed"}
+    """
+    from utils.lxns_metadata_loader import (CHUNITHM_METADATA_FILE, LXNS_API_BASE_URL,
+                                            LXNS_SONG_LIST_ENDPOINT, convert_lxns_song_to_metadata_format,
+                                            save_lxns_metadata_to_file)
+    if game_type == "maimai":
+        url, local_file, headers = MAIMAI_DXDATA_URL, MAIMAI_METADATA_FILE, {}
+    elif game_type == "chunithm":
+        url, local_file = f"{LXNS_API_BASE_URL}{LXNS_SONG_LIST_ENDPOINT}", CHUNITHM_METADATA_FILE
+        headers = {"Authorization": api_key} if api_key else {}
+    else:
+        raise ValueError(f"Unsupported game type: {game_type}")
+
+    result = {"status": "not_modified", "info": "", "added": 0, "removed": 0, "changed": 0}
+    state = load_source_state()
+    # 本地文件不存在时不能依赖服务器的304
+    validators = None if force or not os.path.exists(local_file) else state.get(game_type)
+    try:
+        content, new_validators = conditional_fetch(url, validators, headers=headers)
+        if content is None:
+            result["info"] = f"{game_type} 乐曲元数据未变化"
+        else:
+            data = json.loads(content)
+            old_songs = load_local_songs(local_file)
+            previous_mtime = os.path.getmtime(local_file) if os.path.exists(local_file) else None
+            if game_type == "maimai":
+                new_songs = data.get("songs", [])
+                if not isinstance(new_songs, list) or not new_songs:
+                    raise ValueError("dxdata.json中没有歌曲数据")
+                _write_atomic(local_file, content)
+            else:
+                new_songs = [convert_lxns_song_to_metadata_format(song) for song in data.get("songs", [])]
+                if not save_lxns_metadata_to_file(data, local_file):
+                    raise OSError(f"保存 {local_file} 失败")
+
+            diff = diff_songs(game_type, old_songs, new_songs)
+            result.update({"status": "updated", "added": len(diff["added"]),
+                           "removed": len(diff["removed"]), "changed": len(diff["changed"])})
+            result["info"] = (f"{game_type} 乐曲元数据已更新：新增 {result['added']} 首，"
+                              f"删除 {result['removed']} 首，变化 {result['changed']} 首")
+            try:
+                apply_song_diff(game_type, diff, new_songs, previous_mtime, refresh_levels)
+            except Exception as e:
+                # 元数据文件已更新，可之后使用scripts/refresh_internal_levels.py重新刷新定数
+                result["info"] += f"（刷新数据库中的定数失败: {e}）"
+        state[game_type] = new_validators
+        save_source_state(state)
+    except (requests.exceptions.RequestException, ValueError, OSError) as e:
+        result.update({"status": "error", "info": f"更新 {game_type} 乐曲元数据失败: {e}"})
+    print(result["info"])
+    return result
+
+
+def update_all_metadata(game_types: Iterable[str] = ("maimai", "chunithm"), force: bool = False) -> Dict[str, Dict]:
+    """依次更新各游戏的乐曲元数据，返回 {game_type: update_metadata_source的结果}"""
+    return {game_type: update_metadata_source(game_type, force=force) for game_type in game_types}
@@ -0,0 +1,329 @@
+"""
+命令行批量生成流水线（不依赖Streamlit页面）
+
+按顺序执行页面中的各个步骤：
+    fetch    从查分器获取数据并创建新存档（Setup_Achievements）
+    images   生成成绩背景图片（Generate_Pic_Resources）
+    search   搜索谱面确认视频，并将第一条搜索结果作为匹配视频（Search_For_Videos）
+    download 下载匹配的视频（Confirm_Videos）
+    render   生成默认片段配置并生成视频（Edit_Video_Content、Composite_Videos）
+
+使用--dry-run时只读取已有存档，render步骤只输出时间线规划（plan事件），其他步骤全部跳过；
+不访问网络，也不写入数据库（不执行数据库迁移、不保存默认片段配置）。
+
+images与search、download互不依赖，会并行执行；多个用户可使用--jobs在多个进程中并行处理。
+各步骤复用后台任务的处理函数（utils/job_handlers.py），进度以JSON Lines格式输出，每行一个事件：
+    {"event": "progress", "user": ..., "game_type": ..., "step": ..., "progress": 0.5, "message": ..., "time": ...}
+
+用法:
+    python -m utils.pipeline run --user USERNAME --game maimai --steps all
+    python -m utils.pipeline run --users-file users.json --jobs 2 --steps fetch,images,search,download
+
+users.json为用户列表，每项可包含 username、game_type、source（fish/lxns）、query、filter、friend_code、api_key、archive_name
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from db_utils.DatabaseDataHandler import get_database_handler
+from utils.PageUtils import read_global_config, remove_invalid_chars
+from utils.PathUtils import get_user_media_dir
+from utils.profiling import save_report, span, start_recording, stop_recording
+
+PIPELINE_STEPS = ["fetch", "images", "search", "download", "render"]
+
+_emit_lock = threading.Lock()
+
+
+def emit_event(event: str, user: Dict, step: str = None, **fields):
+    """向标准输出写入一行JSON格式的进度事件"""
+    line = json.dumps({"event": event, "user": user.get('username'), "game_type": user.get('game_type'),
+                       "step": step, **fields, "time": time.time()}, ensure_ascii=False, default=str)
+    with _emit_lock:
+        sys.__stdout__.write(line + "\n")
+        sys.__stdout__.flush()
+
+
+class PipelineContext:
+    """与后台任务的JobContext接口相同，将处理函数汇报的进度输出为进度事件"""
+    def __init__(self, user: Dict, step: str):
+        self.user = user
+        self.step = step
+
+    def report(self, progress: Optional[float] = None, message: Optional[str] = None, force: bool = False):
+        emit_event("progress", self.user, self.step, progress=progress, message=message)
+
+    def check_cancelled(self):
+        pass
+
+
+def fetch_step(user: Dict, ctx: PipelineContext) -> Dict:
+    """从查分器获取数据，创建新存档"""
+    from utils.user_gamedata_handlers import fetch_user_gamedata
+    username, game_type = user['username'], user['game_type']
+    raw_file_path = get_user_media_dir(username, game_type)['raw_file']
+    os.makedirs(os.path.dirname(raw_file_path), exist_ok=True)
+    params = {"type": game_type, "query": user.get('query', 'best')}
+    for key in ("filter", "friend_code", "api_key"):
+        if user.get(key):
+            params[key] = user[key]
+
+    ctx.report(0.0, f"正在从查分器获取{game_type}数据……")
+    archive_data = fetch_user_gamedata(raw_file_path, username, params, source=user.get('source', 'fish'))
+    if not archive_data or not archive_data.get('initial_records'):
+        return {"status": "error", "info": "未获取到任何成绩记录"}
+    archive_id, archive_name = get_database_handler().create_new_archive(
+        username=username,
+        game_type=archive_data.get('game_type', game_type),
+        sub_type=archive_data.get('sub_type', 'best'),
+        rating_mai=archive_data.get('rating_mai', 0),
+        rating_chu=archive_data.get('rating_chu', 0),
+        game_version=archive_data.get('game_version', 'N/A'),
+        initial_records=archive_data['initial_records']
+    )
+    user['archive_id'], user['archive_name'] = archive_id, archive_name
+    return {"status": "success", "info": f"成功创建新存档: {archive_name}",
+            "archive_id": archive_id, "archive_name": archive_name}
+
+
+def images_step(user: Dict, ctx: PipelineContext) -> Dict:
+    from utils.job_handlers import generate_images_job
+    image_dir = get_user_media_dir(user['username'], user['game_type'])['image_dir']
+    return generate_images_job({"archive_id": user['archive_id'], "image_dir": image_dir}, ctx)
+
+
+def search_step(user: Dict, ctx: PipelineContext) -> Dict:
+    """搜索所有谱面的视频；数据库中已有匹配视频的谱面不再搜索"""
+    from utils.job_handlers import search_videos_job
+    db_handler = get_database_handler()
+    charts = db_handler.load_charts_of_archive_records(user['username'], user['archive_name'])
+    matched_ids = [chart['chart_id'] for chart in charts if chart.get('video_metadata')]
+    result = search_videos_job({"username": user['username'], "archive_name": user['archive_name'],
+                                "skip_chart_ids": matched_ids}, ctx)
+    # 与确认页面相同，使用默认搜索结果的第一位作为匹配视频
+    for chart_id, ret_data in result.pop('search_results', {}).items():
+        if ret_data and ret_data.get('video_info_match'):
+            db_handler.update_chart_video_metadata(chart_id, ret_data['video_info_match'])
+    return result
+
+
+def download_step(user: Dict, ctx: PipelineContext) -> Dict:
+    from utils.job_handlers import download_videos_job
+    charts = get_database_handler().load_charts_of_archive_records(user['username'], user['archive_name'])
+    charts_data = [dict(chart, video_info_match=chart['video_metadata']) for chart in charts
+                   if chart.get('video_metadata')]
+    return download_videos_job({"charts_data": charts_data}, ctx)
+
+
+def render_step(user: Dict, ctx: PipelineContext) -> Dict:
+    """按全局配置中的视频生成设置生成视频，未配置的片段使用默认截取区间"""
+    from utils.job_handlers import plan_render, render_clips_job, render_full_video_job
+    config = read_global_config()
+    if not user.get('dry_run'):
+        get_database_handler().ensure_default_video_configs(user['archive_id'], config['CLIP_PLAY_TIME'],
+                                                            config['CLIP_START_INTERVAL'])
+    params = {
+        "username": user['username'],
+        "archive_name": user['archive_name'],
+        "game_type": user['game_type'],
+        "video_res": config.get('VIDEO_RES', (1920, 1080)),
+        "video_bitrate": f"{config.get('VIDEO_BITRATE', 5000)}k",
+        "trans_enable": config.get('VIDEO_TRANS_ENABLE', True),
+        "trans_time": config.get('VIDEO_TRANS_TIME', 1),
+        "force_render": user.get('force_render', False),
+        "incremental": config.get('VIDEO_INCREMENTAL', False),
+    }
+    if user.get('dry_run'):
+        # 只输出时间线规划，不生成视频；未配置的片段按默认截取区间规划，不保存到数据库
+        plan = plan_render(params)
+        emit_event("plan", user, "render", plan=plan)
+        return plan
+    if config.get('ONLY_GENERATE_CLIPS', False):
+        return render_clips_job(params, ctx)
+    return render_full_video_job(params, ctx)
+
+
+STEP_FUNCTIONS = {
+    "fetch": fetch_step,
+    "images": images_step,
+    "search": search_step,
+    "download": download_step,
+    "render": render_step,
+}
+
+
+def _run_step(user: Dict, step: str) -> bool:
+    emit_event("step_start", user, step)
+    start = time.time()
+    try:
+        with span(f"pipeline.{step}", user=user['username']):
+            result = STEP_FUNCTIONS[step](user, PipelineContext(user, step))
+        status = "failed" if result.get('status') == "error" else "succeeded"
+        emit_event("step_end", user, step, status=status, message=result.get('info'),
+                   elapsed=round(time.time() - start, 3))
+        return status == "succeeded"
+    except Exception as e:
+        traceback.print_exc()
+        emit_event("step_end", user, step, status="failed", message=str(e), elapsed=round(time.time() - start, 3))
+        return False
+
+
+def _resolve_archive(user: Dict):
+    """未执行fetch步骤时，使用指定的存档或该用户最新的存档"""
+    db_handler = get_database_handler()
+    if user.get('dry_run') and not db_handler.db.get_user(user['username']):
+        # get_user_save_list会创建不存在的用户，dry-run时不写入数据库
+        raise ValueError(f"用户 {user['username']} 不存在")
+    archive_name = user.get('archive_name')
+    if not archive_name:
+        archives = db_handler.get_user_save_list(user['username'], game_type=user['game_type'])
+        if not archives:
+            raise ValueError(f"用户 {user['username']} 没有{user['game_type']}存档，请先执行fetch步骤")
+        archive_name = sorted(archives, key=lambda x: x.get('created_at', ''), reverse=True)[0]['archive_name']
+    archive_id = db_handler.load_save_archive(user['username'], archive_name)
+    if not archive_id:
+        raise ValueError(f"未找到存档: {archive_name}")
+    user['archive_id'], user['archive_name'] = archive_id, archive_name
+
+
+def run_user_pipeline(user: Dict, steps: List[str]) -> bool:
+    """
+    对单个用户依次执行流水线步骤，任一步骤失败时停止
+    images与search/download并行执行；各阶段耗时报告保存到 profiles/pipeline_{用户名}.json
+
+    Returns:
+        是否所有步骤都成功
+    """
+    user = dict(user)
+    user.setdefault('game_type', 'maimai')
+    # 处理函数的日志输出到标准错误，标准输出只保留进度事件
+    with contextlib.redirect_stdout(sys.stderr):
+        emit_event("user_start", user, steps=steps)
+        recorder = start_recording()
+        message = None
+        try:
+            ok = _run_user_steps(user, steps)
+        except ValueError as e:  # 未找到存档
+            ok, message = False, str(e)
+        finally:
+            stop_recording()
+        try:
+            profile = save_report(recorder, f"pipeline_{remove_invalid_chars(user['username'])}")
+        except OSError as e:
+            print(f"Warning: 保存耗时报告失败: {e}")
+            profile = {}
+        emit_event("user_end", user, status="succeeded" if ok else "failed",
+                   message=message, archive_name=user.get('archive_name'), profile=profile.get('report'))
+    return ok
+
+
+def _run_user_steps(user: Dict, steps: List[str]) -> bool:
+    ok = True
+    if user.get('dry_run'):
+        # dry-run只执行render步骤的规划，其他步骤会访问网络或写入数据库
+        for step in steps:
+            if step != "render":
+                emit_event("step_end", user, step, status="skipped", message="dry-run")
+        steps = [step for step in steps if step == "render"]
+    if "fetch" in steps:
+        ok = _run_step(user, "fetch")
+    elif any(step != "fetch" for step in steps):
+        _resolve_archive(user)
+
+    video_steps = [step for step in ("search", "download") if step in steps]
+    if ok and ("images" in steps or video_steps):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = []
+            if "images" in steps:
+                futures.append(executor.submit(_run_step, user, "images"))
+            if video_steps:
+                futures.append(executor.submit(lambda: all(_run_step(user, step) for step in video_steps)))
+            ok = all(future.result() for future in futures)
+
+    if ok and "render" in steps:
+        ok = _run_step(user, "render")
+    return ok
+
+
+def parse_steps(steps_arg: str) -> List[str]:
+    if steps_arg == "all":
+        return list(PIPELINE_STEPS)
+    steps = [step.strip() for step in steps_arg.split(",") if step.strip()]
+    unknown = set(steps) - set(PIPELINE_STEPS)
+    if unknown:
+        raise ValueError(f"未知的步骤: {', '.join(sorted(unknown))}，可选步骤: {', '.join(PIPELINE_STEPS)}")
+    return [step for step in PIPELINE_STEPS if step in steps]
+
+
+def load_users_file(file_path: str) -> List[Dict]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        users = json.load(f)
+    if isinstance(users, dict):
+        users = users.get('users', [])
+    return [{"username": u} if isinstance(u, str) else u for u in users]
+
+
+def run_pipeline(users: List[Dict], steps: List[str], jobs: int = 1) -> Dict[str, bool]:
+    """处理多个用户，jobs > 1时在多个进程中并行；返回 {用户名: 是否成功}"""
+    if jobs <= 1 or len(users) <= 1:
+        return {user['username']: run_user_pipeline(user, steps) for user in users}
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_user_pipeline, user, steps): user for user in users}
+        for future in as_completed(futures):
+            user = futures[future]
+            try:
+                results[user['username']] = future.result()
+            except Exception as e:
+                emit_event("user_end", user, status="failed", message=str(e))
+                results[user['username']] = False
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="命令行批量生成B50视频")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="执行流水线")
+    run_parser.add_argument("--user", help="用户名（查分器用户名）")
+    run_parser.add_argument("--game", default="maimai", choices=["maimai", "chunithm"], help="游戏类型")
+    run_parser.add_argument("--source", default="fish", choices=["fish", "lxns"], help="查分器数据源")
+    run_parser.add_argument("--archive", default=None, help="不执行fetch步骤时使用的存档，默认为最新存档")
+    run_parser.add_argument("--users-file", help="用户列表JSON文件")
+    run_parser.add_argument("--steps", default="all", help=f"以逗号分隔的步骤（{','.join(PIPELINE_STEPS)}）或all")
+    run_parser.add_argument("--jobs", type=int, default=1, help="同时处理的用户数量")
+    run_parser.add_argument("--dry-run", action="store_true",
+                            help="只读取已有存档并输出render步骤的时间线规划（片段时间、缺失素材、预计耗时），"
+                                 "跳过其他步骤，不访问网络、不写入数据库")
+    args = parser.parse_args(argv)
+
+    steps = parse_steps(args.steps)
+    if args.users_file:
+        users = load_users_file(args.users_file)
+        for user in users:
+            user.setdefault('game_type', args.game)
+            user.setdefault('source', args.source)
+    elif args.user:
+        users = [{"username": args.user, "game_type": args.game, "source": args.source,
+                  "archive_name": args.archive}]
+    else:
+        parser.error("需要提供--user或--users-file")
+    if args.dry_run:
+        for user in users:
+            user['dry_run'] = True
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if not args.dry_run:
+            get_database_handler().db.check_and_apply_migrations()
+        results = run_pipeline(users, steps, jobs=args.jobs)
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+轻量的分阶段耗时统计
+
+在关键函数上使用 @timed() 装饰器或 with span("名称") 记录耗时区间（span），每个span记录：
+- 墙钟时间、当前线程的CPU时间
+- 子进程（如ffmpeg编码）的CPU时间：来自os.times()，是整个进程在span期间已退出的子进程的CPU时间，
+  不区分线程，span结束时仍在运行的子进程不计入；多个线程并行时会同时计入各线程的span
+- 常驻内存（RSS）在span期间的变化rss_delta_mb（同样是进程级的，并行线程的内存分配也会计入），
+  以及截至span结束时进程的峰值内存process_peak_rss_mb（进程启动以来的最大值，不是该span的峰值）
+
+只有在 start_recording() 之后才会记录，未开启记录时span几乎没有开销。
+记录结束后可导出JSON报告（按名称汇总）和Chrome trace（在 chrome://tracing 或 https://ui.perfetto.dev 中打开）。
+
+    start_recording()
+    ...  # 执行任务
+    report_paths = save_report(stop_recording(), "job_1")
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_OUTPUT_DIR = "./profiles"
+
+_recorder = None
+_recorder_lock = threading.Lock()
+_local = threading.local()
+
+
+class SpanRecorder:
+    """保存一次记录期间的所有span"""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, span_data: Dict):
+        with self._lock:
+            self.spans.append(span_data)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def _current_rss_mb() -> Optional[float]:
+    """进程当前的常驻内存，仅支持Linux"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _children_cpu_time() -> float:
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def start_recording() -> SpanRecorder:
+    """开始记录span（同一进程内所有线程的span都会被记录）"""
+    global _recorder
+    with _recorder_lock:
+        _recorder = SpanRecorder()
+        return _recorder
+
+
+def stop_recording() -> Optional[SpanRecorder]:
+    """停止记录，返回记录结果"""
+    global _recorder
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+        return recorder
+
+
+def is_recording() -> bool:
+    return _recorder is not None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录一段代码的耗时；attrs为附加信息（需可JSON序列化），会出现在报告中"""
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    start_children_cpu = _children_cpu_time()
+    start_rss = _current_rss_mb()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _local.depth = depth
+        end_rss = _current_rss_mb()
+        span_data = {
+            "name": name,
+            "start": start_wall - recorder.origin,
+            "wall_time": time.perf_counter() - start_wall,
+            "cpu_time": time.thread_time() - start_cpu,
+            "children_cpu_time": _children_cpu_time() - start_children_cpu,
+            "rss_delta_mb": round(end_rss - start_rss, 1) if start_rss is not None and end_rss is not None else None,
+            "process_peak_rss_mb": _peak_rss_mb(),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "depth": depth,
+        }
+        if attrs:
+            span_data["attrs"] = attrs
+        if error:
+            span_data["error"] = error
+        recorder.add(span_data)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """装饰器：将函数的每次调用记录为一个span，默认使用 模块名.函数名 作为名称"""
+    def decorator(func):
+        span_name = name or f"{func.__module__.split('.')[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(cls, prefix: Optional[str] = None, exclude=()):
+    """为类的所有公开方法添加 @timed()，用于统计如数据库读写等调用频繁的方法"""
+    prefix = prefix or cls.__name__
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith("_") or attr_name in exclude or not callable(attr):
+            continue
+        setattr(cls, attr_name, timed(f"{prefix}.{attr_name}")(attr))
+    return cls
+
+
+def summarize(recorder: SpanRecorder) -> List[Dict]:
+    """按span名称汇总调用次数、总耗时、总CPU时间、最大内存增量和进程峰值内存，按总耗时降序排列"""
+    summary = {}
+    for s in recorder.spans:
+        item = summary.setdefault(s["name"], {"name": s["name"], "count": 0, "wall_time": 0.0,
+                                              "cpu_time": 0.0, "children_cpu_time": 0.0,
+                                              "max_wall_time": 0.0, "max_rss_delta_mb": None,
+                                              "process_peak_rss_mb": None})
+        item["count"] += 1
+        item["wall_time"] += s["wall_time"]
+        item["cpu_time"] += s["cpu_time"]
+        item["children_cpu_time"] += s["children_cpu_time"]
+        item["max_wall_time"] = max(item["max_wall_time"], s["wall_time"])
+        if s["rss_delta_mb"] is not None:
+            item["max_rss_delta_mb"] = max(item["max_rss_delta_mb"] or 0, s["rss_delta_mb"])
+        if s["process_peak_rss_mb"] is not None:
+            item["process_peak_rss_mb"] = max(item["process_peak_rss_mb"] or 0, s["process_peak_rss_mb"])
+    return sorted(summary.values(), key=lambda x: x["wall_time"], reverse=True)
+
+
+def to_chrome_trace(recorder: SpanRecorder) -> Dict:
+    """转换为Chrome trace格式（Trace Event Format）"""
+    events = []
+    for s in recorder.spans:
+        args = {"cpu_ms": round(s["cpu_time"] * 1000, 3),
+                "children_cpu_ms": round(s["children_cpu_time"] * 1000, 3),
+                "rss_delta_mb": s["rss_delta_mb"],
+                "process_peak_rss_mb": s["process_peak_rss_mb"]}
+        args.update(s.get("attrs", {}))
+        if "error" in s:
+            args["error"] = s["error"]
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(".")[0],
+            "ph": "X",
+            "ts": round(s["start"] * 1e6, 3),
+            "dur": round(s["wall_time"] * 1e6, 3),
+            "pid": s["pid"],
+            "tid": s["tid"],
+            "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def save_report(recorder: Optional[SpanRecorder], label: str, output_dir: str = PROFILE_OUTPUT_DIR) -> Dict[str, str]:
+    """
+    保存JSON报告（{label}.json）和Chrome trace（{label}.trace.json）
+
+    Returns:
+        {"report": JSON报告路径, "trace": Chrome trace路径}，没有记录任何span时返回空字典
+    """
+    if recorder is None or not recorder.spans:
+        return {}
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, f"{label}.json")
+    trace_path = os.path.join(output_dir, f"{label}.trace.json")
+    report = {
+        "label": label,
+        "started_at": recorder.started_at,
+        "wall_time": max(s["start"] + s["wall_time"] for s in recorder.spans),
+        "process_peak_rss_mb": _peak_rss_mb(),
+        "summary": summarize(recorder),
+        "spans": recorder.spans,
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    with open(trace_path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(recorder), f, ensure_ascii=False, default=str)
+    return {"report": report_path, "trace": trace_path}
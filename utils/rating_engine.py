@@ -0,0 +1,186 @@
+"""
+向量化的成绩评级与Rating计算
+
+对整批成绩（如某用户所有存档的全部历史记录）一次性计算评级和单曲Rating：
+阈值表预先整理为升序数组，使用np.searchsorted批量定位每条成绩所在的区间。
+
+结果与dxnet_extension中逐条计算的get_rate/get_factor/compute_rating/compute_chunithm_rating
+完全一致（包括浮点运算顺序和Python round的舍入方式），两者共用本模块中的阈值表。
+"""
+import numpy as np
+
+# maimai 评级：(达成率下限, 评级)，按下限从高到低排列
+MAIMAI_RATE_THRESHOLDS = [
+    (100.5, "sssp"),
+    (100, "sss"),
+    (99.5, "ssp"),
+    (99, "ss"),
+    (98, "sp"),
+    (97, "s"),
+    (94, "aaa"),
+    (90, "aa"),
+    (80, "a"),
+    (75, "bbb"),
+    (70, "bb"),
+    (60, "b"),
+    (50, "c"),
+    (0, "d")
+]
+
+# maimai DX rating 系数：(达成率下限, 系数)，按下限从高到低排列
+MAIMAI_FACTOR_THRESHOLDS = [
+    (100.5, 0.224),
+    (100.4999, 0.222),
+    (100, 0.216),
+    (99.9999, 0.214),
+    (99.5, 0.211),
+    (99, 0.208),
+    (98.9999, 0.206),
+    (98, 0.203),
+    (97, 0.2),
+    (96.9999, 0.176),
+    (94, 0.168),
+    (90, 0.152),
+    (80, 0.136),
+    (79.9999, 0.128),
+    (75, 0.12),
+    (70, 0.112),
+    (60, 0.096),
+    (50, 0.08),
+    (0, 0.016)
+]
+
+MAIMAI_MAX_ACHIEVEMENT = 100.5
+
+# 中二节奏 rating 分段：(分数下限, 分数上限(不含), 规则)，按下限从高到低排列
+# 规则：('fixed', 加值) / ('step', 基础加值, 每多少分, 每档加值, 加值上限) / ('func', f(ds, score))
+CHUNITHM_RATING_TIERS = [
+    (1_009_000, None,        ('fixed', 2.15)),
+    (1_007_500, 1_009_000,   ('step',  2.00, 100, 0.01, 2.15)),
+    (1_005_000, 1_007_500,   ('step',  1.50, 50,  0.01, 2.00)),
+    (1_000_000, 1_005_000,   ('step',  1.00, 100, 0.01, 1.50)),
+    (990_000,   1_000_000,   ('step',  0.60, 250, 0.01, 1.00)),
+    (975_000,   990_000,     ('step',  0.00, 250, 0.01, 0.60)),
+    (950_000,   975_000,     ('fixed', -1.5)),
+    (925_000,   950_000,     ('fixed', -3.0)),
+    (900_000,   925_000,     ('fixed', -5.0)),
+    (800_000,   900_000,     ('func',  lambda ds, s: (ds - 5.0) / 2.0)),
+]
+
+# 预先整理为升序的查找表
+_RATE_BOUNDS = np.array([t for t, _ in reversed(MAIMAI_RATE_THRESHOLDS)], dtype=np.float64)
+_RATE_NAMES = np.array([r for _, r in reversed(MAIMAI_RATE_THRESHOLDS)])
+_FACTOR_BOUNDS = np.array([t for t, _ in reversed(MAIMAI_FACTOR_THRESHOLDS)], dtype=np.float64)
+_FACTOR_VALUES = np.array([f for _, f in reversed(MAIMAI_FACTOR_THRESHOLDS)], dtype=np.float64)
+
+_TIER_FIXED, _TIER_STEP, _TIER_FUNC = 0, 1, 2
+_CHUNI_TIERS = list(reversed(CHUNITHM_RATING_TIERS))
+_CHUNI_BOUNDS = np.array([mn for mn, _, _ in _CHUNI_TIERS], dtype=np.int64)
+_CHUNI_KIND = np.array([{'fixed': _TIER_FIXED, 'step': _TIER_STEP, 'func': _TIER_FUNC}[rule[0]]
+                        for _, _, rule in _CHUNI_TIERS])
+# 对非step分段填充不参与计算的占位值
+_CHUNI_BASE = np.array([rule[1] if rule[0] != 'func' else 0.0 for _, _, rule in _CHUNI_TIERS], dtype=np.float64)
+_CHUNI_STEP_PTS = np.array([rule[2] if rule[0] == 'step' else 1 for _, _, rule in _CHUNI_TIERS], dtype=np.int64)
+_CHUNI_STEP_VAL = np.array([rule[3] if rule[0] == 'step' else 0.0 for _, _, rule in _CHUNI_TIERS], dtype=np.float64)
+_CHUNI_CAP = np.array([rule[4] if rule[0] == 'step' else 0.0 for _, _, rule in _CHUNI_TIERS], dtype=np.float64)
+
+# Dekker乘法拆分常数 2^27 + 1
+_SPLITTER = 134217729.0
+
+
+def _locate(bounds: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """返回每个值所在区间（下限 <= 值）的下标，小于所有下限（或为NaN）时为-1"""
+    idx = np.searchsorted(bounds, values, side='right') - 1
+    if values.dtype.kind == 'f':
+        idx[np.isnan(values)] = -1
+    return idx
+
+
+def round_half_even(x, ndigits: int = 2) -> np.ndarray:
+    """
+    与Python内置round(x, ndigits)结果完全一致的向量化舍入
+
+    Python按x的精确二进制值舍入（如round(2.675, 2) == 2.67），而np.round先计算x * 10**ndigits，
+    乘法的舍入误差会导致少数值结果不同。这里用Dekker算法求出乘积的精确误差，修正恰好落在.5上的情况。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    p = x * scale
+    # x * scale == p + e（精确成立）
+    c = _SPLITTER * x
+    x_hi = c - (c - x)
+    x_lo = x - x_hi
+    c = _SPLITTER * scale
+    s_hi = c - (c - scale)
+    s_lo = scale - s_hi
+    e = ((x_hi * s_hi - p) + x_hi * s_lo + x_lo * s_hi) + x_lo * s_lo
+
+    k = np.rint(p)  # 精确值恰为.5时四舍六入五成双，与Python一致
+    tie = np.abs(p - np.trunc(p)) == 0.5
+    inexact_tie = tie & (e != 0)
+    k = np.where(inexact_tie, np.where(e > 0, np.floor(p) + 1, np.floor(p)), k)
+    result = k / scale
+    return np.where(np.isfinite(x), result, x)
+
+
+def get_rates(achievements) -> np.ndarray:
+    """批量将达成率转换为评级名称，与get_rate一致"""
+    a = np.asarray(achievements, dtype=np.float64)
+    idx = _locate(_RATE_BOUNDS, a)
+    return np.where(idx >= 0, _RATE_NAMES[np.maximum(idx, 0)], "d")
+
+
+def get_factors(achievements) -> np.ndarray:
+    """批量获取达成率对应的DX rating系数，与get_factor一致"""
+    a = np.asarray(achievements, dtype=np.float64)
+    idx = _locate(_FACTOR_BOUNDS, a)
+    return np.where(idx >= 0, _FACTOR_VALUES[np.maximum(idx, 0)], 0.0)
+
+
+def compute_ratings(ds, achievements) -> np.ndarray:
+    """批量计算maimai单曲DX rating，与compute_rating一致"""
+    ds = np.asarray(ds, dtype=np.float64)
+    a = np.asarray(achievements, dtype=np.float64)
+    rating = ds * np.minimum(a, MAIMAI_MAX_ACHIEVEMENT) * get_factors(a)
+    return np.trunc(rating).astype(np.int64)
+
+
+def get_chunithm_tiers(scores) -> np.ndarray:
+    """
+    批量获取中二节奏分数所在的rating分段，返回CHUNITHM_RATING_TIERS中的下标，
+    低于最低分段时为-1
+    """
+    s = _parse_chunithm_scores(scores)
+    idx = _locate(_CHUNI_BOUNDS, s)
+    return np.where(idx >= 0, len(_CHUNI_TIERS) - 1 - idx, -1)
+
+
+def _parse_chunithm_scores(scores) -> np.ndarray:
+    try:
+        s = np.asarray(scores, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Failed to parse chunithm score.")
+    if not np.all(np.isfinite(s)):
+        raise ValueError("Failed to parse chunithm score.")
+    return np.trunc(s).astype(np.int64)
+
+
+def compute_chunithm_ratings(ds, scores) -> np.ndarray:
+    """批量计算中二节奏单曲rating，与compute_chunithm_rating一致"""
+    s = _parse_chunithm_scores(scores)
+    ds, s = np.broadcast_arrays(np.asarray(ds, dtype=np.float64), s)
+    idx = _locate(_CHUNI_BOUNDS, s)
+    tier = np.maximum(idx, 0)
+
+    kind = _CHUNI_KIND[tier]
+    base = _CHUNI_BASE[tier]
+    steps = np.maximum(0, (s - _CHUNI_BOUNDS[tier]) // _CHUNI_STEP_PTS[tier])
+    extra = np.minimum(steps * _CHUNI_STEP_VAL[tier], _CHUNI_CAP[tier] - base)
+
+    raw = np.where(kind == _TIER_STEP, ds + base + extra, ds + base)
+    for i, (_, _, rule) in enumerate(_CHUNI_TIERS):
+        if rule[0] == 'func':
+            mask = tier == i
+            raw = np.where(mask, rule[1](ds, s), raw)
+
+    return np.where(idx >= 0, round_half_even(raw, 2), 0.0)
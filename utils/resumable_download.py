@@ -0,0 +1,258 @@
+"""
+可断点续传的HTTP流下载模块
+
+- 下载内容先写入`<目标文件>.part`，并在`<目标文件>.part.json`中记录每个分段已接收的字节数，
+  中断后再次下载时通过HTTP Range只请求缺失的部分
+- 下载任务目录中的manifest.json记录已解析的媒体流地址及其过期时间，
+  续传时若地址仍有效则无需重新解析（避免重复请求视频平台的解析接口）
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 流式下载时每次读取的字节数
+SEGMENT_SIZE = 8 * 1024 * 1024  # 按此大小将流切分为分段，使用Range并行下载
+SEGMENT_CONCURRENCY = 4  # 单个流同时下载的分段数
+STATE_SAVE_INTERVAL = 4 * DOWNLOAD_CHUNK_SIZE  # 每接收多少字节保存一次续传进度
+MAX_RESUME_RETRIES = 3  # 网络中断时自动续传的次数
+
+MANIFEST_FILE = "manifest.json"
+DEFAULT_URL_TTL = 100 * 60  # 无法从地址中解析过期时间时，默认的有效期（秒）
+EXPIRY_MARGIN = 5 * 60  # 距过期不足该时间的地址视为已过期
+
+
+class StreamExpiredError(Exception):
+    """媒体流地址已过期或失效，需要重新解析"""
+    pass
+
+
+def _to_proxy_url(proxy: Optional[str]) -> Optional[str]:
+    if proxy and "://" not in proxy:
+        return f"http://{proxy}"
+    return proxy or None
+
+
+def parse_url_expiry(url: str, default_ttl: int = DEFAULT_URL_TTL) -> float:
+    """从媒体流地址的查询参数中解析过期时间戳（B站为deadline，YouTube为expire）"""
+    query = parse_qs(urlparse(url).query)
+    for key in ("deadline", "expire", "expires"):
+        value = query.get(key, [""])[0]
+        if value.isdigit():
+            return float(value)
+    return time.time() + default_ttl
+
+
+def prepare_job_dir(job_dir: str, key: Dict):
+    """若任务目录中残留的是其他下载参数（如不同清晰度）的中间文件，则清空该目录"""
+    path = os.path.join(job_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            old_key = json.load(f).get("key")
+    except (OSError, json.JSONDecodeError):
+        old_key = None
+    if old_key != key:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir, exist_ok=True)
+
+
+def load_stream_manifest(job_dir: str, key: Dict) -> Optional[Dict]:
+    """读取任务目录中缓存的流地址，参数不一致或地址即将过期时返回None"""
+    path = os.path.join(job_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("key") != key:
+        return None
+    if manifest.get("expires_at", 0) - EXPIRY_MARGIN < time.time():
+        print("缓存的媒体流地址已过期，将重新解析")
+        return None
+    return manifest.get("streams")
+
+
+def save_stream_manifest(job_dir: str, key: Dict, streams: Dict):
+    """
+    缓存解析得到的流地址
+
+    Args:
+        key: 用于判断缓存是否对应同一下载请求的参数（视频ID、分P、清晰度等）
+        streams: 解析结果，其中"urls"为各媒体流地址的列表
+    """
+    urls: List[str] = streams.get("urls", [])
+    manifest = {
+        "key": key,
+        "streams": streams,
+        "expires_at": min(parse_url_expiry(u) for u in urls) if urls else 0,
+    }
+    path = os.path.join(job_dir, MANIFEST_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def clear_stream_manifest(job_dir: str):
+    path = os.path.join(job_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class _PartState:
+    """记录.part文件中每个分段（以起始偏移量为键）已接收的字节数"""
+    def __init__(self, path: str, total: int, received: Optional[Dict[int, int]] = None):
+        self.path = path
+        self.total = total
+        self.received = received or {}
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, path: str, total: int) -> Optional["_PartState"]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("total") != total or data.get("segment_size") != SEGMENT_SIZE:
+            return None
+        return cls(path, total, {int(k): v for k, v in data.get("received", {}).items()})
+
+    @property
+    def done_bytes(self) -> int:
+        return sum(self.received.values())
+
+    def add(self, start: int, size: int):
+        self.received[start] = self.received.get(start, 0) + size
+        self._unsaved += size
+        if self._unsaved >= STATE_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        data = {
+            "total": self.total,
+            "segment_size": SEGMENT_SIZE,
+            "received": {str(k): v for k, v in self.received.items()},
+        }
+        with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(self.path + ".tmp", self.path)
+        self._unsaved = 0
+
+
+def _check_expired(resp: httpx.Response):
+    if resp.status_code in (403, 404, 410):
+        raise StreamExpiredError(f"媒体流地址已失效: HTTP {resp.status_code}")
+
+
+async def _probe_content_length(sess: httpx.AsyncClient, url: str) -> Optional[int]:
+    """请求首字节以获取流的总大小，服务器不支持Range请求时返回None"""
+    # 只读取响应头：服务器忽略Range返回200时，不读取（缓存）整个文件
+    async with sess.stream('GET', url, headers={'Range': 'bytes=0-0'}) as resp:
+        _check_expired(resp)
+        content_range = resp.headers.get('content-range', '')
+        if resp.status_code == 206 and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            return int(total) if total.isdigit() else None
+        return None
+
+
+async def _download_stream(sess: httpx.AsyncClient, url: str, out: str, info: str):
+    """服务器不支持Range时，流式下载整个文件（无法续传）"""
+    async with sess.stream('GET', url) as resp:
+        _check_expired(resp)
+        resp.raise_for_status()
+        length = int(resp.headers.get('content-length', 0))
+        with open(out, 'wb') as f:
+            process = 0
+            async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                process += len(chunk)
+                percentage = (process / length) * 100 if length else 0
+                print(f'      -- [正在下载: {info} {percentage:.2f}%]', end='\r')
+                f.write(chunk)
+
+
+async def _download_segments(sess: httpx.AsyncClient, url: str, out: str, info: str, state: _PartState):
+    """并行下载各分段中尚未接收的部分，直接写入预分配文件的对应位置"""
+    semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
+    total = state.total
+
+    async def fetch_segment(start: int, end: int):
+        offset = start + state.received.get(start, 0)
+        if offset > end:
+            return
+        async with semaphore:
+            async with sess.stream('GET', url, headers={'Range': f'bytes={offset}-{end}'}) as resp:
+                _check_expired(resp)
+                if resp.status_code != 206:
+                    raise httpx.HTTPStatusError(f"服务器未按Range返回分段数据: {resp.status_code}",
+                                                request=resp.request, response=resp)
+                # 不使用缓冲，保证记录到续传进度中的数据已写入文件
+                with open(out, 'r+b', buffering=0) as f:
+                    f.seek(offset)
+                    async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        state.add(start, len(chunk))
+                        percentage = state.done_bytes / total * 100
+                        print(f'      -- [正在下载: {info} {percentage:.2f}%]', end='\r')
+
+    await asyncio.gather(*[
+        fetch_segment(start, min(start + SEGMENT_SIZE, total) - 1)
+        for start in range(0, total, SEGMENT_SIZE)
+    ])
+
+
+async def download_url_resumable(url: str, out: str, info: str,
+                                 headers: Optional[Dict] = None, proxy: Optional[str] = None):
+    """
+    可断点续传地下载一个媒体流到out
+
+    网络中断时自动从已接收的位置续传；地址失效时抛出StreamExpiredError，
+    由调用方重新解析地址后再次调用（已下载的部分仍会保留）。
+    """
+    if os.path.exists(out):
+        print(f"{info} 已下载完成，跳过")
+        return
+    part_file = out + ".part"
+    state_file = out + ".part.json"
+    timeout = httpx.Timeout(30.0, read=60.0)
+
+    async with httpx.AsyncClient(headers=headers, timeout=timeout, follow_redirects=True,
+                                 proxy=_to_proxy_url(proxy)) as sess:
+        for attempt in range(MAX_RESUME_RETRIES):
+            try:
+                total = await _probe_content_length(sess, url)
+                if not total:
+                    await _download_stream(sess, url, part_file, info)
+                    break
+
+                state = _PartState.load(state_file, total)
+                if state is None or not os.path.exists(part_file) or os.path.getsize(part_file) != total:
+                    state = _PartState(state_file, total)
+                    with open(part_file, 'wb') as f:
+                        f.truncate(total)
+                elif state.done_bytes > 0:
+                    print(f"继续未完成的下载: {info}，已完成 {state.done_bytes / total * 100:.1f}%")
+                try:
+                    await _download_segments(sess, url, part_file, info, state)
+                finally:
+                    state.save()
+                break
+            except httpx.TransportError as e:
+                if attempt == MAX_RESUME_RETRIES - 1:
+                    raise
+                print(f"\n下载中断 (尝试 {attempt + 1}/{MAX_RESUME_RETRIES}): {e}，正在续传...")
+                await asyncio.sleep(2 ** attempt)
+
+    os.replace(part_file, out)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    print(f"\n{info} Done.")
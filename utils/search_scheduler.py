@@ -0,0 +1,180 @@
+"""
+并发视频搜索调度模块
+
+- TokenBucketLimiter: 线程安全的令牌桶限流器，所有搜索线程共享同一个令牌桶，
+  以保证总体请求速率不超过平台风控预算；遇到429/400等响应时全体退避
+- SearchScheduler: 使用线程池并发执行谱面视频搜索，并按完成顺序返回结果，
+  便于页面边搜索边展示
+"""
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# 各平台的默认限流参数
+# rate: 每秒补充的令牌数（即长期平均请求速率）；burst: 令牌桶容量（允许的瞬时突发请求数）
+DEFAULT_RATE_LIMITS = {
+    "bilibili": {"rate": 0.5, "burst": 2},
+    "youtube": {"rate": 0.5, "burst": 3},
+}
+
+# 认为是触发了平台风控的错误特征
+THROTTLE_ERROR_PATTERNS = ("429", "Too Many Requests", "400", "Bad Request", "412", "-352", "-412")
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """判断异常是否由平台限流/风控引起"""
+    error_msg = str(error)
+    return any(p in error_msg for p in THROTTLE_ERROR_PATTERNS)
+
+
+class TokenBucketLimiter:
+    """
+    线程安全的令牌桶限流器
+
+    每次发起远程请求前调用 acquire() 获取令牌；当请求被平台限流时调用 penalize()，
+    限流器会进入指数退避，期间所有共享该限流器的线程都会暂停获取令牌。
+    """
+    def __init__(self, rate: float, burst: int = 1,
+                 jitter: Tuple[float, float] = (0.0, 0.0), max_backoff: float = 60.0):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """阻塞直到获取到一个令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    wait = 0.0
+                else:
+                    wait = (1.0 - self._tokens) / self.rate
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+        # 加入随机抖动，避免请求间隔过于规律而被识别为bot
+        low, high = self.jitter
+        if high > 0:
+            time.sleep(random.uniform(max(0.0, low), high))
+
+    def penalize(self):
+        """遇到限流响应时调用：清空令牌，并按指数退避暂停所有请求"""
+        with self._lock:
+            if self._backoff <= 0:
+                self._backoff = max(1.0, 1.0 / self.rate)
+            else:
+                self._backoff = min(self.max_backoff, self._backoff * 2)
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + self._backoff)
+            print(f"[限流] 检测到平台风控响应，暂停搜索请求 {self._backoff:.1f} 秒")
+
+    def reward(self):
+        """请求成功时调用：逐步缩短退避时间"""
+        with self._lock:
+            self._backoff = self._backoff / 2 if self._backoff > 1.0 else 0.0
+
+
+def build_search_limiter(downloader_type: str, search_wait_time=None,
+                         overrides: Optional[Dict] = None) -> TokenBucketLimiter:
+    """
+    根据下载器类型和配置构造搜索限流器
+
+    Args:
+        downloader_type: "bilibili" 或 "youtube"
+        search_wait_time: 配置中的SEARCH_WAIT_TIME（[min, max]秒）。
+            若提供，则平均请求速率与原先串行搜索的等待间隔保持一致（即相同的风控预算）
+        overrides: 配置中SEARCH_RATE_LIMITS对应平台的参数，可覆盖rate和burst
+    """
+    params = dict(DEFAULT_RATE_LIMITS.get(downloader_type, {"rate": 0.5, "burst": 1}))
+    jitter = (0.0, 0.0)
+
+    if search_wait_time and len(search_wait_time) == 2:
+        low, high = float(search_wait_time[0]), float(search_wait_time[1])
+        if high > 0 and high >= low:
+            params["rate"] = 2.0 / (low + high)
+            jitter = (0.0, (high - low) / 2)
+
+    if overrides:
+        params.update({k: v for k, v in overrides.items() if k in ("rate", "burst")})
+
+    return TokenBucketLimiter(rate=params["rate"], burst=params["burst"], jitter=jitter)
+
+
+class SearchScheduler:
+    """
+    并发谱面视频搜索调度器
+
+    每个谱面的搜索在独立的线程中执行，下载器内部的每次远程搜索请求都会经过共享的令牌桶。
+    run() 按完成顺序逐个返回结果，调用方（Streamlit页面主线程）负责更新界面和会话状态。
+    """
+    def __init__(self, downloader, limiter: TokenBucketLimiter, max_workers: int = 3,
+                 max_retries: int = 2, search_func: Optional[Callable] = None):
+        self.downloader = downloader
+        self.limiter = limiter
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max_retries
+        if search_func is None:
+            from utils.WebAgentUtils import search_one_video
+            search_func = search_one_video
+        self.search_func = search_func
+
+    def _search_with_backoff(self, chart: Dict) -> Tuple[Dict, str]:
+        attempt = 0
+        while True:
+            try:
+                result = self.search_func(self.downloader, chart)
+                self.limiter.reward()
+                return result
+            except Exception as e:
+                if attempt < self.max_retries and is_throttle_error(e):
+                    attempt += 1
+                    print(f"搜索 {chart.get('song_id')} 被限流 (尝试 {attempt}/{self.max_retries})，退避后重试: {e}")
+                    self.limiter.penalize()
+                    continue
+                raise
+
+    def run(self, charts: List[Dict]) -> Iterator[Tuple[int, Dict, Dict, str]]:
+        """
+        并发搜索所有谱面，按完成顺序产出 (原始序号, chart, ret_data, output_info)
+
+        任一谱面搜索抛出非限流异常时，取消剩余任务并将异常抛给调用方。
+        """
+        if not charts:
+            return
+        self.downloader.set_rate_limiter(self.limiter)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="video_search")
+        try:
+            futures = {pool.submit(self._search_with_backoff, chart): idx for idx, chart in enumerate(charts)}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    ret_data, output_info = future.result()
+                except Exception:
+                    traceback.print_exc()
+                    raise
+                yield idx, charts[idx], ret_data, output_info
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.downloader.set_rate_limiter(None)
@@ -0,0 +1,86 @@
+"""
+谱面视频片段下载（segment fetch）辅助模块
+
+开启DOWNLOAD_SEGMENT_ONLY后，下载器只通过ffmpeg的HTTP Range读取覆盖
+[video_slice_start - margin, video_slice_end + margin]的数据，并无损封装为短视频文件。
+
+片段文件旁会写入`<视频文件名>.segment.json`，记录片段在原视频中的起止时间。
+数据库中保存的video_slice_start/end始终以原视频时间轴为准，读取和保存配置时
+使用get_segment_offset在原视频时间轴与片段文件时间轴之间换算。
+"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+SEGMENT_SIDECAR_SUFFIX = ".segment.json"
+DEFAULT_SEGMENT_MARGIN = 5  # 片段前后额外保留的时长（秒），同时用于覆盖关键帧对齐带来的偏差
+
+
+def _sidecar_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + SEGMENT_SIDECAR_SUFFIX
+
+
+def get_segment_info(video_path: Optional[str]) -> Optional[Dict]:
+    """读取片段信息，完整下载的视频返回None"""
+    if not video_path:
+        return None
+    path = _sidecar_path(video_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def get_segment_offset(video_path: Optional[str]) -> float:
+    """片段文件的0时刻对应原视频中的时间（秒），完整视频为0"""
+    info = get_segment_info(video_path)
+    return float(info.get("start", 0)) if info else 0.0
+
+
+def save_segment_info(video_path: str, start: float, end: float):
+    with open(_sidecar_path(video_path), 'w', encoding='utf-8') as f:
+        json.dump({"start": start, "end": end}, f)
+
+
+def remove_segment_info(video_path: str):
+    path = _sidecar_path(video_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def segment_covers(video_path: str, start: float, end: float) -> bool:
+    """判断本地视频是否包含原视频时间轴上的[start, end]区间"""
+    info = get_segment_info(video_path)
+    if info is None:
+        return True
+    return info.get("start", 0) <= start and end <= info.get("end", 0)
+
+
+def plan_segment_window(slice_start: float, slice_end: float,
+                        margin: float = DEFAULT_SEGMENT_MARGIN) -> Tuple[float, float]:
+    """根据截取时间计算需要下载的片段范围"""
+    return max(0.0, float(slice_start) - margin), float(slice_end) + margin
+
+
+def build_segment_fetch_args(input_urls: List[str], start: float, end: float, output_file: str,
+                             headers: Optional[Dict] = None, proxy: Optional[str] = None) -> List[str]:
+    """
+    构造ffmpeg参数：对每个远程输入使用输入端seek，只读取片段所需的数据并无损封装
+
+    input_urls为[音视频流]或[视频流, 音频流]。
+    """
+    args = []
+    for url in input_urls:
+        if headers:
+            args += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+        if proxy:
+            args += ['-http_proxy', proxy if "://" in proxy else f"http://{proxy}"]
+        args += ['-ss', f"{start:.3f}", '-i', url]
+    args += ['-t', f"{end - start:.3f}"]
+    if len(input_urls) == 2:
+        args += ['-map', '0:v:0', '-map', '1:a:0']
+    args += ['-c', 'copy', '-movflags', '+faststart', output_file]
+    return args
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the rendered clip manifest in utils/clip_manifest.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.clip_manifest import (CHANGED, MISSING, UNKNOWN, UP_TO_DATE, ClipManifest, compute_clip_key)
+
+
+def test_clip_manifest():
+    """Test that edits to the clip config, its assets or the output file invalidate the record"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main_image = os.path.join(temp_dir, "Best_1.png")
+        with open(main_image, "wb") as f:
+            f.write(b"image")
+        config = {"clip_title_name": "Best_1", "main_image": main_image, "start": 15, "end": 25, "duration": 10}
+        style_config = {"asset_paths": {}}
+        key = compute_clip_key(config, style_config, (1920, 1080), "5000k", True, 1.5)
+
+        output_file = os.path.join(temp_dir, "0_Best_1.mp4")
+        manifest = ClipManifest(temp_dir)
+        assert manifest.check(output_file, key) == MISSING
+        with open(output_file, "wb") as f:
+            f.write(b"clip")
+        assert manifest.check(output_file, key) == UNKNOWN
+
+        manifest.record(output_file, key, fps=30, frames=300, keyframes=[1.5, 8.5])
+        manifest = ClipManifest(temp_dir)
+        assert manifest.check(output_file, key) == UP_TO_DATE
+        assert manifest.get(output_file)["duration"] == 10
+
+        changed_config = dict(config, start=20, end=30)
+        assert compute_clip_key(changed_config, style_config, (1920, 1080), "5000k", True, 1.5) != key
+        assert compute_clip_key(config, style_config, (1920, 1080), "5000k", False, 1.5) != key
+
+        with open(main_image, "ab") as f:
+            f.write(b"edited")
+        new_key = compute_clip_key(config, style_config, (1920, 1080), "5000k", True, 1.5)
+        assert new_key != key
+        assert manifest.check(output_file, new_key) == CHANGED
+
+        with open(output_file, "ab") as f:
+            f.write(b"overwritten")
+        assert manifest.check(output_file, key) == CHANGED
+    print("✅ Clip manifest detects changed clips")
+
+
+if __name__ == "__main__":
+    test_clip_manifest()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk internal level refresh in utils/metadata_relevel.py
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+pytest.importorskip("requests")
+
+from db_utils.DatabaseManager import DatabaseManager
+from utils.metadata_relevel import refresh_internal_levels
+
+
+def test_relevel_keeps_diving_fish_chunithm_rating():
+    """Test that a re-level recomputes summed (LXNS) chunithm totals but keeps Diving-Fish B30 averages"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = DatabaseManager(os.path.join(temp_dir, "test.db"))
+        db.check_and_apply_migrations()
+        user_id = db.create_user("test_user")
+        chart_ids = [db.get_or_create_chart({'game_type': 'chunithm', 'song_id': str(i), 'chart_type': 0,
+                                             'level_index': 3, 'difficulty': '14.0'}) for i in range(2)]
+        ratings = [16.0, 16.5]
+
+        # Diving-Fish存档的rating_chu为B30平均值，落雪存档为记录rating的总和
+        fish_archive = db.create_archive(user_id, "fish", 'chunithm', 'best', rating_chu=16.25)
+        lxns_archive = db.create_archive(user_id, "lxns", 'chunithm', 'best', rating_chu=sum(ratings))
+        for archive_id in (fish_archive, lxns_archive):
+            for order, (chart_id, rating) in enumerate(zip(chart_ids, ratings)):
+                db.add_record(archive_id, chart_id, {'order_in_archive': order, 'achievement': 1009000,
+                                                     'chuni_rating': rating})
+
+        summary = refresh_internal_levels("chunithm", level_table={('0', 0, 3): 14.5, ('1', 0, 3): 14.0}, db=db)
+        assert summary["charts"] == 1
+
+        assert db.get_archive(fish_archive)['rating_chu'] == pytest.approx(16.25)
+        records = db.get_records_with_extented_data(lxns_archive)
+        assert db.get_archive(lxns_archive)['rating_chu'] == pytest.approx(sum(r['chuni_rating'] for r in records))
+        assert db.get_archive(lxns_archive)['rating_chu'] != pytest.approx(sum(ratings))
+    print("✅ Re-level keeps Diving-Fish chunithm ratings")
+
+
+if __name__ == "__main__":
+    test_relevel_keeps_diving_fish_chunithm_rating()
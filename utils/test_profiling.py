@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the span recorder and report export in utils/profiling.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.profiling import save_report, span, start_recording, stop_recording, timed
+
+
+@timed()
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_spans_are_recorded_and_exported():
+    """Test nested spans, spans from other threads, and JSON / Chrome trace export"""
+
+    # Nothing is recorded outside of a recording
+    _busy(10)
+    assert stop_recording() is None
+
+    recorder = start_recording()
+    with span("outer", clip="0_test"):
+        _busy(10000)
+        thread = threading.Thread(target=_busy, args=(10,))
+        thread.start()
+        thread.join()
+    try:
+        with span("failing"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    stop_recording()
+
+    by_name = {}
+    for s in recorder.spans:
+        by_name.setdefault(s["name"], []).append(s)
+    assert len(by_name["test_profiling._busy"]) == 2
+    assert by_name["outer"][0]["depth"] == 0
+    assert by_name["outer"][0]["attrs"] == {"clip": "0_test"}
+    assert by_name["failing"][0]["error"] == "ValueError"
+    assert "rss_delta_mb" in by_name["outer"][0] and "process_peak_rss_mb" in by_name["outer"][0]
+    assert min(s["depth"] for s in by_name["test_profiling._busy"]) == 0  # span from the other thread
+    assert max(s["depth"] for s in by_name["test_profiling._busy"]) == 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = save_report(recorder, "job_1", output_dir=temp_dir)
+        with open(paths["report"], "r", encoding="utf-8") as f:
+            report = json.load(f)
+        with open(paths["trace"], "r", encoding="utf-8") as f:
+            trace = json.load(f)
+
+    summary = {item["name"]: item for item in report["summary"]}
+    assert summary["test_profiling._busy"]["count"] == 2
+    assert summary["outer"]["wall_time"] >= summary["test_profiling._busy"]["max_wall_time"]
+    assert len(trace["traceEvents"]) == len(recorder.spans)
+    assert all(event["ph"] == "X" for event in trace["traceEvents"])
+    print("✅ Spans recorded and exported")
+
+
+if __name__ == "__main__":
+    test_spans_are_recorded_and_exported()
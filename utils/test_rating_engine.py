@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests that the vectorized functions in utils/rating_engine.py match the scalar ones in utils/dxnet_extension.py
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+from utils import dxnet_extension
+from utils.rating_engine import (CHUNITHM_RATING_TIERS, MAIMAI_FACTOR_THRESHOLDS, MAIMAI_RATE_THRESHOLDS,
+                                 compute_chunithm_ratings, compute_ratings, get_factors, get_rates)
+
+EPS = 1e-4
+DS_VALUES = [1.0, 7.5, 12.6, 13.7, 14.9, 15.0]
+
+
+def _around(values):
+    """Each value itself and EPS either side of it"""
+    return sorted({v + d for v in values for d in (-EPS, 0.0, EPS)})
+
+
+def _maimai_achievements():
+    thresholds = [t for t, _ in MAIMAI_RATE_THRESHOLDS] + [t for t, _ in MAIMAI_FACTOR_THRESHOLDS]
+    rng = random.Random(20240101)
+    samples = [round(rng.uniform(0, 101), 4) for _ in range(2000)]
+    return _around(thresholds) + samples + [101.0]
+
+
+def _chunithm_scores():
+    bounds = []
+    for mn, _, rule in CHUNITHM_RATING_TIERS:
+        bounds.append(mn)
+        if rule[0] == 'step':
+            # step boundaries inside the tier
+            bounds.extend(mn + rule[2] * k for k in range(1, 4))
+    rng = random.Random(20240102)
+    samples = [rng.randint(700_000, 1_010_000) for _ in range(2000)]
+    return _around(bounds) + samples + [0, 1_010_000]
+
+
+def test_maimai_rates_and_factors():
+    """Test that get_rates/get_factors match get_rate/get_factor at every threshold boundary and on random samples"""
+    achievements = _maimai_achievements()
+    assert list(get_rates(achievements)) == [dxnet_extension.get_rate(a) for a in achievements]
+    assert list(get_factors(achievements)) == [dxnet_extension.get_factor(a) for a in achievements]
+    print("✅ Vectorized maimai rates and factors match the scalar functions")
+
+
+def test_maimai_ratings():
+    """Test that compute_ratings matches compute_rating for every ds at boundaries and on a random ds sample"""
+    achievements = _maimai_achievements()
+    rng = random.Random(20240103)
+    pairs = [(ds, a) for ds in DS_VALUES for a in achievements]
+    pairs += [(round(rng.uniform(1, 15.7), 1), rng.choice(achievements)) for _ in range(2000)]
+    ds_list, achievement_list = zip(*pairs)
+    assert list(compute_ratings(ds_list, achievement_list)) == \
+        [dxnet_extension.compute_rating(ds, a) for ds, a in pairs]
+    print("✅ Vectorized maimai ratings match compute_rating")
+
+
+def test_chunithm_ratings():
+    """Test that compute_chunithm_ratings matches compute_chunithm_rating at tier/step boundaries and on random samples"""
+    scores = _chunithm_scores()
+    rng = random.Random(20240104)
+    pairs = [(ds, s) for ds in DS_VALUES for s in scores]
+    pairs += [(round(rng.uniform(1, 15.7), 1), rng.choice(scores)) for _ in range(2000)]
+    ds_list, score_list = zip(*pairs)
+    assert list(compute_chunithm_ratings(ds_list, score_list)) == \
+        [dxnet_extension.compute_chunithm_rating(ds, s) for ds, s in pairs]
+    print("✅ Vectorized chunithm ratings match compute_chunithm_rating")
+
+
+if __name__ == "__main__":
+    test_maimai_rates_and_factors()
+    test_maimai_ratings()
+    test_chunithm_ratings()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Startup budget test: pages that only edit data must load without importing the
+video stack (moviepy / OpenCV), which is imported lazily on first use.
+"""
+
+import ast
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_PAGES = [
+    "st_pages/Homepage.py",
+    "st_pages/Setup_Achievements.py",
+    "st_pages/Make_Custom_Save.py",
+]
+HEAVY_MODULES = ("cv2", "moviepy")
+# Seconds allowed for importing all project modules used by the startup pages
+STARTUP_IMPORT_BUDGET = 5.0
+
+IMPORT_PROBE = """
+import json, sys, time
+modules = json.loads(sys.argv[1])
+start = time.perf_counter()
+try:
+    for name in modules:
+        __import__(name)
+except ModuleNotFoundError as e:
+    print(json.dumps({"missing": e.name}))
+    sys.exit(0)
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in sys.modules if m.split('.')[0] in json.loads(sys.argv[2]))
+print(json.dumps({"elapsed": elapsed, "heavy": heavy}))
+"""
+
+
+def _module_level_project_imports(page_path):
+    """Collect project modules (utils / db_utils) imported at module level of a page"""
+    with open(os.path.join(PROJECT_ROOT, page_path), "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    modules = []
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+        elif isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        else:
+            pending.extend(ast.iter_child_nodes(node))
+    return [m for m in modules if m.split('.')[0] in ("utils", "db_utils")]
+
+
+def test_startup_pages_skip_video_stack():
+    """Test that startup pages import neither cv2 nor moviepy, within the time budget"""
+
+    modules = []
+    for page in STARTUP_PAGES:
+        modules.extend(m for m in _module_level_project_imports(page) if m not in modules)
+    print(f"Importing {len(modules)} modules used by startup pages...")
+
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE, json.dumps(modules), json.dumps(HEAVY_MODULES)],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    if "missing" in result:
+        pytest.skip(f"dependency not installed: {result['missing']}")
+
+    assert not result["heavy"], f"startup pages imported the video stack: {result['heavy']}"
+    assert result["elapsed"] < STARTUP_IMPORT_BUDGET, \
+        f"startup imports took {result['elapsed']:.2f}s (budget {STARTUP_IMPORT_BUDGET}s)"
+    print(f"✅ Startup imports took {result['elapsed']:.2f}s without importing {', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    test_startup_pages_skip_video_stack()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the chart video trim window planning in utils/video_trim_cache.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+import utils.video_trim_cache as video_trim_cache
+from utils.video_trim_cache import TRIM_MIN_SKIP, get_trimmed_offset, plan_trim_window
+
+
+def test_plan_trim_window():
+    """Test that late slices are cut at the preceding keyframe and early or invalid slices are left alone"""
+    keyframes = [0.0, 4.0, 8.0, 12.0, 16.0, 60.0, 64.0]
+    # 从截取区间之前最近的关键帧开始直接复制，结束时间向上取整
+    assert plan_trim_window(63.5, 73.2, 180.0, keyframes, margin=2.0) == (60.0, 76, True)
+    # 结束位置不超过视频长度
+    assert plan_trim_window(170.0, 180.0, 180.0, keyframes, margin=2.0) == (64.0, 180.0, True)
+    # 截取时间靠前，或最近的关键帧靠前时不裁剪
+    assert plan_trim_window(5.0, 15.0, 180.0, keyframes, margin=2.0) is None
+    assert plan_trim_window(TRIM_MIN_SKIP + 1, 30.0, 180.0, [0.0], margin=0.5) is None
+    # 截取时间无效时由edit_game_video_clip按原视频调整
+    assert plan_trim_window(200.0, 210.0, 180.0, keyframes) is None
+    assert plan_trim_window(50.0, 40.0, 180.0, keyframes) is None
+    # 没有关键帧信息时从区间开始处重新编码
+    assert plan_trim_window(63.5, 73.2, 180.0, [], margin=2.0) == (61.5, 76, False)
+    print("✅ Trim windows planned at keyframes")
+
+
+def test_trimmed_offset_and_failed_probe(monkeypatch, tmp_path):
+    """Test that the trimmed file's first keyframe pts is subtracted and failed probes are not cached"""
+    # 含B帧的视频直接复制后，起始关键帧的时间戳不为0
+    monkeypatch.setattr(video_trim_cache, "list_keyframes", lambda path, max_packets=None: [0.084, 2.084])
+    assert get_trimmed_offset("trimmed.mp4", 40.0) == pytest.approx(39.916)
+
+    import utils.encoding_translation as encoding_translation
+    video_path = tmp_path / "chart.mp4"
+    video_path.write_bytes(b"video")
+    monkeypatch.setattr(video_trim_cache, "TRIM_CACHE_DIR", str(tmp_path / "trim_cache"))
+    monkeypatch.setattr(encoding_translation, "probe_video", lambda path: {"duration": 0.0})
+    assert video_trim_cache._get_video_index(str(video_path))[0] == 0.0
+    monkeypatch.setattr(encoding_translation, "probe_video", lambda path: {"duration": 120.0})
+    assert video_trim_cache._get_video_index(str(video_path))[0] == 120.0
+
+
+def test_remove_trimmed_videos(monkeypatch, tmp_path):
+    """Test that stale trims of a source are evicted while the current and recently used ones are kept"""
+    cache_dir = tmp_path / "trim_cache"
+    cache_dir.mkdir()
+    monkeypatch.setattr(video_trim_cache, "TRIM_CACHE_DIR", str(cache_dir))
+    current = cache_dir / "youtube-abc-p0_40s_0123456789ab.mp4"
+    stale = cache_dir / "youtube-abc-p0_80s_ba9876543210.mp4"
+    recent = cache_dir / "youtube-abc-p0_20s_aaaaaaaaaaaa.mp4"
+    other = cache_dir / "youtube-abc-p01_80s_bbbbbbbbbbbb.mp4"
+    for path in (current, stale, recent, other):
+        path.write_bytes(b"trimmed")
+    os.utime(stale, (0, 0))
+    os.utime(current, (0, 0))
+
+    deleted = video_trim_cache.remove_trimmed_videos("/videos/youtube-abc-p0.mp4", keep=str(current), max_age=3600)
+    assert deleted == [str(stale)]
+    assert current.exists() and recent.exists() and other.exists()
+    # 原视频被删除时删除其所有裁剪文件
+    video_trim_cache.remove_trimmed_videos("/videos/youtube-abc-p0.mp4")
+    assert sorted(os.listdir(cache_dir)) == [other.name]
+
+
+if __name__ == "__main__":
+    test_plan_trim_window()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the raw-frame ffmpeg pipe writer in utils/video_writer.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+from utils.video_writer import get_ffmpeg_binary, write_video_clip
+
+
+class _GradientClip:
+    """Minimal stand-in for a composited moviepy clip: float RGBA frames, no audio"""
+    size = (64, 36)
+    duration = 1.0
+    audio = None
+
+    def get_frame(self, t):
+        return np.full((self.size[1], self.size[0], 4), 200.0 * t, dtype=np.float64)
+
+
+def test_write_video_clip():
+    """Test encoding a clip through the pipe, and that a failed encode leaves no partial file"""
+    if shutil.which(get_ffmpeg_binary()) is None:
+        pytest.skip("ffmpeg not installed")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, "0_Best_1.mp4")
+        write_video_clip(_GradientClip(), output_path, fps=30, bitrate="500k", preset="ultrafast", queue_size=2)
+        assert os.path.getsize(output_path) > 0
+
+        failed_path = os.path.join(temp_dir, "1_Best_2.mp4")
+        with pytest.raises(IOError):
+            write_video_clip(_GradientClip(), failed_path, preset="no_such_preset")
+        assert not os.path.exists(failed_path)
+    print("✅ Clip encoded through the ffmpeg pipe")
+
+
+if __name__ == "__main__":
+    test_write_video_clip()
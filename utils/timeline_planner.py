@@ -0,0 +1,261 @@
+"""
+完整视频时间线规划（不渲染）
+
+根据load_full_config_for_composite_video读取的片段配置，按照create_full_video的拼接规则计算：
+- 每个片段在完整视频中的开始、结束时间，以及转场造成的重叠区间
+- full_last_clip（完整播放最终片段）能否生效，不能生效时的原因
+- 缺失的素材（谱面视频、成绩图、背景图、模板素材），以及会导致渲染失败的错误
+- 仅生成片段模式下需要重新渲染的片段，以及预计渲染耗时
+
+规划过程只读取配置和文件状态，不打开任何视频；需要原视频时长时使用ffprobe，
+结果与视频编码统一共用缓存（见utils/encoding_translation.py）。
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.PageUtils import remove_invalid_chars
+
+# 粗略估计的渲染速度：1920x1080下每秒渲染的帧数（CPU合成+编码），其他分辨率按像素数换算
+DEFAULT_RENDER_FPS = 8.0
+REFERENCE_PIXELS = 1920 * 1080
+# create_full_video中完整播放最终片段时，去掉原视频结尾的秒数
+FULL_LAST_CLIP_TAIL = 5
+
+
+def probe_durations(video_paths: List[str]) -> Dict[str, Optional[float]]:
+    """获取视频时长，优先使用ffprobe缓存；文件不存在或无法获取时为None"""
+    from utils.encoding_translation import CODEC_CACHE_FILE, ProbeCache, probe_video
+    caches, updated, durations = {}, set(), {}
+    for video_path in video_paths:
+        if not video_path or not os.path.exists(video_path):
+            durations[video_path] = None
+            continue
+        file_path = Path(video_path)
+        cache = caches.setdefault(file_path.parent, ProbeCache(file_path.parent / CODEC_CACHE_FILE))
+        info = cache.get(file_path)
+        if not info or not info.get("duration"):
+            info = probe_video(video_path)
+            if info.get("duration"):
+                cache.put(file_path, info)
+                updated.add(file_path.parent)
+        durations[video_path] = info.get("duration") or None
+    for directory in updated:
+        try:
+            caches[directory].save()
+        except OSError as e:
+            print(f"Warning: 保存视频信息缓存失败: {e}")
+    return durations
+
+
+def _clip_output_file(video_output_path: str, index: int, config: Dict) -> str:
+    """与render_all_video_clips相同的片段文件名"""
+    return os.path.join(video_output_path, f"{index}_{remove_invalid_chars(config['clip_title_name'])}.mp4")
+
+
+def _clip_render_reason(output_file: str, config: Dict, force_render: bool) -> Optional[str]:
+    """片段需要重新渲染的原因，不需要时返回None"""
+    if force_render:
+        return "force_render"
+    if not os.path.exists(output_file):
+        return "missing"
+    output_mtime = os.path.getmtime(output_file)
+    for key in ("video", "main_image", "bg_image"):
+        input_path = config.get(key)
+        if input_path and os.path.exists(input_path) and os.path.getmtime(input_path) > output_mtime:
+            return "inputs_changed"
+    return None
+
+
+def _check_style_assets(style_config: Dict, has_info_clips: bool, issues: Dict):
+    asset_paths = style_config.get('asset_paths', {})
+    required = ['content_bg', 'comment_font']
+    if has_info_clips:
+        required += ['intro_video_bg', 'intro_text_bg', 'intro_bgm']
+    for key in required:
+        path = asset_paths.get(key)
+        if not path or not os.path.exists(path):
+            issues['missing_assets'].append({"clip_title_name": None, "asset": key, "path": path})
+            issues['errors'].append(f"视频模板素材 {key} 不存在: {path}")
+    if style_config.get('options', {}).get('content_use_video_bg', False):
+        path = asset_paths.get('content_bg_video')
+        if not path or not os.path.exists(path):
+            issues['missing_assets'].append({"clip_title_name": None, "asset": "content_bg_video", "path": path})
+            issues['warnings'].append(f"背景视频不存在，将使用背景图片代替: {path}")
+
+
+def _check_main_clip(config: Dict, issues: Dict):
+    name = config.get('clip_title_name')
+    if not config.get('video') or not os.path.exists(config['video']):
+        issues['missing_assets'].append({"clip_title_name": name, "asset": "video", "path": config.get('video')})
+        issues['warnings'].append(f"{name} 没有对应的视频，将使用黑屏代替")
+    if not config.get('main_image') or not os.path.exists(config['main_image']):
+        issues['missing_assets'].append({"clip_title_name": name, "asset": "main_image", "path": config.get('main_image')})
+        issues['warnings'].append(f"{name} 没有对应的成绩图")
+    if not config.get('bg_image') or not os.path.exists(config['bg_image']):
+        issues['missing_assets'].append({"clip_title_name": name, "asset": "bg_image", "path": config.get('bg_image')})
+        issues['warnings'].append(f"{name} 没有对应的背景图，将使用默认背景")
+
+
+def plan_full_video(main_configs: List[Dict], intro_configs: List[Dict] = None, ending_configs: List[Dict] = None,
+                    style_config: Dict = None, resolution=(1920, 1080), trans_enable: bool = True,
+                    trans_time: float = 1.0, full_last_clip: bool = False, video_output_path: str = None,
+                    force_render: bool = False, fps: int = 30, render_fps: float = None) -> Dict:
+    """
+    计算完整视频的时间线并检查素材，不修改传入的配置
+
+    Returns:
+        dict: status为"error"时表示按当前配置渲染会失败（原因见errors）；
+        timeline为完整视频中的片段（开始、结束时间），overlaps为转场重叠区间，
+        clips_to_render为仅生成片段模式下需要（重新）渲染的片段文件
+    """
+    intro_configs = intro_configs or []
+    ending_configs = ending_configs or []
+    overlap = trans_time if trans_enable else 0
+    issues = {"errors": [], "warnings": [], "missing_assets": []}
+    timeline, overlaps = [], []
+
+    if style_config:
+        _check_style_assets(style_config, bool(intro_configs or ending_configs), issues)
+    else:
+        issues['errors'].append("未找到视频模板配置")
+
+    def check_duration(item):
+        if item['duration'] <= 0:
+            issues['errors'].append(f"{item['clip_title_name']} 的时长无效: {item['duration']:.2f}秒")
+        elif overlap and item['duration'] < 2 * overlap:
+            issues['warnings'].append(f"{item['clip_title_name']} 的时长 {item['duration']:.2f}秒 小于两倍过渡时间，"
+                                      f"渐入渐出会重叠")
+
+    def append(item):
+        # 与add_clip_with_transition相同：除第一个片段外，每个片段提前overlap秒开始
+        if timeline:
+            previous = timeline[-1]
+            item['start'] = previous['end'] - overlap
+            if overlap:
+                overlaps.append({"from": previous['clip_title_name'], "to": item['clip_title_name'],
+                                 "start": item['start'], "end": previous['end']})
+        else:
+            item['start'] = 0.0
+        item['end'] = item['start'] + item['duration']
+        timeline.append(item)
+        check_duration(item)
+
+    def info_item(part, config, index):
+        name = config.get('clip_title_name') or f"{part}_{index + 1}"
+        if 'duration' not in config:
+            issues['errors'].append(f"片段 {name} 缺少 'duration' 字段")
+        if 'text' not in config:
+            issues['warnings'].append(f"片段 {name} 缺少 'text' 字段，将使用默认文本")
+        return {"part": part, "clip_title_name": name, "duration": float(config.get('duration', 0))}
+
+    for index, config in enumerate(intro_configs):
+        append(info_item("intro", config, index))
+
+    full_last = {"requested": full_last_clip, "applied": False, "info": None}
+    ending_items = []
+    last_video_duration = None
+    if full_last_clip and main_configs:
+        last_video_duration = probe_durations([main_configs[-1].get('video')]).get(main_configs[-1].get('video'))
+
+    for index, config in enumerate(main_configs):
+        _check_main_clip(config, issues)
+        item = {"part": "main", "clip_title_name": config.get('clip_title_name'),
+                "duration": float(config.get('duration', 0))}
+        if full_last_clip and index == len(main_configs) - 1:
+            if last_video_duration is None:
+                issues['errors'].append(f"无法获取最终片段 {item['clip_title_name']} 的视频时长，无法完整播放最终片段")
+            else:
+                item['duration'] = last_video_duration - FULL_LAST_CLIP_TAIL - config.get('start', 0)
+            if not timeline:
+                issues['errors'].append("完整播放最终片段时，最终片段之前至少需要一个片段")
+            ending_items.append(item)
+        else:
+            append(item)
+
+    for index, config in enumerate(ending_configs):
+        item = info_item("ending", config, index)
+        if full_last_clip:
+            ending_items.append(item)
+        else:
+            append(item)
+
+    if full_last_clip:
+        if not main_configs:
+            issues['errors'].append("没有主要片段，无法完整播放最终片段")
+        elif ending_items:
+            # 与get_combined_ending_clip相同：结尾片段叠加在最终片段的末尾，使用最终片段的音频
+            b1, endings = ending_items[0], ending_items[1:]
+            ending_duration = sum(item['duration'] for item in endings)
+            combined = {"part": "combined_ending", "clip_title_name": b1['clip_title_name'], "children": []}
+            if not endings:
+                combined['duration'] = b1['duration']
+                full_last['info'] = "没有结尾片段，只保留完整的最终片段"
+                full_last['applied'] = True
+            elif ending_duration > b1['duration']:
+                # 所有片段从同一时间开始叠加，时长为其中最长的片段
+                combined['duration'] = max(item['duration'] for item in ending_items)
+                full_last['info'] = (f"最终片段时长 {b1['duration']:.2f}秒 不足以容纳结尾片段（{ending_duration:.2f}秒），"
+                                     f"FULL_LAST_CLIP选项将无效化")
+                issues['warnings'].append(full_last['info'])
+            else:
+                combined['duration'] = b1['duration']
+                offset = b1['duration'] - ending_duration
+                combined['children'] = [{"clip_title_name": b1['clip_title_name'], "start": 0.0, "end": offset}]
+                for item in endings:
+                    combined['children'].append({"clip_title_name": item['clip_title_name'],
+                                                 "start": offset, "end": offset + item['duration']})
+                    offset += item['duration']
+                full_last['applied'] = True
+            append(combined)
+            for child in combined['children']:
+                child['start'] += combined['start']
+                child['end'] += combined['start']
+
+    if trans_enable:
+        total_duration = max((item['end'] for item in timeline), default=0.0)
+    else:
+        # concatenate_videoclips按顺序拼接，不使用片段的开始时间
+        total_duration = sum(item['duration'] for item in timeline)
+
+    # 仅生成片段模式下的片段文件（序号与render_all_video_clips一致，不受full_last_clip影响）
+    clips = []
+    if video_output_path:
+        all_configs = ([("intro", c) for c in intro_configs] + [("main", c) for c in main_configs]
+                       + [("ending", c) for c in ending_configs])
+        for index, (part, config) in enumerate(all_configs):
+            if not config.get('clip_title_name'):
+                continue
+            output_file = _clip_output_file(video_output_path, index, config)
+            clips.append({"part": part, "clip_title_name": config['clip_title_name'], "output_file": output_file,
+                          "duration": float(config.get('duration', 0)),
+                          "render_reason": _clip_render_reason(output_file, config, force_render)})
+    clips_to_render = [clip for clip in clips if clip['render_reason']]
+
+    speed = (render_fps or DEFAULT_RENDER_FPS) * REFERENCE_PIXELS / (resolution[0] * resolution[1])
+    full_video_frames = int(total_duration * fps)
+    clip_frames = int(sum(clip['duration'] for clip in clips_to_render) * fps)
+    estimate = {
+        "full_video_frames": full_video_frames,
+        "full_video_seconds": full_video_frames / speed,
+        "clip_frames": clip_frames,
+        "clip_seconds": clip_frames / speed,
+    }
+
+    status = "error" if issues['errors'] else "success"
+    info = (f"完整视频时长 {total_duration:.1f}秒，共 {len(timeline)} 段，预计渲染约 {estimate['full_video_seconds'] / 60:.1f} 分钟；"
+            f"{len(issues['errors'])} 个错误，{len(issues['warnings'])} 个警告")
+    return {
+        "status": status,
+        "info": info,
+        "total_duration": total_duration,
+        "resolution": list(resolution),
+        "fps": fps,
+        "timeline": timeline,
+        "overlaps": overlaps,
+        "full_last_clip": full_last,
+        "clips": clips,
+        "clips_to_render": [clip['output_file'] for clip in clips_to_render],
+        "estimate": estimate,
+        **issues,
+    }
@@ -1,10 +1,11 @@
 import glob
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from lxml import etree
 import os
 import re
 import json
-import requests
+from utils import http_client
 
 from utils.dxnet_extension import ChartManager
 from utils.DataUtils import (
@@ -46,7 +47,7 @@ def get_data_from_fish(username, params=None):
                 "username": username,
                 "b50": "1"
             }
-            response = requests.post(url, headers=headers, json=payload)
+            response = http_client.post(url, headers=headers, json=payload)
             if response.status_code == 200:
                 return response.json()
             elif response.status_code == 400 or response.status_code == 403:
@@ -59,7 +60,7 @@ def get_data_from_fish(username, params=None):
             
         elif query == "all":
             # get all data from thrid party function call
-            response = requests.get(FC_PROXY_ENDPOINT, params={"username": username, "game": "maimai"}, timeout=60)
+            response = http_client.get(FC_PROXY_ENDPOINT, params={"username": username, "game": "maimai"}, timeout=60)
             response.raise_for_status()
 
             return json.loads(response.text)
@@ -69,7 +70,7 @@ def get_data_from_fish(username, params=None):
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
                 "Content-Type": "application/json"
             }
-            response = requests.get(url, headers=headers)
+            response = http_client.get(url, headers=headers)
             response.raise_for_status()
 
             return response.json()
@@ -86,7 +87,7 @@ def get_data_from_fish(username, params=None):
             payload = {
                 "username": username,
             }
-            response = requests.post(url, headers=headers, json=payload)
+            response = http_client.post(url, headers=headers, json=payload)
             if response.status_code == 200:
                 return response.json()
             elif response.status_code == 400 or response.status_code == 403:
@@ -134,7 +135,7 @@ def get_data_from_lxns(friend_code, api_key, params=None):
                 "Authorization": api_key
             }
             
-            response = requests.get(bests_url, headers=headers, timeout=10)
+            response = http_client.get(bests_url, headers=headers, timeout=10)
             if response.status_code == 200:
                 return response.json()
             elif response.status_code == 401:
@@ -602,26 +603,32 @@ def find_origin_b50(username, file_type = "html", game_type = "maimai"):
 # Read B50 from DX NET raw HTML
 ################################################
 
+# DX NET页面中B35和B15区块的标题
+B35_DIV_NAMES = [
+    "Songs for Rating(Others)",
+    "RATING対象曲（ベスト）"
+]
+B15_DIV_NAMES = [
+    "Songs for Rating(New)",
+    "RATING対象曲（新曲）"
+]
+# 预编译的XPath，避免每次解析重复编译
+_XPATH_SCREW = etree.XPath('//div[text()=$name]')
+
 def read_b50_from_html(b50_raw_file, username):
     html_raw = find_origin_b50(username, "html")
-    html_tree = etree.HTML(html_raw)
+    b50_json = parse_b50_html(etree.HTML(html_raw), username)
+
+    # Write b50 JSON to raw file
+    with open(b50_raw_file, 'w', encoding="utf-8") as f:
+        json.dump(b50_json, f, ensure_ascii = False, indent = 4)
+    return b50_json
+
+def parse_b50_html(html_tree, username):
+    """从DX NET页面的解析树中提取B35和B15成绩"""
     # Locate B35 and B15
-    b35_div_names = [
-        "Songs for Rating(Others)",
-        "RATING対象曲（ベスト）"
-    ]
-    b15_div_names = [
-        "Songs for Rating(New)",
-        "RATING対象曲（新曲）"
-    ]
-    b35_screw = locate_html_screw(html_tree, b35_div_names)
-    b15_screw = locate_html_screw(html_tree, b15_div_names)
-
-    # html_screws = html_tree.xpath('//div[@class="screw_block m_15 f_15 p_s"]')
-    # if not html_screws:
-    #     raise Exception("Error: B35/B15 screw not found. Please check HTML input!")
-    # b35_screw = html_screws[1]
-    # b15_screw = html_screws[0]
+    b35_screw = locate_html_screw(html_tree, B35_DIV_NAMES)
+    b15_screw = locate_html_screw(html_tree, B15_DIV_NAMES)
 
     # Iterate songs and save as JSON
     b50_json = {
@@ -646,23 +653,50 @@ def read_b50_from_html(b50_raw_file, username):
         b50_json["charts"]["dx"].append(song_json)
 
     b50_json["rating"] = manager.total_rating
-
-    # Write b50 JSON to raw file
-    with open(b50_raw_file, 'w', encoding="utf-8") as f:
-        json.dump(b50_json, f, ensure_ascii = False, indent = 4)
     return b50_json
 
+def _parse_b50_html_file(html_file, username):
+    # 直接从文件解析，不需要先将整个页面读入字符串
+    html_tree = etree.parse(html_file, etree.HTMLParser(encoding="utf-8"))
+    return parse_b50_html(html_tree, username)
+
+def read_b50_from_html_batch(html_exports, max_workers=None):
+    """
+    批量解析多个DX NET页面导出文件（用于批量导入用户），在进程池中并行处理
+
+    Args:
+        html_exports: {username: html文件路径}
+        max_workers: 进程数，默认为CPU核数
+
+    Returns:
+        dict: {username: {"status": "success", "data": b50_json} 或 {"status": "error", "info": 错误信息}}
+    """
+    results = {}
+    if not html_exports:
+        return results
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(html_exports)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_parse_b50_html_file, path, username): username
+                   for username, path in html_exports.items()}
+        for future in as_completed(futures):
+            username = futures[future]
+            try:
+                results[username] = {"status": "success", "data": future.result()}
+            except Exception as e:
+                print(f"Error: 解析 {username} 的DX NET页面失败: {e}")
+                results[username] = {"status": "error", "info": f"解析 {html_exports[username]} 失败: {e}"}
+    return results
+
 def locate_html_screw(html_tree, div_names):
     for name in div_names:
-        screw = html_tree.xpath(f'//div[text()="{name}"]')
+        screw = _XPATH_SCREW(html_tree, name=name)
         if screw:
             return screw[0]
     raise Exception(f"Error: HTML screw (type = \"{div_names[0]}\") not found.")
 
 def iterate_songs(div_screw):
-    current_div = div_screw
-    while True:
-        current_div = current_div.xpath('following-sibling::div[1]')[0]
+    # 沿兄弟节点依次遍历，直到遇到不含子节点的div
+    for current_div in div_screw.itersiblings("div"):
         if len(current_div) == 0:
             break
         yield current_div
@@ -687,20 +721,6 @@ def parse_html_to_json(song_div, song_id_placeholder):
         "type": "",
     }
 
-    # Get achievements
-    score_div = song_div.xpath('.//div[contains(@class, "music_score_block")]')
-    if score_div:
-        score_text = score_div[0].text
-        score_text = score_text.strip().replace('\xa0', '').replace('\n', '').replace('\t', '')
-        score_text = score_text.rstrip('%')
-        chart["achievements"] = float(score_text)
-
-    # Get song level and internal level
-    level_div = song_div.xpath('.//div[contains(@class, "music_lv_block")]')
-    if level_div:
-        level_text = level_div[0].text
-        chart["level"] = level_text
-
     # Get song difficulty
     div_class = song_div.get("class", "")
     for idx, level in enumerate(LEVEL_DIV_LABEL):
@@ -709,16 +729,32 @@ def parse_html_to_json(song_div, song_id_placeholder):
             chart["level_label"] = LEVEL_LABEL[idx]
             break
 
-    # Get song title
-    title_div = song_div.xpath('.//div[contains(@class, "music_name_block")]')
-    if title_div:
-        chart["title"] = title_div[0].text
-
-    # Get chart type
-    kind_icon_img = song_div.xpath('.//img[contains(@class, "music_kind_icon")]')
-    if kind_icon_img:
-        img_src = kind_icon_img[0].get("src", "")
-        chart["type"] = "DX" if img_src.endswith("dx.png") else "SD"
+    # 一次遍历所有子孙节点，按class提取成绩、等级、曲名和谱面类型（各取第一个匹配的节点）
+    found = set()
+    for node in song_div.iterdescendants("div", "img"):
+        node_class = node.get("class", "")
+        if node.tag == "img":
+            if "type" not in found and "music_kind_icon" in node_class:
+                # Get chart type
+                found.add("type")
+                chart["type"] = "DX" if node.get("src", "").endswith("dx.png") else "SD"
+        elif "score" not in found and "music_score_block" in node_class:
+            # Get achievements
+            found.add("score")
+            score_text = node.text
+            score_text = score_text.strip().replace('\xa0', '').replace('\n', '').replace('\t', '')
+            score_text = score_text.rstrip('%')
+            chart["achievements"] = float(score_text)
+        elif "level" not in found and "music_lv_block" in node_class:
+            # Get song level and internal level
+            found.add("level")
+            chart["level"] = node.text
+        elif "title" not in found and "music_name_block" in node_class:
+            # Get song title
+            found.add("title")
+            chart["title"] = node.text
+        if len(found) == 4:
+            break
 
     return chart
 
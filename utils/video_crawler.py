@@ -1,6 +1,10 @@
 from pytubefix import YouTube, Search
 from bilibili_api import login, user, search, video, Credential, sync, HEADERS
 from utils.PageUtils import download_temp_image_to_static
+from utils.PathUtils import get_download_job_dir
+from utils.segment_fetch import build_segment_fetch_args, save_segment_info
+from utils.resumable_download import (download_url_resumable, StreamExpiredError, prepare_job_dir,
+                                      load_stream_manifest, save_stream_manifest, clear_stream_manifest)
 from typing import Tuple, Optional
 from abc import ABC, abstractmethod
 import os
@@ -8,13 +12,15 @@ import yaml
 import json
 import asyncio
 import pickle
-import httpx
 import traceback
 import subprocess
 import platform
 import re
+import html
 import requests
+from utils import http_client
 import time
+import shutil
 
 # 根据操作系统选择FFMPEG的输出重定向方式
 # TODO：添加日志输出
@@ -25,6 +31,7 @@ else:
 
 FFMPEG_PATH = 'ffmpeg'
 MAX_LOGIN_RETRIES = 3
+BILIBILI_INFO_CONCURRENCY = 4  # 并发补全B站视频分P信息时的最大请求数
 BILIBILI_URL_PREFIX = "https://www.bilibili.com/video/"
 
 def custom_po_token_verifier() -> Tuple[str, str]:
@@ -83,11 +90,14 @@ def remove_html_tags_and_invalid_chars(text: str) -> str:
     return text.strip()  # 去除首尾空白字符
 
 def convert_duration_to_seconds(duration: str) -> int:
+    """将"mm:ss"或"hh:mm:ss"格式的时长转换为秒数"""
     try:
-        minutes, seconds = map(int, duration.split(':'))
-        return minutes * 60 + seconds
+        seconds = 0
+        for part in str(duration).split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
     except:
-        return int(duration)
+        return 0
 
 def load_credential(credential_path):
     if not os.path.isfile(credential_path):
@@ -131,22 +141,18 @@ def load_credential(credential_path):
         return credential
 
 async def download_url_from_bili(url: str, out: str, info: str):
-    async with httpx.AsyncClient(headers=HEADERS) as sess:
-        resp = await sess.get(url)
-        length = resp.headers.get('content-length')
-        with open(out, 'wb') as f:
-            process = 0
-            for chunk in resp.iter_bytes(1024):
-                if not chunk:
-                    break
-
-                process += len(chunk)
-                percentage = (process / int(length)) * 100 if length else 0
-                print(f'      -- [正在从bilibili下载流: {info} {percentage:.2f}%]', end='\r')
-                f.write(chunk)
-        print("Done.\n")
-
-async def bilibili_download(bvid, credential, output_name, output_path, high_res=False, p_index=0):
+    # B站媒体流需要携带Referer等请求头
+    await download_url_resumable(url, out, f"bilibili {info}", headers=HEADERS)
+
+def run_ffmpeg(args):
+    """执行ffmpeg命令（自动添加-y），失败时抛出异常"""
+    process = subprocess.run([FFMPEG_PATH, '-y', '-hide_banner', '-loglevel', 'error', *args],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg执行失败: {process.stderr.strip()}")
+
+async def resolve_bilibili_streams(bvid, credential, high_res=False, p_index=0):
+    """解析B站视频的媒体流地址，返回 {"flv": 是否为FLV流, "urls": [视频流(, 音频流)]}"""
     v = video.Video(bvid=bvid, credential=credential)
     download_url_data = await v.get_download_url(p_index)
     detecter = video.VideoDownloadURLDataDetecter(data=download_url_data)
@@ -157,27 +163,70 @@ async def bilibili_download(bvid, credential, output_name, output_path, high_res
     else:
         streams = detecter.detect_best_streams(video_max_quality=video.VideoQuality._480P,
                                                no_dolby_video=True, no_dolby_audio=True, no_hdr=True)
+    if detecter.check_flv_stream() == True:
+        return {"flv": True, "urls": [streams[0].url]}
+    return {"flv": False, "urls": [streams[0].url, streams[1].url]}
 
+async def bilibili_download(bvid, credential, output_name, output_path, high_res=False, p_index=0):
     output_file = os.path.join(output_path, f"{output_name}.mp4")
-    if detecter.check_flv_stream() == True:
-        # FLV 流下载
-        await download_url_from_bili(streams[0].url, "flv_temp.flv", "FLV 音视频")
-        os.system(f'{FFMPEG_PATH} -y -i flv_temp.flv {output_file} {REDIRECT}')
-        # 删除临时文件
-        os.remove("flv_temp.flv")
-        print(f"下载完成，存储为: {output_name}.mp4")
-    else:
-        # MP4 流下载
-        await download_url_from_bili(streams[0].url, "video_temp.m4s", "视频流")
-        await download_url_from_bili(streams[1].url, "audio_temp.m4s", "音频流")
-        print(f"下载完成，正在合并视频和音频")
-        os.system(f'{FFMPEG_PATH} -y -i video_temp.m4s -i audio_temp.m4s -vcodec copy -acodec copy {output_file} {REDIRECT}')
-        # 删除临时文件
-        os.remove("video_temp.m4s")
-        os.remove("audio_temp.m4s")
-        print(f"合并完成，存储为: {output_name}.mp4")
+    # 每个下载任务使用独立的临时目录，多个任务可以同时下载；下载失败时保留中间文件以便续传
+    temp_dir = get_download_job_dir(output_path, output_name)
+    temp_output = os.path.join(temp_dir, f"{output_name}.mp4")
+    manifest_key = {"source": "bilibili", "id": bvid, "p_index": p_index, "high_res": high_res}
+    prepare_job_dir(temp_dir, manifest_key)
+
+    # 续传时优先使用缓存的流地址，仅在地址过期或失效时重新解析
+    streams = load_stream_manifest(temp_dir, manifest_key)
+    for attempt in range(2):
+        if streams is None:
+            streams = await resolve_bilibili_streams(bvid, credential, high_res, p_index)
+            save_stream_manifest(temp_dir, manifest_key, streams)
+        try:
+            if streams["flv"]:
+                # FLV 流下载
+                flv_file = os.path.join(temp_dir, "flv_temp.flv")
+                await download_url_from_bili(streams["urls"][0], flv_file, "FLV 音视频")
+                run_ffmpeg(['-i', flv_file, temp_output])
+            else:
+                # MP4 流下载，视频流和音频流同时下载
+                video_file = os.path.join(temp_dir, "video_temp.m4s")
+                audio_file = os.path.join(temp_dir, "audio_temp.m4s")
+                await asyncio.gather(
+                    download_url_from_bili(streams["urls"][0], video_file, "视频流"),
+                    download_url_from_bili(streams["urls"][1], audio_file, "音频流"),
+                )
+                print(f"下载完成，正在合并视频和音频")
+                run_ffmpeg(['-i', video_file, '-i', audio_file, '-vcodec', 'copy', '-acodec', 'copy', temp_output])
+            break
+        except StreamExpiredError:
+            if attempt == 1:
+                raise
+            print("媒体流地址已失效，重新解析后继续下载")
+            clear_stream_manifest(temp_dir)
+            streams = None
+
+    # 合并完成后原子地移动到目标位置，避免留下不完整的视频文件
+    os.replace(temp_output, output_file)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    print(f"下载完成，存储为: {output_name}.mp4")
 
 class Downloader(ABC):
+    # 搜索请求共享的限流器（参见utils/search_scheduler.py），为None时不限流
+    rate_limiter = None
+
+    def set_rate_limiter(self, limiter):
+        self.rate_limiter = limiter
+
+    def _wait_search_slot(self):
+        """发起远程搜索请求前调用，等待限流器放行"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _report_throttled(self):
+        """远程搜索请求被平台限流时调用，通知限流器退避"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.penalize()
+
     @abstractmethod
     def search_video(self, keyword):
         pass
@@ -186,6 +235,27 @@ class Downloader(ABC):
     def download_video(self, video_id, output_name, output_path, high_res=False, p_index=0):
         pass
     
+    def download_video_segment(self, video_id, output_name, output_path, start, end, high_res=False, p_index=0):
+        """只下载原视频中[start, end]秒的片段，不支持时抛出NotImplementedError，由调用方回退到完整下载"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持片段下载")
+
+    def _fetch_segment(self, input_urls, output_name, output_path, start, end, headers=None):
+        """使用ffmpeg从远程媒体流中截取片段，完成后原子地移动到目标位置，并记录片段在原视频中的时间"""
+        os.makedirs(output_path, exist_ok=True)
+        output_file = os.path.join(output_path, f"{output_name}.mp4")
+        temp_dir = get_download_job_dir(output_path, f"{output_name}_segment")
+        temp_output = os.path.join(temp_dir, f"{output_name}.mp4")
+        try:
+            print(f"正在下载片段 [{start:.1f}s - {end:.1f}s]: {output_name}")
+            run_ffmpeg(build_segment_fetch_args(input_urls, start, end, temp_output,
+                                                headers=headers, proxy=getattr(self, 'proxy', None)))
+            save_segment_info(output_file, start, end)
+            os.replace(temp_output, output_file)
+            print(f"片段下载完成，存储为: {output_name}.mp4")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return output_file
+
     @abstractmethod
     def get_video_info(self, video_id):
         """通过视频ID直接获取视频信息"""
@@ -217,6 +287,7 @@ class PurePytubefixDownloader(Downloader):
         self.search_max_results = search_max_results
         self.use_api = use_api  # 是否使用 YouTube Data API v3 进行搜索
         self.api_key = api_key  # YouTube Data API v3 的 API Key
+        self._duration_cache = {}  # 以视频ID为键缓存视频时长
         
         # 如果没有提供 API Key，尝试从配置文件读取
         if self.use_api and not self.api_key:
@@ -254,20 +325,13 @@ class PurePytubefixDownloader(Downloader):
             'order': 'relevance'  # 按相关性排序
         }
         
-        # 配置代理
-        proxies = None
-        if self.proxy:
-            proxies = {
-                'http': self.proxy,
-                'https': self.proxy
-            }
-        
         max_retries = 3
         retry_delay = 2
         
         for attempt in range(max_retries):
+            self._wait_search_slot()
             try:
-                response = requests.get(api_url, params=params, proxies=proxies, timeout=10)
+                response = http_client.get(api_url, params=params, proxy=self.proxy, timeout=10)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -304,7 +368,8 @@ class PurePytubefixDownloader(Downloader):
                 error_msg = str(e)
                 if response.status_code == 403:
                     raise Exception(f"YouTube API 搜索失败 (403错误): API Key 可能无效或配额已用完。请检查 API Key 配置。")
-                elif response.status_code == 400:
+                elif response.status_code in (400, 429):
+                    self._report_throttled()
                     if attempt < max_retries - 1:
                         print(f"API搜索失败 (尝试 {attempt + 1}/{max_retries}): {error_msg}")
                         print(f"等待 {retry_delay} 秒后重试...")
@@ -336,22 +401,20 @@ class PurePytubefixDownloader(Downloader):
         if not video_ids:
             return {}
         
+        # 多个关键词变体常返回相同的视频，已查询过时长的视频不再重复请求
+        missing_ids = [vid for vid in video_ids if vid not in self._duration_cache]
+        if not missing_ids:
+            return {vid: self._duration_cache[vid] for vid in video_ids}
+        
         api_url = "https://www.googleapis.com/youtube/v3/videos"
         params = {
             'part': 'contentDetails',
-            'id': ','.join(video_ids),
+            'id': ','.join(missing_ids),
             'key': self.api_key
         }
         
-        proxies = None
-        if self.proxy:
-            proxies = {
-                'http': self.proxy,
-                'https': self.proxy
-            }
-        
         try:
-            response = requests.get(api_url, params=params, proxies=proxies, timeout=10)
+            response = http_client.get(api_url, params=params, proxy=self.proxy, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -362,8 +425,9 @@ class PurePytubefixDownloader(Downloader):
                 # 将 ISO 8601 格式的时长转换为秒数
                 duration = self._parse_duration(duration_str)
                 durations[video_id] = duration
+            self._duration_cache.update(durations)
             
-            return durations
+            return {vid: self._duration_cache.get(vid, 0) for vid in video_ids}
         except Exception as e:
             print(f"获取视频时长失败: {e}")
             return {video_id: 0 for video_id in video_ids}
@@ -404,6 +468,7 @@ class PurePytubefixDownloader(Downloader):
         retry_delay = 2  # 秒
         
         for attempt in range(max_retries):
+            self._wait_search_slot()
             try:
                 # 尝试使用不同的配置进行搜索
                 if self.use_potoken:
@@ -441,6 +506,8 @@ class PurePytubefixDownloader(Downloader):
                 
             except Exception as e:
                 error_msg = str(e)
+                if "400" in error_msg or "429" in error_msg:
+                    self._report_throttled()
                 # 对于400错误和其他错误，都进行重试
                 if attempt < max_retries - 1:
                     print(f"搜索失败 (尝试 {attempt + 1}/{max_retries}): {error_msg}")
@@ -545,54 +612,78 @@ class PurePytubefixDownloader(Downloader):
             }
         ]
     
+    def _resolve_streams(self, video_id, high_res=False):
+        """解析YouTube视频的媒体流地址，返回 {"title": 标题, "urls": [视频流(, 音频流)]}"""
+        if self.proxy:
+            proxies = {
+                'http': self.proxy,
+                'https': self.proxy
+            }
+        else:
+            proxies = None
+
+        yt = YouTube(video_id, 
+                     proxies=proxies, 
+                     use_oauth=self.use_oauth, 
+                     use_po_token=self.use_potoken,
+                     po_token_verifier=self.po_token_verifier)
+        if high_res:
+            # 分别下载视频和音频
+            video = yt.streams.filter(adaptive=True, file_extension='mp4').\
+                order_by('resolution').desc().first()
+            audio = yt.streams.filter(only_audio=True).first()
+            return {"title": yt.title, "urls": [video.url, audio.url]}
+        else:
+            stream = yt.streams.filter(progressive=True, file_extension='mp4').\
+                order_by('resolution').desc().first()
+            return {"title": yt.title, "urls": [stream.url]}
+
+    async def _download_streams(self, streams, temp_dir, temp_output):
+        if len(streams["urls"]) == 2:
+            down_video = os.path.join(temp_dir, "video_temp")
+            down_audio = os.path.join(temp_dir, "audio_temp")
+            await asyncio.gather(
+                download_url_resumable(streams["urls"][0], down_video, "youtube 视频流", proxy=self.proxy),
+                download_url_resumable(streams["urls"][1], down_audio, "youtube 音频流", proxy=self.proxy),
+            )
+            print(f"下载完成，正在合并视频和音频")
+            run_ffmpeg(['-i', down_video, '-i', down_audio, '-vcodec', 'copy', '-acodec', 'copy', temp_output])
+        else:
+            await download_url_resumable(streams["urls"][0], temp_output, "youtube 音视频流", proxy=self.proxy)
+
     def download_video(self, video_id, output_name, output_path, high_res=False, p_index=0):
         try:
             if not os.path.exists(output_path):
                 os.makedirs(output_path)
 
-            if self.proxy:
-                proxies = {
-                    'http': self.proxy,
-                    'https': self.proxy
-                }
-            else:
-                proxies = None
-
-            yt = YouTube(video_id, 
-                         proxies=proxies, 
-                         use_oauth=self.use_oauth, 
-                         use_po_token=self.use_potoken,
-                         po_token_verifier=self.po_token_verifier)
-            
-            print(f"正在下载: {yt.title}")
-            if high_res:
-                # 分别下载视频和音频
-                video = yt.streams.filter(adaptive=True, file_extension='mp4').\
-                    order_by('resolution').desc().first()
-                audio = yt.streams.filter(only_audio=True).first()
-                down_video = video.download(output_path, filename="video_temp")
-                down_audio = audio.download(output_path, filename="audio_temp")
-                print(f"下载完成，正在合并视频和音频")
-                output_file = os.path.join(output_path, f"{output_name}.mp4")
-                os.system(f'{FFMPEG_PATH} -y -i {down_video} -i {down_audio} -vcodec copy -acodec copy {output_file} {REDIRECT}')
-                # 删除临时文件
-                os.remove(f"{down_video}")
-                os.remove(f"{down_audio}")
-                print(f"合并完成，存储为: {output_name}.mp4")
-            else:
-                downloaded_file = yt.streams.filter(progressive=True, file_extension='mp4').\
-                    order_by('resolution').desc().first().download(output_path)
-                # 重命名下载到的视频文件
-                new_filename = f"{output_name}.mp4"
-                output_file = os.path.join(output_path, new_filename)
-  
-                # 检查文件是否存在，如果存在则删除
-                if os.path.exists(output_file):
-                    os.remove(output_file)  # 删除已存在的文件
-                
-                os.rename(downloaded_file, output_file)
-                print(f"下载完成，存储为: {new_filename}")
-
+            output_file = os.path.join(output_path, f"{output_name}.mp4")
+            # 每个下载任务使用独立的临时目录，多个任务可以同时下载；下载失败时保留中间文件以便续传
+            temp_dir = get_download_job_dir(output_path, output_name)
+            temp_output = os.path.join(temp_dir, f"{output_name}.mp4")
+            manifest_key = {"source": "youtube", "id": video_id, "high_res": high_res}
+            prepare_job_dir(temp_dir, manifest_key)
+
+            # 续传时优先使用缓存的流地址，仅在地址过期或失效时重新解析
+            streams = load_stream_manifest(temp_dir, manifest_key)
+            for attempt in range(2):
+                if streams is None:
+                    streams = self._resolve_streams(video_id, high_res)
+                    save_stream_manifest(temp_dir, manifest_key, streams)
+                print(f"正在下载: {streams['title']}")
+                try:
+                    asyncio.run(self._download_streams(streams, temp_dir, temp_output))
+                    break
+                except StreamExpiredError:
+                    if attempt == 1:
+                        raise
+                    print("媒体流地址已失效，重新解析后继续下载")
+                    clear_stream_manifest(temp_dir)
+                    streams = None
+
+            # 完成后原子地移动到目标位置，避免留下不完整的视频文件
+            os.replace(temp_output, output_file)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            print(f"下载完成，存储为: {output_name}.mp4")
             return output_file
             
         except Exception as e:
@@ -600,10 +691,16 @@ class PurePytubefixDownloader(Downloader):
             traceback.print_exc()
             return None
 
+    def download_video_segment(self, video_id, output_name, output_path, start, end, high_res=False, p_index=0):
+        streams = self._resolve_streams(video_id, high_res)
+        return self._fetch_segment(streams["urls"], output_name, output_path, start, end)
+
 class BilibiliDownloader(Downloader):
     def __init__(self, proxy=None, no_credential=False, credential_path="cred_datas/bilibili_cred.pkl", search_max_results=3):
         self.proxy = proxy
         self.search_max_results = search_max_results
+        # 以bvid为键缓存视频信息，避免重复请求视频详情接口
+        self._video_info_cache = {}
         
         if no_credential:
             self.credential = None
@@ -641,26 +738,56 @@ class BilibiliDownloader(Downloader):
         return True
     
     def search_video(self, keyword): 
-        # 并发搜索50个视频可能被风控，使用同步方法逐个搜索
-        results = sync(
-            search.search_by_type(keyword=keyword, 
-                                  search_type=search.SearchObjectType.VIDEO,
-                                  order_type=search.OrderVideo.TOTALRANK,
-                                  order_sort=0,  # 由高到低
-                                  page=1,
-                                  page_size=self.search_max_results)
-        )
-        videos = []
+        # 并发搜索50个视频可能被风控，每次搜索请求都需经过限流器
+        self._wait_search_slot()
+        return sync(self._search_video_async(keyword))
+
+    async def _search_video_async(self, keyword):
+        results = await search.search_by_type(keyword=keyword, 
+                                              search_type=search.SearchObjectType.VIDEO,
+                                              order_type=search.OrderVideo.TOTALRANK,
+                                              order_sort=0,  # 由高到低
+                                              page=1,
+                                              page_size=self.search_max_results)
         if 'result' not in results:
             print(f"搜索结果异常，请检查如下输出：")
             print(results)
             return []
-        res_list = results['result']
+        res_list = results['result'][:self.search_max_results]
 
+        # 直接使用搜索结果构造match_info，仅分P数量需要额外请求
+        videos = []
         for each in res_list:
-            vid = each['bvid'] # 只取bvid，然后通过视频接口获取信息，这样可以得到分p信息
-            match_info = self.get_video_info(vid)
-            videos.append(match_info)
+            bvid = each['bvid']
+            if bvid in self._video_info_cache:
+                videos.append(dict(self._video_info_cache[bvid]))
+                continue
+            videos.append({
+                "id": bvid,
+                "aid": each.get("aid", 0),
+                # 搜索接口返回的标题带有<em class="keyword">高亮标记和HTML转义字符
+                "title": remove_html_tags_and_invalid_chars(html.unescape(re.sub(r'<.*?>', '', each.get("title", "")))),
+                "duration": convert_duration_to_seconds(each.get("duration", 0)),
+                "page_count": None,
+                "p_index": 0,
+                "url": BILIBILI_URL_PREFIX + bvid,
+            })
+
+        # 并发补全缺失的分P数量，使用信号量限制同时进行的请求数
+        semaphore = asyncio.Semaphore(BILIBILI_INFO_CONCURRENCY)
+
+        async def fill_page_count(match_info):
+            async with semaphore:
+                try:
+                    v = video.Video(bvid=match_info["id"], credential=self.credential)
+                    pages = await v.get_pages()
+                    match_info["page_count"] = len(pages)
+                    self._video_info_cache[match_info["id"]] = dict(match_info)
+                except Exception as e:
+                    print(f"获取视频分P信息失败: {match_info['id']}, {e}")
+                    match_info["page_count"] = 1
+
+        await asyncio.gather(*[fill_page_count(v) for v in videos if v["page_count"] is None])
         return videos
 
     def download_video(self, video_id, output_name, output_path, high_res=False, p_index=0):
@@ -676,7 +803,15 @@ class BilibiliDownloader(Downloader):
                               p_index=p_index)
         )
 
+    def download_video_segment(self, video_id, output_name, output_path, start, end, high_res=False, p_index=0):
+        streams = asyncio.run(resolve_bilibili_streams(video_id, self.credential, high_res, p_index))
+        if streams["flv"]:
+            raise NotImplementedError("FLV流不支持片段下载")
+        return self._fetch_segment(streams["urls"], output_name, output_path, start, end, headers=HEADERS)
+
     def get_video_info(self, video_id):
+        if video_id in self._video_info_cache:
+            return dict(self._video_info_cache[video_id])
         # 获取视频信息
         v = video.Video(bvid=video_id, credential=self.credential)
         info = sync(v.get_info())
@@ -691,6 +826,7 @@ class BilibiliDownloader(Downloader):
             "p_index": info.get("p_index", 0),
             "url": BILIBILI_URL_PREFIX + info.get("bvid", ""),
         }
+        self._video_info_cache[video_id] = dict(match_info)
         return match_info
 
     def get_video_pages(self, video_id):
@@ -3,6 +3,8 @@
 提供多策略搜索、结果评分和智能匹配功能
 """
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
@@ -363,3 +365,108 @@ class VideoSearchStrategy:
         # 如果没有匹配游戏类型的，返回评分最高的
         return results[0]
 
+
+
+class SearchPlanner:
+    """
+    关键词策略搜索规划器
+
+    1. 先执行优先级最高的关键词，若已得到足够可信的匹配则立即结束
+    2. 否则将剩余关键词变体并行发出（投机执行），每批结果返回后立即评分，
+       一旦出现可信匹配即取消尚未开始的搜索
+    3. 各关键词变体之间按视频ID去重，同一视频只评分一次（保留最高分）
+    """
+
+    # 同时匹配游戏类型、歌曲名和难度时的最低分数（40 + 30 + 20）
+    CONFIDENT_SCORE = 90.0
+
+    def __init__(self, strategy: VideoSearchStrategy, search_func,
+                 min_score: float = 20.0, confident_score: float = CONFIDENT_SCORE,
+                 max_parallel: int = 3):
+        self.strategy = strategy
+        self.search_func = search_func
+        self.min_score = min_score
+        self.confident_score = confident_score
+        self.max_parallel = max(1, max_parallel)
+
+        self._scored: Dict[str, SearchResult] = {}
+        self._raw_results: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.last_error: Optional[Exception] = None
+
+    @staticmethod
+    def _result_key(result: Dict) -> str:
+        return result.get('pure_id') or result.get('id') or result.get('url', '')
+
+    def _is_confident(self, result: Optional[SearchResult]) -> bool:
+        return (result is not None and result.score >= self.confident_score
+                and result.matched_game and result.matched_difficulty)
+
+    def _run_variant(self, keyword: str, search_strategy: SearchStrategy,
+                     target_title: str, target_difficulty: str) -> Optional[SearchResult]:
+        """执行一个关键词变体的搜索，合并结果并返回本批次中的最佳匹配"""
+        print(f"尝试搜索策略 [{search_strategy.value}]: {keyword}")
+        try:
+            videos = self.search_func(keyword) or []
+        except Exception as e:
+            self.last_error = e
+            print(f"搜索策略 [{search_strategy.value}] 出错: {e}，尝试其他策略...")
+            return None
+
+        with self._lock:
+            new_videos = []
+            for v in videos:
+                key = self._result_key(v)
+                if key and key not in self._raw_results:
+                    self._raw_results[key] = v
+                    new_videos.append(v)
+
+        # 只对之前策略中没有出现过的视频进行评分
+        scored = self.strategy.filter_and_rank_results(
+            new_videos, target_title, target_difficulty, search_strategy, min_score=self.min_score
+        )
+        with self._lock:
+            for r in scored:
+                old = self._scored.get(r.video_id)
+                if old is None or r.score > old.score:
+                    self._scored[r.video_id] = r
+        return self.strategy.get_best_match(scored)
+
+    def run(self, title_name: str, difficulty_name: str,
+            chart_type: Optional[int] = None) -> Tuple[Optional[SearchResult], List[SearchResult], List[Dict]]:
+        """
+        执行搜索规划
+
+        Returns:
+            (最佳匹配, 按评分排序的结果列表, 去重后的原始搜索结果列表)
+        """
+        variants = []
+        seen_keywords = set()
+        for keyword, search_strategy in self.strategy.generate_search_keywords(title_name, difficulty_name, chart_type):
+            if keyword not in seen_keywords:
+                seen_keywords.add(keyword)
+                variants.append((keyword, search_strategy))
+
+        if variants:
+            first_keyword, first_strategy = variants[0]
+            best = self._run_variant(first_keyword, first_strategy, title_name, difficulty_name)
+            remaining = variants[1:]
+
+            if not self._is_confident(best) and remaining:
+                print(f"首个搜索策略未找到可信匹配，并行尝试剩余 {len(remaining)} 个策略...")
+                pool = ThreadPoolExecutor(max_workers=min(self.max_parallel, len(remaining)),
+                                          thread_name_prefix="search_variant")
+                try:
+                    futures = [pool.submit(self._run_variant, kw, st, title_name, difficulty_name)
+                               for kw, st in remaining]
+                    for future in as_completed(futures):
+                        if self._is_confident(future.result()):
+                            break
+                finally:
+                    # 取消尚未开始的搜索，已在进行中的请求结果将被忽略
+                    pool.shutdown(wait=False, cancel_futures=True)
+
+        with self._lock:
+            ranked = sorted(self._scored.values(), key=lambda x: x.score, reverse=True)
+            raw_results = list(self._raw_results.values())
+        return self.strategy.get_best_match(ranked), ranked, raw_results
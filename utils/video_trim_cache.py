@@ -0,0 +1,204 @@
+"""
+谱面视频预裁剪缓存
+
+edit_game_video_clip原先直接打开完整的谱面视频再subclipped，截取时间靠后时，moviepy读取视频和音频都要先
+从文件开头或较早的位置解码。这里在打开视频前，先用ffmpeg的输入端seek把[start - margin, end + margin]
+裁剪为较短的中间文件：
+- 优先使用关键帧索引（ffprobe只读取数据包，不解码），从截取区间之前最近的关键帧开始直接复制音视频流，不重新编码
+- 无法获取关键帧时，从区间开始处重新编码（ultrafast）
+- 截取时间靠前（不足TRIM_MIN_SKIP秒）时没有必要裁剪，直接使用原视频
+
+缓存文件名包含原文件的路径、大小、修改时间和裁剪区间的哈希，修改截取时间或替换视频后自动重新生成。
+同一原视频的其他裁剪文件超过TRIM_CACHE_MAX_AGE未被使用时自动删除；共享视频库中的视频被删除时一并删除其裁剪文件。
+"""
+import hashlib
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from utils.profiling import timed
+from utils.video_writer import get_ffmpeg_binary
+
+TRIM_CACHE_DIR = "./videos/trim_cache"
+KEYFRAME_CACHE_FILE = ".keyframe_cache.json"
+# 截取区间前后额外保留的时长（秒）
+TRIM_MARGIN = 2.0
+# 裁剪起点早于该时间时直接使用原视频
+TRIM_MIN_SKIP = 10.0
+# 同一原视频的其他裁剪文件超过该时长（秒）未被使用时删除，避免每次修改截取时间都留下一个文件
+TRIM_CACHE_MAX_AGE = 3600
+
+_cache_lock = threading.Lock()
+
+
+def list_keyframes(video_path: str, max_packets: int = None) -> List[float]:
+    """使用ffprobe读取视频流的数据包，返回关键帧的时间（秒）；max_packets为只读取开头的数据包数量"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+    ]
+    if max_packets:
+        cmd.extend(['-read_intervals', f"%+#{max_packets}"])
+    cmd.append(video_path)
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def _get_video_index(video_path: str) -> Tuple[float, List[float]]:
+    """获取视频时长和关键帧，结果按文件大小和修改时间缓存"""
+    from utils.encoding_translation import ProbeCache, probe_video
+    file_path = Path(video_path)
+    os.makedirs(TRIM_CACHE_DIR, exist_ok=True)
+    cache = ProbeCache(Path(TRIM_CACHE_DIR) / KEYFRAME_CACHE_FILE)
+    info = cache.get(file_path)
+    if info is None:
+        info = {"duration": probe_video(video_path).get("duration", 0.0), "keyframes": list_keyframes(video_path)}
+        # 探测失败（时长为0）时不缓存，下次重新探测
+        if info["duration"]:
+            cache.put(file_path, info)
+            cache.save()
+    return info["duration"], info["keyframes"]
+
+
+def get_trimmed_offset(trimmed_path: str, cut_start: float) -> float:
+    """
+    裁剪文件的0时刻在原视频中的时间
+
+    直接复制含B帧的视频时，裁剪文件中起始关键帧的时间戳不为0（如0.084秒），
+    读取时该关键帧之前会多出若干帧，需要从裁剪起点中减去
+    """
+    keyframes = list_keyframes(trimmed_path, max_packets=16)
+    return cut_start - (keyframes[0] if keyframes else 0.0)
+
+
+def plan_trim_window(start: float, end: float, duration: float, keyframes: List[float],
+                     margin: float = TRIM_MARGIN) -> Optional[Tuple[float, float, bool]]:
+    """
+    计算裁剪区间
+
+    Returns:
+        (cut_start, cut_end, stream_copy)；截取时间无效或靠前、不需要裁剪时返回None
+    """
+    if not duration or not (0 <= start < end <= duration):
+        return None
+    window_start = start - margin
+    if window_start < TRIM_MIN_SKIP:
+        return None
+    # 结束时间取整，小幅修改截取时间时可以复用缓存
+    cut_end = min(math.ceil(end + margin), duration)
+    earlier_keyframes = [t for t in keyframes if t <= window_start]
+    if earlier_keyframes:
+        cut_start = earlier_keyframes[-1]
+        if cut_start < TRIM_MIN_SKIP:
+            return None
+        return cut_start, cut_end, True
+    return window_start, cut_end, False
+
+
+def _cache_file_path(video_path: str, cut_start: float, cut_end: float) -> str:
+    stat = os.stat(video_path)
+    key = f"{os.path.abspath(video_path)}|{stat.st_size}|{stat.st_mtime_ns}|{cut_start:.6f}|{cut_end:.6f}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(TRIM_CACHE_DIR, f"{name}_{int(cut_start)}s_{digest}.mp4")
+
+
+def remove_trimmed_videos(video_path: str, keep: Optional[str] = None, max_age: Optional[float] = None) -> List[str]:
+    """
+    删除原视频的裁剪文件
+
+    Args:
+        keep: 保留的裁剪文件
+        max_age: 只删除超过该时长（秒）未被使用的文件，为None时全部删除
+    Returns:
+        已删除的文件路径
+    """
+    if not os.path.isdir(TRIM_CACHE_DIR):
+        return []
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    pattern = re.compile(rf"{re.escape(name)}_\d+s_[0-9a-f]{{12}}\.mp4")
+    deleted = []
+    for file_name in os.listdir(TRIM_CACHE_DIR):
+        file_path = os.path.join(TRIM_CACHE_DIR, file_name)
+        if not pattern.fullmatch(file_name) or (keep and os.path.abspath(file_path) == os.path.abspath(keep)):
+            continue
+        try:
+            if max_age is not None and time.time() - os.path.getmtime(file_path) < max_age:
+                continue
+            os.remove(file_path)
+            deleted.append(file_path)
+        except OSError:
+            # 文件正被其他任务使用（Windows）或已被删除
+            continue
+    return deleted
+
+
+@timed()
+def trim_video(video_path: str, output_path: str, cut_start: float, cut_end: float, stream_copy: bool):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    if stream_copy:
+        # cut_start为关键帧时间，稍微向后偏移，避免浮点误差导致seek到前一个关键帧
+        seek_args = ['-ss', f"{cut_start + 0.001:.6f}"]
+        codec_args = ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+    else:
+        seek_args = ['-ss', f"{cut_start:.6f}"]
+        codec_args = ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '16', '-c:a', 'aac', '-b:a', '192k']
+    cmd = [
+        get_ffmpeg_binary(), '-y', '-loglevel', 'error',
+        *seek_args, '-i', video_path,
+        '-t', f"{cut_end - cut_start:.6f}",
+        '-map', '0:v:0', '-map', '0:a:0?',
+        *codec_args,
+        temp_path
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def get_trimmed_video(video_path: str, start: float, end: float, margin: float = TRIM_MARGIN) -> Tuple[str, float]:
+    """
+    获取覆盖[start, end]的预裁剪视频
+
+    Returns:
+        (视频路径, 该文件0时刻在原视频中的时间)；不需要裁剪或裁剪失败时返回(原视频路径, 0.0)
+    """
+    try:
+        duration, keyframes = _get_video_index(video_path)
+        window = plan_trim_window(float(start), float(end), duration, keyframes, margin)
+        if window is None:
+            return video_path, 0.0
+        cut_start, cut_end, stream_copy = window
+        cache_path = _cache_file_path(video_path, cut_start, cut_end)
+        if not os.path.exists(cache_path):
+            with _cache_lock:
+                if not os.path.exists(cache_path):
+                    print(f"正在预裁剪谱面视频: {video_path} [{cut_start:.2f}s, {cut_end:.2f}s] -> {cache_path}")
+                    trim_video(video_path, cache_path, cut_start, cut_end, stream_copy)
+        else:
+            # 更新修改时间，标记为最近使用过
+            os.utime(cache_path)
+        remove_trimmed_videos(video_path, keep=cache_path, max_age=TRIM_CACHE_MAX_AGE)
+        return cache_path, get_trimmed_offset(cache_path, cut_start)
+    except (OSError, TypeError, ValueError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode(errors='replace')
+        print(f"Warning: 预裁剪谱面视频失败，将直接使用原视频: {e} {stderr or ''}")
+        return video_path, 0.0
@@ -0,0 +1,140 @@
+"""
+将合成好的视频片段直接写入ffmpeg的标准输入进行编码
+
+moviepy的write_videofile在写入每一帧时会进行类型转换、拼接透明通道等操作，每帧都会分配新的数组。
+这里的写入方式：
+- 预先分配若干个输出帧缓冲区，合成出的帧原地转换为uint8后复制到空闲缓冲区
+- 由单独的线程将缓冲区写入ffmpeg的标准输入，通过有界队列与合成线程交接，
+  合成下一帧（Python/numpy）与写入管道、ffmpeg编码（子进程）可以在不同的CPU核心上同时进行
+- 编码参数与moviepy保持一致（libx264 + yuv420p，音频为mp3），与已有片段拼接时无需重新编码
+"""
+import os
+import queue
+import subprocess
+import threading
+
+import numpy as np
+
+from utils.profiling import span, timed
+
+# 预分配的帧缓冲区数量（即合成线程最多领先写入线程的帧数）
+DEFAULT_FRAME_QUEUE_SIZE = 4
+AUDIO_FPS = 44100
+
+
+def get_ffmpeg_binary() -> str:
+    try:
+        from moviepy.config import FFMPEG_BINARY
+        return FFMPEG_BINARY
+    except ImportError:
+        return "ffmpeg"
+
+
+class _FrameWriterThread(threading.Thread):
+    """从队列中取出已填充的帧缓冲区写入管道，写完后归还到空闲队列"""
+    def __init__(self, pipe, filled_frames: queue.Queue, free_frames: queue.Queue):
+        super().__init__(daemon=True)
+        self.pipe = pipe
+        self.filled_frames = filled_frames
+        self.free_frames = free_frames
+        self.error = None
+
+    def run(self):
+        while True:
+            frame = self.filled_frames.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.pipe.write(frame.data)
+                except (BrokenPipeError, OSError) as e:
+                    # ffmpeg已退出，继续归还缓冲区以免合成线程阻塞
+                    self.error = e
+            self.free_frames.put(frame)
+
+
+def _build_ffmpeg_command(output_path, size, fps, bitrate, preset, threads, audio_path=None, keyframe_times=None):
+    cmd = [
+        get_ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo",
+        "-s", f"{size[0]}x{size[1]}", "-pix_fmt", "rgb24", "-r", f"{fps:.02f}",
+        "-an", "-i", "-",
+    ]
+    if audio_path:
+        cmd.extend(["-i", audio_path, "-acodec", "copy"])
+    cmd.extend(["-vcodec", "libx264", "-preset", preset, "-pix_fmt", "yuv420p"])
+    if bitrate:
+        cmd.extend(["-b:v", bitrate])
+    if threads:
+        cmd.extend(["-threads", str(threads)])
+    if keyframe_times:
+        # 提前半帧，避免浮点误差导致关键帧落在下一帧
+        cmd.extend(["-force_key_frames", ",".join(f"{max(t - 0.5 / fps, 0):.6f}" for t in keyframe_times)])
+    cmd.append(output_path)
+    return cmd
+
+
+@timed()
+def write_video_clip(clip, output_path: str, fps: int = 30, bitrate: str = None, preset: str = "medium",
+                     threads: int = None, queue_size: int = DEFAULT_FRAME_QUEUE_SIZE, keyframe_times=None):
+    """
+    将moviepy片段编码为视频文件，替代clip.write_videofile
+
+    Args:
+        clip: moviepy的VideoClip（如create_video_segment的结果），透明通道会被忽略
+        bitrate: 视频比特率，如"4000k"
+        queue_size: 预分配的帧缓冲区数量
+        keyframe_times: 强制插入关键帧的时间点（秒），之后可以在这些位置直接复制视频流进行裁剪
+    """
+    width, height = clip.size
+    num_frames = int(clip.duration * fps)
+
+    audio_path = None
+    if clip.audio is not None:
+        # 与moviepy相同，先导出音频，编码视频时直接复制音频流
+        name, _ = os.path.splitext(output_path)
+        audio_path = f"{name}TEMP_audio.mp3"
+        with span("video_writer.write_audio"):
+            clip.audio.write_audiofile(audio_path, fps=AUDIO_FPS, codec="libmp3lame", logger=None)
+
+    cmd = _build_ffmpeg_command(output_path, (width, height), fps, bitrate, preset, threads, audio_path,
+                                keyframe_times)
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    free_frames = queue.Queue()
+    for _ in range(max(queue_size, 1)):
+        free_frames.put(np.empty((height, width, 3), dtype=np.uint8))
+    filled_frames = queue.Queue()
+    writer = _FrameWriterThread(process.stdin, filled_frames, free_frames)
+    writer.start()
+
+    completed = False
+    try:
+        for index in range(num_frames):
+            frame = clip.get_frame(index / fps)
+            buffer = free_frames.get()
+            if writer.error is not None:
+                break
+            # 原地转换类型并去掉透明通道，不分配新数组
+            np.copyto(buffer, frame[:, :, :3], casting="unsafe")
+            filled_frames.put(buffer)
+        completed = True
+    finally:
+        filled_frames.put(None)
+        writer.join()
+        try:
+            process.stdin.close()
+        except OSError:  # ffmpeg已退出
+            pass
+        stderr = process.stderr.read().decode("utf-8", errors="replace")
+        process.wait()
+        if audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+        failed = not completed or process.returncode != 0 or writer.error is not None
+        if failed and os.path.exists(output_path):
+            # 不保留不完整的文件，避免之后被当作已渲染的片段跳过
+            os.remove(output_path)
+
+    if failed:
+        raise IOError(f"ffmpeg编码视频{output_path}失败（退出码{process.returncode}）: {stderr.strip()}")
+    return output_path